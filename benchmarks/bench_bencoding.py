@@ -0,0 +1,57 @@
+"""Bencode çözücü/kodlayıcı için mikro benchmark.
+
+Kullanım: python benchmarks/bench_bencoding.py [dosya_sayisi]
+"""
+import hashlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bencoding import BDecoder, BEncoder, BStreamDecoder
+
+def make_torrent(num_files: int) -> bytes:
+    # Çok dosyalı büyük bir .torrent dosyasına benzer sentetik veri
+    piece_length = 2**18
+    total_length = num_files * 3 * 2**20
+    info = {
+        b'name': b'benchmark',
+        b'piece length': piece_length,
+        b'pieces': os.urandom(20 * (total_length // piece_length)),
+        b'files': [{b'length': 3 * 2**20, b'path': [b'dir%d' % (i // 100), b'file%d.bin' % i]} for i in range(num_files)],
+    }
+    return BEncoder({b'announce': b'http://tracker.example/announce', b'info': info}).encode()
+
+def bench(label: str, func, number: int):
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"{label:<28} {seconds * 1000:8.2f} ms")
+    return seconds
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_torrent(num_files)
+    print(f".torrent boyutu: {len(data) / 2**20:.2f} MiB, {num_files} dosya")
+
+    decoded = BDecoder(data).decode()
+    decode_seconds = bench("decode", lambda: BDecoder(data).decode(), 5)
+    print(f"{'decode hızı':<28} {len(data) / decode_seconds / 2**20:8.2f} MiB/s")
+    bench("encode", lambda: BEncoder(decoded).encode(), 5)
+
+    def info_hash_raw():
+        decoder = BDecoder(data)
+        decoder.decode()
+        return hashlib.sha1(decoder.raw_info).digest()
+    def info_hash_reencode():
+        return hashlib.sha1(BEncoder(BDecoder(data).decode()[b'info']).encode()).digest()
+    bench("info_hash (ham aralık)", info_hash_raw, 5)
+    bench("info_hash (yeniden kodlama)", info_hash_reencode, 5)
+
+    def stream_decode():
+        decoder = BStreamDecoder()
+        for i in range(0, len(data), 64 * 2**10):
+            decoder.feed(data[i:i + 64 * 2**10])
+    bench("stream decode (64 KiB)", stream_decode, 1)
+
+if __name__ == "__main__":
+    main()
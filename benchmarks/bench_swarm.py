@@ -0,0 +1,266 @@
+"""Yerel (loopback) sürü benchmark'ı: sentetik seeder'lar ve tracker ile TorrentClient'ı uçtan uca çalıştırır.
+
+Seeder'lar ve tracker ayrı bir süreçte, tek bir asyncio döngüsünde çalışır; böylece ölçülen CPU süresi ve
+bellek yalnızca istemciye aittir.
+
+Kullanım örnekleri:
+  python benchmarks/bench_swarm.py --size 1024 --piece-length 256 --seeders 8
+  python benchmarks/bench_swarm.py --size 512 --latency 40 --bandwidth 20 --loss 0.01 --tracker udp
+  python benchmarks/bench_swarm.py --size 1024 --seeders 8 --workers 4
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bencoding import BEncoder
+from client import TorrentClient
+from metrics import REGISTRY
+
+LOSS_PENALTY = 0.2 # "Kaybolan" bir bloğun gecikmesi (TCP yeniden iletim süresine benzer, saniye)
+BLOCK_SIZE = 2**14
+
+_HANDSHAKE = struct.Struct('>B19s8x20s20s')
+_LENGTH = struct.Struct('>I')
+_ID_ONLY = struct.Struct('>IB')
+_REQUEST_BODY = struct.Struct('>III')
+_PIECE_HEADER = struct.Struct('>IBII')
+_STAMP = struct.Struct('>Q')
+_REQUEST_ID = 6
+
+class SyntheticTorrent:
+    """Diske yazılmadan üretilen sentetik içerik: her parça, parça indeksiyle damgalanmış ortak bir rastgele tampondur."""
+
+    def __init__(self, total_length: int, piece_length: int, seed: int = 1):
+        self.total_length = total_length
+        self.piece_length = piece_length
+        self.num_pieces = (total_length + piece_length - 1) // piece_length
+        self._base = random.Random(seed).randbytes(piece_length)
+
+    def piece_size(self, index: int) -> int:
+        return min(self.piece_length, self.total_length - index * self.piece_length)
+
+    def block(self, index: int, offset: int, length: int) -> bytes:
+        if offset >= _STAMP.size:
+            return self._base[offset:offset + length]
+        data = _STAMP.pack(index) + self._base[_STAMP.size:offset + length]
+        return data[offset:]
+
+    def metainfo(self, announce: str) -> dict:
+        pieces = b''.join(
+            hashlib.sha1(self.block(index, 0, self.piece_size(index))).digest() for index in range(self.num_pieces)
+        )
+        info = {b'name': b'bench_swarm.bin', b'piece length': self.piece_length, b'pieces': pieces, b'length': self.total_length}
+        return {b'announce': announce.encode(), b'info': info}
+
+    def bitfield(self) -> bytes:
+        bitfield = bytearray((self.num_pieces + 7) // 8)
+        for index in range(self.num_pieces):
+            bitfield[index >> 3] |= 0x80 >> (index & 7)
+        return bytes(bitfield)
+
+# --- Seeder ve tracker süreci ---
+
+async def _send_blocks(writer, queue, torrent: SyntheticTorrent, bandwidth: float):
+    loop = asyncio.get_running_loop()
+    next_free = loop.time()
+    while True:
+        due, index, offset, length = await queue.get()
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        writer.write(_PIECE_HEADER.pack(9 + length, 7, index, offset))
+        writer.write(torrent.block(index, offset, length))
+        if bandwidth:
+            # Bant genişliği sınırı: her blok gönderildikten sonra hattın boşalacağı ana kadar bekle
+            now = loop.time()
+            next_free = max(next_free, now) + length / bandwidth
+            if next_free > now:
+                await asyncio.sleep(next_free - now)
+        await writer.drain()
+
+async def _serve_peer(reader, writer, torrent: SyntheticTorrent, args, rng: random.Random):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sender = None
+    try:
+        handshake = await reader.readexactly(_HANDSHAKE.size)
+        writer.write(_HANDSHAKE.pack(19, b'BitTorrent protocol', handshake[28:48], os.urandom(20)))
+        bitfield = torrent.bitfield()
+        writer.write(_ID_ONLY.pack(1 + len(bitfield), 5) + bitfield)
+        writer.write(_ID_ONLY.pack(1, 1)) # Unchoke
+        sender = asyncio.create_task(_send_blocks(writer, queue, torrent, args.bandwidth * 2**20 / args.seeders))
+        while True:
+            length = _LENGTH.unpack(await reader.readexactly(4))[0]
+            if length == 0:
+                continue
+            body = await reader.readexactly(length)
+            if body[0] != _REQUEST_ID:
+                continue
+            index, offset, block_length = _REQUEST_BODY.unpack_from(body, 1)
+            due = loop.time() + args.latency / 1000
+            if args.loss and rng.random() < args.loss:
+                due += LOSS_PENALTY
+            queue.put_nowait((due, index, offset, block_length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        writer.close()
+
+class _UDPTracker(asyncio.DatagramProtocol):
+    def __init__(self, compact_peers: bytes):
+        self.compact_peers = compact_peers
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 16:
+            return
+        _, action, transaction_id = struct.unpack_from('>QII', data)
+        if action == 0:
+            self.transport.sendto(struct.pack('>IIQ', 0, transaction_id, random.getrandbits(63)), addr)
+        elif action == 1:
+            self.transport.sendto(struct.pack('>IIIII', 1, transaction_id, 1800, 0, 1) + self.compact_peers, addr)
+
+async def _run_swarm(args, connection):
+    from aiohttp import web
+    torrent = SyntheticTorrent(args.size * 2**20, args.piece_length * 2**10, args.seed)
+    rng = random.Random(args.seed)
+    servers = []
+    for _ in range(args.seeders):
+        servers.append(await asyncio.start_server(
+            lambda reader, writer: _serve_peer(reader, writer, torrent, args, rng), '127.0.0.1', 0))
+    compact_peers = b''.join(
+        socket.inet_aton('127.0.0.1') + struct.pack('>H', server.sockets[0].getsockname()[1]) for server in servers
+    )
+
+    if args.tracker == 'udp':
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _UDPTracker(compact_peers), local_addr=('127.0.0.1', 0))
+        announce = f"udp://127.0.0.1:{transport.get_extra_info('sockname')[1]}"
+    else:
+        async def handle_announce(request):
+            return web.Response(body=BEncoder({b'interval': 1800, b'peers': compact_peers}).encode())
+        app = web.Application()
+        app.router.add_get('/announce', handle_announce)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        announce = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/announce"
+
+    connection.send(announce)
+    await asyncio.Event().wait() # Ana süreç sonlandırana kadar çalış
+
+def _swarm_process(args, connection):
+    asyncio.run(_run_swarm(args, connection))
+
+# --- İstemci tarafı ---
+
+def _usage():
+    # Worker süreçleri istemci kapanırken beklenir, CPU süreleri RUSAGE_CHILDREN'a o zaman eklenir;
+    # sürü süreci ise ölçüm bittikten sonra sonlandırıldığı için sayılmaz
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+async def _download(torrent_data, workers: int) -> dict:
+    stats = {'first_piece': None, 'complete': None}
+    info_hash = hashlib.sha1(BEncoder(torrent_data[b'info']).encode()).digest()
+    client = TorrentClient(torrent_data, info_hash=info_hash, workers=workers)
+    piece_manager = client.piece_manager
+    broadcast_have = piece_manager.on_have
+
+    def on_have(index):
+        now = time.perf_counter()
+        if stats['first_piece'] is None:
+            stats['first_piece'] = now
+        if piece_manager.is_complete() and stats['complete'] is None:
+            stats['complete'] = now
+        broadcast_have(index)
+    piece_manager.on_have = on_have
+
+    stats['start'] = time.perf_counter()
+    cpu_start = _usage()
+    await client.start()
+    stats['cpu'] = _usage() - cpu_start
+    stats['end'] = time.perf_counter()
+    return stats
+
+def _mean_ms(histogram_name: str) -> str:
+    histogram = REGISTRY.snapshot()[histogram_name]
+    if not histogram['count']:
+        return '       -'
+    return f"{histogram['sum'] / histogram['count'] * 1000:8.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Yerel sentetik sürüde uçtan uca indirme benchmark'ı")
+    parser.add_argument('--size', type=int, default=256, help="Torrent boyutu (MiB)")
+    parser.add_argument('--piece-length', type=int, default=256, help="Parça boyutu (KiB)")
+    parser.add_argument('--seeders', type=int, default=4, help="Seeder sayısı")
+    parser.add_argument('--latency', type=float, default=0, help="Her blok isteğine eklenen gecikme (ms)")
+    parser.add_argument('--bandwidth', type=float, default=0, help="Tüm seeder'ların toplam bant genişliği (MiB/s, 0 = sınırsız)")
+    parser.add_argument('--loss', type=float, default=0, help=f"Bir bloğun {LOSS_PENALTY * 1000:.0f} ms gecikme olasılığı (paket kaybı)")
+    parser.add_argument('--tracker', choices=['http', 'udp'], default='http')
+    parser.add_argument('--workers', type=int, default=0, help="Peer bağlantılarını çalıştıran worker süreci sayısı (0 = tek süreç)")
+    parser.add_argument('--seed', type=int, default=1, help="Sentetik içerik için rastgele tohum")
+    parser.add_argument('--verbose', action='store_true', help="İstemci loglarını göster")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    torrent = SyntheticTorrent(args.size * 2**20, args.piece_length * 2**10, args.seed)
+    parent_connection, child_connection = multiprocessing.Pipe()
+    swarm = multiprocessing.Process(target=_swarm_process, args=(args, child_connection), daemon=True)
+    swarm.start()
+    announce = parent_connection.recv()
+
+    print(f"Sentetik torrent hazırlanıyor: {args.size} MiB, {args.piece_length} KiB parça, {torrent.num_pieces} parça")
+    torrent_data = torrent.metainfo(announce)
+    work_dir = tempfile.mkdtemp(prefix='bench_swarm_')
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        stats = asyncio.run(_download(torrent_data, args.workers))
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        swarm.terminate()
+        swarm.join()
+
+    size_mb = args.size * 2**20 / 1e6
+    download_seconds = (stats['complete'] or stats['end']) - stats['start']
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10 # Linux'ta KiB cinsinden
+    print(f"{'seeder / tracker':<28} {args.seeders} / {args.tracker}")
+    print(f"{'gecikme / bant / kayıp':<28} {args.latency:.0f} ms / {args.bandwidth or '∞'} MiB/s / {args.loss:.2%}")
+    print(f"{'indirme süresi':<28} {download_seconds:8.2f} s")
+    print(f"{'hız':<28} {size_mb / download_seconds:8.2f} MB/s")
+    print(f"{'CPU':<28} {stats['cpu'] / (size_mb / 1000):8.2f} CPU-s/GB")
+    print(f"{'en yüksek RSS':<28} {peak_rss:8.1f} MiB")
+    if stats['first_piece'] is not None:
+        print(f"{'ilk parçaya kadar':<28} {(stats['first_piece'] - stats['start']) * 1000:8.1f} ms")
+    # Darboğazın ağ, CPU (hash) ya da disk olduğunu ayırt etmek için ortalama gecikmeler
+    print(f"{'ort. istek RTT':<28} {_mean_ms('torrent_peer_request_rtt_seconds')}")
+    print(f"{'ort. hash kuyruğu / hash':<28} {_mean_ms('torrent_hash_queue_seconds')} / {_mean_ms('torrent_hash_seconds').strip()}")
+    print(f"{'ort. disk kuyruğu':<28} {_mean_ms('torrent_disk_queue_seconds')}")
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,198 @@
 import collections
 
+_INT = ord('i')
+_LIST = ord('l')
+_DICT = ord('d')
+_END = ord('e')
+_DIGITS = frozenset(b'0123456789')
+
+class _Incomplete(EOFError):
+    pass
+
 class BDecoder:
+    """Bencode çözücü. Veriyi dilimlemek yerine offset'lerle dolaşır ve üst seviye
+    'info' sözlüğünün ham bayt aralığını kaydeder (info_hash bu ham baytlardan hesaplanmalı)."""
+
     def __init__(self, data: bytes):
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
         if not isinstance(data, bytes):
             raise TypeError("Girdi byte formatında olmalı")
         self._data = data
         self._index = 0
+        self.info_span = None # Üst seviye b'info' değerinin (başlangıç, bitiş) offset'leri
 
-    def decode(self):
-        char = self._peek()
-        if char is None:
-            raise EOFError("Veri beklenmedik şekilde sonlandı")
-        if char == b'i':
-            self._index += 1
-            return self._decode_int()
-        elif char == b'l':
-            self._index += 1
-            return self._decode_list()
-        elif char == b'd':
-            self._index += 1
-            return self._decode_dict()
-        elif char.isdigit():
-            return self._decode_string()
-        else:
-            raise TypeError(f"Geçersiz tip belirteci: {char} at index {self._index}")
-
-    def _peek(self):
-        if self._index + 1 > len(self._data):
+    @property
+    def raw_info(self):
+        """Dosyadaki orijinal 'info' baytları (kopyasız memoryview) ya da None."""
+        if self.info_span is None:
             return None
-        return self._data[self._index:self._index+1]
-
-    def _read(self, length: int) -> bytes:
-        if self._index + length > len(self._data):
-            raise IndexError("Okuma sırasında veri sonuna ulaşıldı")
-        res = self._data[self._index:self._index+length]
-        self._index += length
-        return res
+        start, end = self.info_span
+        return memoryview(self._data)[start:end]
 
-    def _read_until(self, char: bytes) -> bytes:
+    def decode(self):
+        if self._index >= len(self._data):
+            raise EOFError("Veri beklenmedik şekilde sonlandı")
         try:
-            occurrence = self._data.index(char, self._index)
-            res = self._data[self._index:occurrence]
-            self._index = occurrence + 1
-            return res
-        except ValueError:
-            raise TypeError(f"'{char}' karakteri bulunamadı")
-
-    def _decode_int(self):
-        return int(self._read_until(b'e'))
-
-    def _decode_list(self):
-        res = []
-        while self._peek() != b'e':
-            res.append(self.decode())
-        self._index += 1
-        return res
-
-    def _decode_dict(self):
-        res = collections.OrderedDict()
-        while self._peek() != b'e':
-            key = self._decode_string()
-            value = self.decode()
-            res[key] = value
-        self._index += 1
-        return res
-
-    def _decode_string(self):
-        length = int(self._read_until(b':'))
-        return self._read(length)
+            value, self._index = self._decode_at(self._index, True)
+        except IndexError:
+            raise EOFError("Veri beklenmedik şekilde sonlandı") from None
+        return value
+
+    def _read_string(self, index: int):
+        data = self._data
+        colon = data.find(b':', index)
+        if colon == -1:
+            raise _Incomplete("':' karakteri bulunamadı")
+        end = colon + 1 + int(data[index:colon])
+        if end > len(data):
+            raise _Incomplete("Okuma sırasında veri sonuna ulaşıldı")
+        return data[colon + 1:end], end
+
+    def _read_int(self, index: int):
+        data = self._data
+        end = data.find(b'e', index)
+        if end == -1:
+            raise _Incomplete("'e' karakteri bulunamadı")
+        return int(data[index:end]), end + 1
+
+    def _decode_at(self, index: int, top_level: bool = False):
+        data = self._data
+        char = data[index]
+        if char in _DIGITS:
+            return self._read_string(index)
+        if char == _INT:
+            return self._read_int(index + 1)
+        if char == _LIST:
+            index += 1
+            result = []
+            append = result.append
+            while data[index] != _END:
+                # Sık görülen string ve int değerleri fonksiyon çağrısı olmadan çöz
+                char = data[index]
+                if char in _DIGITS:
+                    value, index = self._read_string(index)
+                elif char == _INT:
+                    value, index = self._read_int(index + 1)
+                else:
+                    value, index = self._decode_at(index)
+                append(value)
+            return result, index + 1
+        if char == _DICT:
+            index += 1
+            result = {}
+            while data[index] != _END:
+                key, index = self._read_string(index)
+                start = index
+                char = data[index]
+                if char in _DIGITS:
+                    value, index = self._read_string(index)
+                elif char == _INT:
+                    value, index = self._read_int(index + 1)
+                else:
+                    value, index = self._decode_at(index)
+                if top_level and key == b'info':
+                    self.info_span = (start, index)
+                result[key] = value
+            return result, index + 1
+        raise TypeError(f"Geçersiz tip belirteci: {bytes([char])} at index {index}")
+
+class BStreamDecoder:
+    """Parça parça gelen veriden tamamlanan üst seviye bencode değerlerini üreten artımlı çözücü.
+
+    Gelen veri önce nesne üretmeden taranır; tarama kaldığı yerden devam ettiği için toplam iş doğrusaldır.
+    Bir değerin sonu bulunduğunda yalnızca o aralık BDecoder ile çözülür.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scan_index = 0 # Taramanın kaldığı offset
+        self._depth = 0 # Açık liste/sözlük sayısı
+
+    def feed(self, chunk: bytes) -> list:
+        self._buffer += chunk
+        values = []
+        while True:
+            end = self._scan()
+            if end is None:
+                break
+            values.append(BDecoder(bytes(self._buffer[:end])).decode())
+            del self._buffer[:end]
+            self._scan_index = 0
+        return values
+
+    def _scan(self):
+        buffer = self._buffer
+        index = self._scan_index
+        depth = self._depth
+        length = len(buffer)
+        end = None
+        while index < length:
+            char = buffer[index]
+            if char == _DICT or char == _LIST:
+                depth += 1
+                index += 1
+            elif char == _END:
+                if depth == 0:
+                    raise TypeError(f"Beklenmeyen 'e' at index {index}")
+                depth -= 1
+                index += 1
+            elif char == _INT:
+                close = buffer.find(b'e', index)
+                if close == -1:
+                    break
+                index = close + 1
+            elif char in _DIGITS:
+                colon = buffer.find(b':', index)
+                if colon == -1:
+                    break
+                string_end = colon + 1 + int(buffer[index:colon])
+                if string_end > length:
+                    break
+                index = string_end
+            else:
+                raise TypeError(f"Geçersiz tip belirteci: {bytes([char])} at index {index}")
+            if depth == 0:
+                end = index
+                break
+        self._scan_index = index
+        self._depth = depth
+        return end
 
 class BEncoder:
+    """Doğrusal zamanlı bencode kodlayıcı; sözlük anahtarları kanonik (bayt) sırada yazılır."""
+
     def __init__(self, data):
         self._data = data
 
     def encode(self) -> bytes:
-        return self._encode_next(self._data)
+        parts = []
+        self._encode_next(self._data, parts.append)
+        return b''.join(parts)
 
-    def _encode_next(self, data):
+    def _encode_next(self, data, write):
         if isinstance(data, int):
-            return self._encode_int(data)
-        elif isinstance(data, bytes):
-            return self._encode_bytes(data)
+            write(b'i%de' % data)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            write(b'%d:' % len(data))
+            write(data)
         elif isinstance(data, str):
-            return self._encode_bytes(data.encode('utf-8'))
-        elif isinstance(data, list):
-            return self._encode_list(data)
+            encoded = data.encode('utf-8')
+            write(b'%d:' % len(encoded))
+            write(encoded)
+        elif isinstance(data, (list, tuple)):
+            write(b'l')
+            for item in data:
+                self._encode_next(item, write)
+            write(b'e')
         elif isinstance(data, (dict, collections.OrderedDict)):
-            return self._encode_dict(data)
-        raise TypeError(f"Desteklenmeyen tip: {type(data)}")
-
-    def _encode_int(self, value):
-        return b'i' + str(value).encode('utf-8') + b'e'
-
-    def _encode_bytes(self, value):
-        return str(len(value)).encode('utf-8') + b':' + value
-
-    def _encode_list(self, data):
-        return b'l' + b''.join(self._encode_next(item) for item in data) + b'e'
-
-    def _encode_dict(self, data):
-        encoded_items = b''
-        for key, value in data.items():
-            key_bytes = key if isinstance(key, bytes) else key.encode('utf-8')
-            encoded_items += self._encode_bytes(key_bytes)
-            encoded_items += self._encode_next(value)
-        return b'd' + encoded_items + b'e'
+            write(b'd')
+            items = [(key if isinstance(key, bytes) else key.encode('utf-8'), value) for key, value in data.items()]
+            items.sort(key=lambda item: item[0])
+            for key, value in items:
+                write(b'%d:' % len(key))
+                write(key)
+                self._encode_next(value, write)
+            write(b'e')
+        else:
+            raise TypeError(f"Desteklenmeyen tip: {type(data)}")
@@ -0,0 +1,80 @@
+from multiprocessing import shared_memory
+
+DEFAULT_MAX_BUFFER_MEMORY = 256 * 2**20 # Parça tamponları için ayrılan en fazla bellek (byte)
+
+class BufferPool:
+    """Sabit boyutlu parça tamponlarını bellek sınırı içinde tembel olarak ayıran ve yeniden kullanan havuz."""
+
+    def __init__(self, buffer_size: int, max_memory: int = DEFAULT_MAX_BUFFER_MEMORY):
+        self.buffer_size = buffer_size
+        # En az bir parçalık tampon her zaman ayrılabilmeli
+        self.max_buffers = max(1, max_memory // buffer_size)
+        self.allocated = 0 # Şu ana kadar oluşturulan tampon sayısı
+        self._free = []
+
+    @property
+    def in_use(self) -> int:
+        return self.allocated - len(self._free)
+
+    def can_acquire(self) -> bool:
+        return bool(self._free) or self.allocated < self.max_buffers
+
+    def acquire(self):
+        """Boş bir tampon döndürür; sınır dolmuşsa None döndürür."""
+        if self._free:
+            return self._free.pop()
+        if self.allocated < self.max_buffers:
+            self.allocated += 1
+            return bytearray(self.buffer_size)
+        return None
+
+    def release(self, buffer: bytearray):
+        self._free.append(buffer)
+
+    def close(self):
+        pass
+
+class SharedBufferPool(BufferPool):
+    """Tamponları tek bir paylaşımlı bellek bölgesinin dilimlerinden veren havuz.
+
+    Worker süreçleri bölgeye adıyla bağlanır; bloklar doğrudan parça tamponuna yazılır ve koordinatör
+    sürecinden geçmez. Bölge sınır kadar baştan ayrılır, sayfalar ise ancak yazıldıkça bellek tüketir.
+    """
+
+    def __init__(self, buffer_size: int, max_memory: int = DEFAULT_MAX_BUFFER_MEMORY):
+        super().__init__(buffer_size, max_memory)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=self.max_buffers * buffer_size)
+        self._slots = {} # id(tampon) -> dilim numarası
+        self._views = []
+
+    @property
+    def name(self) -> str:
+        return self.shared_memory.name
+
+    def acquire(self):
+        if self._free:
+            return self._free.pop()
+        if self.allocated < self.max_buffers:
+            slot = self.allocated
+            self.allocated += 1
+            buffer = self.shared_memory.buf[slot * self.buffer_size:(slot + 1) * self.buffer_size]
+            self._slots[id(buffer)] = slot
+            self._views.append(buffer)
+            return buffer
+        return None
+
+    def slot_of(self, buffer) -> int:
+        return self._slots[id(buffer)]
+
+    def close(self):
+        """Bölgeyi siler; tamponları kullanan parçalar önceden serbest bırakılmış olmalıdır."""
+        self._free.clear()
+        self._slots.clear()
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self.shared_memory.unlink()
+        try:
+            self.shared_memory.close()
+        except BufferError:
+            pass # Bir dilim hâlâ kullanılıyor; eşleme süreç çıkarken bırakılır
@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+CHOKE_INTERVAL = 10 # Choke kararlarının yeniden verildiği aralık (saniye)
+UPLOAD_SLOTS = 4 # Karşılıklılığa göre unchoke edilen peer sayısı
+OPTIMISTIC_ROUNDS = 3 # İyimser unchoke'un kaç turda bir başka peer'e geçeceği
+
+class Choker:
+    """Tit-for-tat choke algoritması.
+
+    Her turda ilgilenen peer'lerden, indirirken bize en hızlı veri gönderenler (seed ederken ise
+    en hızlı veri alabilenler) unchoke edilir. Buna ek olarak rastgele seçilen bir peer'e iyimser
+    unchoke verilir; böylece yeni peer'ler de karşılık verme şansı bulur.
+    """
+
+    def __init__(self, peer_manager, piece_manager, upload_slots: int = UPLOAD_SLOTS):
+        self.peer_manager = peer_manager
+        self.piece_manager = piece_manager
+        self.upload_slots = upload_slots
+        self._round = 0
+        self._optimistic = None # İyimser unchoke verilen peer'in adresi
+        self._last_totals = {} # (ip, port) -> önceki turdaki (downloaded, uploaded)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._choke_loop())
+
+    async def _choke_loop(self):
+        while True:
+            await asyncio.sleep(CHOKE_INTERVAL)
+            self.rechoke()
+
+    def rechoke(self):
+        seeding = self.piece_manager.is_complete()
+        peers = [connection for connection in self.peer_manager.connections.values() if connection.established]
+        rates = {}
+        for connection in peers:
+            downloaded, uploaded = self._last_totals.get(connection.address, (0, 0))
+            if seeding:
+                rates[connection.address] = connection.uploaded - uploaded
+            else:
+                rates[connection.address] = connection.downloaded - downloaded
+        self._last_totals = {connection.address: (connection.downloaded, connection.uploaded) for connection in peers}
+
+        interested = [connection for connection in peers if connection.peer_is_interested]
+        interested.sort(key=lambda connection: rates[connection.address], reverse=True)
+        unchoked = {connection.address for connection in interested[:self.upload_slots]}
+
+        candidates = [connection.address for connection in interested if connection.address not in unchoked]
+        if self._round % OPTIMISTIC_ROUNDS == 0 or self._optimistic not in candidates:
+            self._optimistic = random.choice(candidates) if candidates else None
+        if self._optimistic is not None:
+            unchoked.add(self._optimistic)
+        self._round += 1
+
+        for connection in peers:
+            if connection.address in unchoked:
+                connection.unchoke()
+            else:
+                connection.choke()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -1,67 +1,206 @@
 import asyncio
+import logging
+import time
 from piece_manager import PieceManager
-from tracker import Tracker
+from tracker import Tracker, LISTEN_PORT
 from peer import PeerConnection
-import socket
-import struct
+from peer_manager import PeerManager
+from choker import Choker
+from metrics import MetricsServer
+from rate_limiter import TokenBucket
+from workers import WorkerPool
+from stream import TorrentStream, STREAM_WINDOW
+from peer_cache import PeerCache, PEER_CACHE_SUFFIX
+from webseed import WebSeeds, parse_url_list
 
 MAX_PEER_CONNECTIONS = 20 # Aynı anda en fazla kaç peer'e bağlı kalacağımız
+PEER_CACHE_INTERVAL = 60 # Peer ve tracker önbelleğinin diske yazılma aralığı (saniye)
+
+logger = logging.getLogger(__name__)
 
 class TorrentClient:
-    def __init__(self, torrent_data):
-        self.tracker = Tracker(torrent_data)
-        self.piece_manager = PieceManager(torrent_data)
-        self.active_peers = []
-        self.tasks = []
+    def __init__(self, torrent_data, info_hash=None, seed=False, metrics_port=None,
+                 http_session=None, budget=None, listen_port=LISTEN_PORT, upload_limiter=None, download_limiter=None,
+                 workers=0):
+        # http_session ve budget, aynı süreçte çalışan torrent'ler arasında paylaşılır (bkz. session.py)
+        self.tracker = Tracker(torrent_data, info_hash, http_session=http_session, port=listen_port)
+        self.piece_manager = PieceManager(torrent_data, info_hash=self.tracker.info_hash, shared_buffers=workers > 0)
+        name = torrent_data[b'info'][b'name'].decode('utf-8')
+        if workers:
+            # Çok çekirdekli mod: peer bağlantıları worker süreçlerinde, her birinin kendi choker'ı ile çalışır
+            self.peer_manager = WorkerPool(self.piece_manager, workers, torrent_data, self.tracker.info_hash,
+                                           self.tracker.peer_id, target_peers=MAX_PEER_CONNECTIONS)
+            self.choker = None
+        else:
+            # Tracker'lardan gelen adaylara bağlanma, yavaş peer'leri değiştirme ve yeniden deneme işi
+            self.peer_manager = PeerManager(self._make_connection, target_peers=MAX_PEER_CONNECTIONS, budget=budget,
+                                            torrent_name=name)
+            # Karşılıklılık: en çok veri aldığımız peer'lere blok gönder, doğrulanan parçaları herkese duyur
+            self.choker = Choker(self.peer_manager, self.piece_manager)
+        self.tracker.on_peers = self.peer_manager.add_candidates
+        self.piece_manager.on_have = self.peer_manager.broadcast_have
+        self.piece_manager.on_ban = self._ban
+        self.seed = seed # İndirme bitince kapanmak yerine seed etmeye devam et
+        # Veri aldığımız peer'ler ve tracker sağlığı; yeniden başlatmada tracker'lar beklenmeden kullanılır
+        self.peer_cache = PeerCache(name + PEER_CACHE_SUFFIX, self.tracker.info_hash)
+        self._peer_cache_saved = time.monotonic()
+        # Torrent başına hız sınırları (byte/s, 0 = sınırsız); verilirse oturumun genel sınırlarına bağlanır
+        self.upload_limiter = TokenBucket(parent=upload_limiter)
+        self.download_limiter = TokenBucket(parent=download_limiter)
+        self.peer_upload_rate = 0 # Yeni bağlantılara uygulanan peer başına sınırlar
+        self.peer_download_rate = 0
+        # Verilirse metrikler bu yerel portta /metrics ve /metrics.json olarak sunulur
+        self.metrics_server = MetricsServer(metrics_port) if metrics_port is not None else None
+        # url-list'teki HTTP aynaları (BEP 19) swarm'la birlikte, her parçası olan hızlı peer'ler gibi kullanılır
+        web_seed_urls = parse_url_list(torrent_data)
+        self.web_seeds = WebSeeds(web_seed_urls, self.piece_manager, self.download_limiter) if web_seed_urls else None
+        self._streams = set() # Açık okuyucular; indirme bitse de hepsi kapanana kadar istemci kapanmaz
+        self._streams_closed = asyncio.Event()
+        self._streams_closed.set()
 
     async def start(self):
         """İstemciyi başlatır ve indirme tamamlanana kadar çalıştırır."""
         
-        # 1. Peer'leri al
-        peers_raw = await self.tracker.get_peers()
-        if not peers_raw:
-            print("Hiç peer bulunamadı. Program sonlandırılıyor.")
-            return
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        # 0. Dosyaları aç (önceden ayırma disk iş parçacığında yapılır), diskte önceki çalışmadan kalan veriyi
+        # (fast-resume veya yeniden kontrol) ve peer önbelleğini yükle
+        await self.piece_manager.open()
+        await self.piece_manager.check_existing_data()
+        self.peer_cache.load()
+        try:
+            if self.web_seeds is not None and not self.piece_manager.is_complete():
+                # Web seed'ler tracker cevabı beklenmeden hemen indirmeye başlar
+                self.web_seeds.start()
+            if self.seed or not self.piece_manager.is_complete():
+                await self._join_swarm()
+            if not self.piece_manager.is_complete():
+                await self._download()
+            if self.seed:
+                await self._seed()
+            elif self._streams:
+                logger.info("Açık akışların kapanması bekleniyor.")
+                await self._streams_closed.wait()
+        finally:
+            # 4. İndirme bitince (veya iptal edilince) tüm açık bağlantıları kapat, resume kaydını yaz
+            if self.choker is not None:
+                await self.choker.close()
+            await self.peer_manager.close()
+            if self.web_seeds is not None:
+                await self.web_seeds.close()
+            await self.tracker.close()
+            self._save_peer_cache()
+            await self.piece_manager.close()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
 
-        print(f"--- {len(peers_raw)} Adet Peer Alındı. Bağlantılar kuruluyor... ---")
+    async def _join_swarm(self):
+        # 1. Tüm tracker'lara aynı anda duyuru yap; gelen peer'ler bağlantı yöneticisine aday olarak girer
+        self._update_tracker_stats()
+        self.tracker.load_health(self.peer_cache.trackers)
+        self.peer_manager.start()
+        if self.choker is not None:
+            self.choker.start()
+        cached_peers = self.peer_cache.best_peers()
+        if cached_peers:
+            # Önceki çalışmada veri aldığımız peer'lere en hızlıdan başlayarak hemen bağlan; tracker'lar beklenmez
+            logger.info("Önbellekteki %d peer'e bağlanılıyor, tracker'lar arka planda duyuruluyor.", len(cached_peers))
+            self.peer_manager.add_candidates(cached_peers)
+            await self.tracker.get_peers(deadline=0)
+        else:
+            peers = await self.tracker.get_peers()
+            if not peers:
+                logger.warning("Henüz hiç peer bulunamadı. Tracker'lar arka planda yeniden denenecek.")
+            else:
+                logger.info("%d adet peer alındı. Bağlantılar kuruluyor...", len(peers))
+        self.tracker.start_reannouncing()
 
-        # 2. Peer'lere bağlanmak için görevler oluştur
-        for ip_bytes, port_bytes in peers_raw:
-            peer_ip = socket.inet_ntoa(ip_bytes)
-            peer_port = struct.unpack('>H', port_bytes)[0]
-            
-            if not peer_ip or peer_port == 0: continue
-
-            peer_conn = PeerConnection(
-                ip=peer_ip, port=peer_port,
-                info_hash=self.tracker.info_hash,
-                peer_id=self.tracker.peer_id,
-                piece_manager=self.piece_manager
-            )
-            # Her bir bağlantı denemesini bir görev olarak başlatıyoruz
-            self.tasks.append(asyncio.create_task(peer_conn.connect()))
-            
-            # Aynı anda çok fazla deneme yapmamak için bir sınır koyalım
-            if len(self.tasks) >= MAX_PEER_CONNECTIONS:
-                break
-        
+    async def _download(self):
         # 3. İndirme tamamlanana kadar bekle
         while not self.piece_manager.is_complete():
             await asyncio.sleep(5) # Her 5 saniyede bir durumu kontrol et
-            print(f"İndirme Durumu: {self.piece_manager.get_downloaded_percentage():.2f}%")
+            self._update_tracker_stats()
+            logger.info("İndirme durumu: %.2f%%", self.piece_manager.get_downloaded_percentage())
         
-        print("İndirme Tamamlandı! Tüm görevler iptal ediliyor.")
-        
-        # 4. İndirme bitince tüm açık bağlantıları kapat
-        for task in self.tasks:
-            task.cancel()
-        
-        self.piece_manager.close()
+        self.peer_manager.lose_interest()
+        if not self.seed:
+            logger.info("İndirme tamamlandı! Tüm görevler iptal ediliyor.")
+
+    async def _seed(self):
+        logger.info("İndirme tamamlandı, seed ediliyor. Durdurmak için Ctrl+C.")
+        while True:
+            await asyncio.sleep(5)
+            self._update_tracker_stats()
+            logger.info("Gönderilen: %.2f MiB", self.peer_manager.uploaded / 2**20)
 
-# PieceManager'a küçük bir ekleme yapalım:
-def get_downloaded_percentage(self):
-    retrieved_blocks = sum(p._block_states.count(2) for p in self.pieces)
-    total_blocks = sum(len(p.blocks) for p in self.pieces)
-    return (retrieved_blocks / total_blocks) * 100 if total_blocks > 0 else 0
+    def open_stream(self, file_index: int = None, window: int = STREAM_WINDOW) -> TorrentStream:
+        """İndirme sürerken veriyi sırayla okumak için akış açar; file_index verilirse yalnızca o dosya okunur."""
+        offset, length = 0, None
+        if file_index is not None:
+            files = self.piece_manager.storage.files
+            offset = sum(file_length for _, file_length in files[:file_index])
+            length = files[file_index][1]
+        stream = TorrentStream(self.piece_manager, offset, length, window=window, on_close=self._stream_closed)
+        self._streams.add(stream)
+        self._streams_closed.clear()
+        return stream
+
+    def _stream_closed(self, stream: TorrentStream):
+        self._streams.discard(stream)
+        if not self._streams:
+            self._streams_closed.set()
+
+    def set_rate_limits(self, upload_rate=None, download_rate=None, peer_upload_rate=None, peer_download_rate=None):
+        """Hız sınırlarını (byte/s, 0 = sınırsız) çalışırken değiştirir; None verilen sınır olduğu gibi kalır."""
+        if upload_rate is not None:
+            self.upload_limiter.set_rate(upload_rate)
+        if download_rate is not None:
+            self.download_limiter.set_rate(download_rate)
+        if peer_upload_rate is not None:
+            self.peer_upload_rate = peer_upload_rate
+        if peer_download_rate is not None:
+            self.peer_download_rate = peer_download_rate
+        if isinstance(self.peer_manager, WorkerPool):
+            self.peer_manager.set_rate_limits(self.upload_limiter.rate, self.download_limiter.rate,
+                                              self.peer_upload_rate, self.peer_download_rate)
+            return
+        for connection in self.peer_manager.connections.values():
+            connection.upload_limiter.set_rate(self.peer_upload_rate)
+            connection.download_limiter.set_rate(self.peer_download_rate)
+
+    def _update_tracker_stats(self):
+        self.tracker.left = self.piece_manager.total_length - self.piece_manager.verified_bytes
+        self.tracker.downloaded = self.piece_manager.verified_bytes
+        self.tracker.uploaded = self.peer_manager.uploaded
+        if time.monotonic() - self._peer_cache_saved >= PEER_CACHE_INTERVAL:
+            self._save_peer_cache()
+
+    def _save_peer_cache(self):
+        self._peer_cache_saved = time.monotonic()
+        for address, rate in self.peer_manager.delivering_peers().items():
+            self.peer_cache.record_peer(address, rate)
+        for address in self.peer_manager.unreachable_peers():
+            self.peer_cache.forget_peer(address)
+        for url, state in self.tracker.health().items():
+            self.peer_cache.record_tracker(url, state['failures'], state['latency'])
+        try:
+            self.peer_cache.save()
+        except OSError as e:
+            logger.warning("Peer önbelleği yazılamadı: %s", e)
+
+    def _ban(self, peer: tuple):
+        # Bozuk veri gönderen web seed'in kendisi durur; peer yöneticisi yalnızca gerçek peer adreslerini yasaklar
+        if self.web_seeds is not None and peer in self.web_seeds:
+            return
+        self.peer_manager.ban(peer)
 
-PieceManager.get_downloaded_percentage = get_downloaded_percentage
+    def _make_connection(self, peer_ip: str, peer_port: int) -> PeerConnection:
+        return PeerConnection(
+            ip=peer_ip, port=peer_port,
+            info_hash=self.tracker.info_hash,
+            peer_id=self.tracker.peer_id,
+            piece_manager=self.piece_manager,
+            upload_limiter=TokenBucket(self.peer_upload_rate, parent=self.upload_limiter),
+            download_limiter=TokenBucket(self.peer_download_rate, parent=self.download_limiter),
+            listen_port=self.tracker.port
+        )
@@ -1,24 +1,44 @@
 import asyncio
+import hashlib
+import logging
 from bencoding import BDecoder
-from client import TorrentClient
+from session import Session
+from tracker import LISTEN_PORT
 
-#Deneme dosyamın adı oyun.torrent şeklindeydi.İndirilecek dosya adına göre güncelle
+#Deneme dosyamın adı oyun.torrent şeklindeydi.İndirilecek dosya adlarına göre güncelle
 
-TORRENT_FILE = 'oyun.torrent' 
+TORRENT_FILES = ['oyun.torrent'] # Hepsi aynı oturumda, tek bir dinleyen port üzerinden çalışır
+SEED_AFTER_DOWNLOAD = False # İndirme bitince program kapanmak yerine seed etmeye devam etsin mi
+UPLOAD_LIMIT = 0 # Toplam gönderim hızı sınırı (byte/s, 0 = sınırsız)
+DOWNLOAD_LIMIT = 0 # Toplam indirme hızı sınırı (byte/s, 0 = sınırsız)
+WORKER_PROCESSES = 0 # >0 ise her torrent'in peer bağlantıları bu kadar süreçte çalışır (çok çekirdekli makineler için)
+METRICS_PORT = None # Ör. 9100: metrikler http://127.0.0.1:9100/metrics adresinde sunulur
+LOG_LEVEL = logging.INFO # Peer ve blok düzeyinde ayrıntı için logging.DEBUG
 
 async def main():
+    session = Session(listen_port=LISTEN_PORT, metrics_port=METRICS_PORT,
+                      upload_rate=UPLOAD_LIMIT, download_rate=DOWNLOAD_LIMIT)
+    await session.start()
     try:
-        with open(TORRENT_FILE, 'rb') as f:
-            meta_info_bytes = f.read()
-    except FileNotFoundError:
-        print(f"HATA: {TORRENT_FILE} dosyası bulunamadı.")
-        return
+        for torrent_file in TORRENT_FILES:
+            try:
+                with open(torrent_file, 'rb') as f:
+                    meta_info_bytes = f.read()
+            except FileNotFoundError:
+                print(f"HATA: {torrent_file} dosyası bulunamadı.")
+                continue
 
-    torrent_data = BDecoder(meta_info_bytes).decode()
-    client = TorrentClient(torrent_data)
-    await client.start()
+            decoder = BDecoder(meta_info_bytes)
+            torrent_data = decoder.decode()
+            # info_hash, yeniden kodlanmış sözlükten değil dosyadaki orijinal 'info' baytlarından hesaplanır
+            session.add_torrent(torrent_data, info_hash=hashlib.sha1(decoder.raw_info).digest(), seed=SEED_AFTER_DOWNLOAD,
+                                workers=WORKER_PROCESSES)
+        await session.run()
+    finally:
+        await session.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -1,5 +1,15 @@
 import struct
 
+# Sık kullanılan mesaj düzenleri bir kez derlenir
+_ID_ONLY = struct.Struct('>IB')
+_HAVE = struct.Struct('>IBI')
+_REQUEST = struct.Struct('>IBIII')
+_REQUEST_BODY = struct.Struct('>III')
+_UINT32 = struct.Struct('>I')
+_PIECE_HEADER = struct.Struct('>II')
+_PIECE_MESSAGE_HEADER = struct.Struct('>IBII')
+_EXTENDED_HEADER = struct.Struct('>IBB')
+
 class Message:
     def encode(self) -> bytes:
         raise NotImplementedError
@@ -28,13 +38,21 @@ class Have(Message):
     def __init__(self, piece_index: int):
         self.piece_index = piece_index
     def encode(self) -> bytes:
-        return struct.pack('>IBI', 5, self.message_id, self.piece_index)
+        return _HAVE.pack(5, self.message_id, self.piece_index)
+    @staticmethod
+    def decode(payload: bytes):
+        return Have(_UINT32.unpack_from(payload, 0)[0])
     def __repr__(self): return f"Have(piece_index={self.piece_index})"
 
 class Bitfield(Message):
     message_id = 5
     def __init__(self, bitfield: bytes):
         self.bitfield = bitfield
+    def encode(self) -> bytes:
+        return _ID_ONLY.pack(1 + len(self.bitfield), self.message_id) + self.bitfield
+    @staticmethod
+    def decode(payload: bytes):
+        return Bitfield(bytes(payload))
     def __repr__(self): return "Bitfield"
 
 class Request(Message):
@@ -44,7 +62,10 @@ class Request(Message):
         self.block_offset = block_offset
         self.block_length = block_length
     def encode(self) -> bytes:
-        return struct.pack('>IBIII', 13, self.message_id, self.piece_index, self.block_offset, self.block_length)
+        return _REQUEST.pack(13, self.message_id, self.piece_index, self.block_offset, self.block_length)
+    @staticmethod
+    def decode(payload: bytes):
+        return Request(*_REQUEST_BODY.unpack_from(payload, 0))
     def __repr__(self): return f"Request(piece_index={self.piece_index}, offset={self.block_offset}, length={self.block_length})"
 
 class Piece(Message):
@@ -53,16 +74,89 @@ class Piece(Message):
         self.piece_index = piece_index
         self.block_offset = block_offset
         self.data = data
+    def encode_header(self) -> bytes:
+        # Blok verisi ayrıca (kopyalanmadan) gönderilebilsin diye başlık ayrı üretilir
+        return _PIECE_MESSAGE_HEADER.pack(9 + len(self.data), self.message_id, self.piece_index, self.block_offset)
+    def encode(self) -> bytes:
+        return self.encode_header() + bytes(self.data)
     @staticmethod
     def decode(payload: bytes):
-        piece_index = struct.unpack('>I', payload[0:4])[0]
-        block_offset = struct.unpack('>I', payload[4:8])[0]
-        data = payload[8:]
-        return Piece(piece_index, block_offset, data)
+        # payload bir memoryview ise data da kopyasız bir dilimdir
+        piece_index, block_offset = _PIECE_HEADER.unpack_from(payload, 0)
+        return Piece(piece_index, block_offset, payload[8:])
     def __repr__(self): return f"Piece(piece_index={self.piece_index}, offset={self.block_offset}, length={len(self.data)})"
 
 class Cancel(Message):
     message_id = 8
+    def __init__(self, piece_index, block_offset, block_length):
+        self.piece_index = piece_index
+        self.block_offset = block_offset
+        self.block_length = block_length
+    def encode(self) -> bytes:
+        return _REQUEST.pack(13, self.message_id, self.piece_index, self.block_offset, self.block_length)
+    @staticmethod
+    def decode(payload: bytes):
+        return Cancel(*_REQUEST_BODY.unpack_from(payload, 0))
+    def __repr__(self): return f"Cancel(piece_index={self.piece_index}, offset={self.block_offset}, length={self.block_length})"
+
+# --- BEP 6 Fast Extension ---
+
+class Suggest(Message):
+    message_id = 13
+    def __init__(self, piece_index: int):
+        self.piece_index = piece_index
+    def encode(self) -> bytes:
+        return _HAVE.pack(5, self.message_id, self.piece_index)
+    @staticmethod
+    def decode(payload: bytes):
+        return Suggest(_UINT32.unpack_from(payload, 0)[0])
+    def __repr__(self): return f"Suggest(piece_index={self.piece_index})"
+
+class HaveAll(Message):
+    message_id = 14
+    def __repr__(self): return "HaveAll"
+
+class HaveNone(Message):
+    message_id = 15
+    def __repr__(self): return "HaveNone"
+
+class RejectRequest(Message):
+    message_id = 16
+    def __init__(self, piece_index, block_offset, block_length):
+        self.piece_index = piece_index
+        self.block_offset = block_offset
+        self.block_length = block_length
+    def encode(self) -> bytes:
+        return _REQUEST.pack(13, self.message_id, self.piece_index, self.block_offset, self.block_length)
+    @staticmethod
+    def decode(payload: bytes):
+        return RejectRequest(*_REQUEST_BODY.unpack_from(payload, 0))
+    def __repr__(self): return f"RejectRequest(piece_index={self.piece_index}, offset={self.block_offset}, length={self.block_length})"
+
+class AllowedFast(Message):
+    message_id = 17
+    def __init__(self, piece_index: int):
+        self.piece_index = piece_index
+    def encode(self) -> bytes:
+        return _HAVE.pack(5, self.message_id, self.piece_index)
+    @staticmethod
+    def decode(payload: bytes):
+        return AllowedFast(_UINT32.unpack_from(payload, 0)[0])
+    def __repr__(self): return f"AllowedFast(piece_index={self.piece_index})"
+
+# --- BEP 10 Extension Protocol ---
+
+class Extended(Message):
+    message_id = 20
+    def __init__(self, extended_id: int, payload: bytes):
+        self.extended_id = extended_id # 0: extension handshake, diğerleri handshake'te bildirilen numaralar
+        self.payload = payload
+    def encode(self) -> bytes:
+        return _EXTENDED_HEADER.pack(2 + len(self.payload), self.message_id, self.extended_id) + self.payload
+    @staticmethod
+    def decode(payload: bytes):
+        return Extended(payload[0], bytes(payload[1:]))
+    def __repr__(self): return f"Extended(extended_id={self.extended_id}, length={len(self.payload)})"
 
-for msg_class in [Choke, Unchoke, Interested, NotInterested]:
-    msg_class.encode = lambda self: struct.pack('>IB', 1, self.message_id)
\ No newline at end of file
+for msg_class in [Choke, Unchoke, Interested, NotInterested, HaveAll, HaveNone]:
+    msg_class.encode = lambda self: _ID_ONLY.pack(1, self.message_id)
\ No newline at end of file
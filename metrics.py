@@ -0,0 +1,190 @@
+import bisect
+import json
+import logging
+import math
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = '127.0.0.1' # Metrik uç noktası yalnızca yerel makineden erişilebilir
+# Saniye cinsinden gecikme histogramları için varsayılan kova sınırları (1 ms .. 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Counter:
+    """Yalnızca artan sayaç."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, {}, self.value
+
+class Gauge:
+    """Anlık değer."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        yield self.name, {}, self.value
+
+class Histogram:
+    """Sabit kovalı histogram; observe sıcak yolda çağrılabilecek kadar ucuzdur (bisect + iki toplama)."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1) # Son eleman +Inf kovası
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self._counts):
+            total += count
+            yield bound, total
+
+    def samples(self):
+        for bound, total in self.cumulative():
+            yield self.name + '_bucket', {'le': '+Inf' if bound == math.inf else repr(bound)}, total
+        yield self.name + '_sum', {}, self.sum
+        yield self.name + '_count', {}, self.count
+
+class Collector:
+    """Değerleri ancak okunurken hesaplanan etiketli gauge ailesi (ör. peer başına hız).
+
+    Kayıtlı her callback (etiketler, değer) çiftleri üretir; böylece sıcak yolda hiçbir şey güncellenmez.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.callbacks = []
+
+    def samples(self):
+        for callback in self.callbacks:
+            for labels, value in callback():
+                yield self.name, labels, value
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help_text, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, *args)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} metriği farklı bir tiple zaten kayıtlı")
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def add_collector(self, name: str, help_text: str, callback):
+        self._get_or_create(Collector, name, help_text).callbacks.append(callback)
+
+    def remove_collector(self, name: str, callback):
+        collector = self._metrics.get(name)
+        if isinstance(collector, Collector) and callback in collector.callbacks:
+            collector.callbacks.remove(callback)
+
+    def snapshot(self) -> dict:
+        """Tüm metriklerin JSON'a çevrilebilir anlık görüntüsü."""
+        result = {}
+        for name, metric in sorted(self._metrics.items()):
+            if isinstance(metric, Histogram):
+                result[name] = {
+                    'count': metric.count,
+                    'sum': metric.sum,
+                    'buckets': {('+Inf' if bound == math.inf else str(bound)): total for bound, total in metric.cumulative()},
+                }
+            elif isinstance(metric, Collector):
+                result[name] = [{'labels': labels, 'value': value} for _, labels, value in metric.samples()]
+            else:
+                result[name] = metric.value
+        return result
+
+    def render_prometheus(self) -> str:
+        """Prometheus metin formatı (0.0.4)."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                if labels:
+                    label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                    lines.append(f"{sample_name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{sample_name} {value}")
+        return '\n'.join(lines) + '\n'
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REGISTRY = MetricsRegistry() # Süreç genelindeki varsayılan kayıt
+
+class MetricsServer:
+    """Metrikleri yerel bir HTTP portunda sunar: /metrics (Prometheus metni) ve /metrics.json (anlık görüntü)."""
+
+    def __init__(self, port: int, registry: MetricsRegistry = REGISTRY, host: str = METRICS_HOST):
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._prometheus)
+        app.router.add_get('/metrics.json', self._json)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        logger.info("Metrikler http://%s:%d/metrics adresinde sunuluyor", self.host, self.port)
+
+    async def _prometheus(self, request):
+        return web.Response(text=self.registry.render_prometheus(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def _json(self, request):
+        return web.Response(text=json.dumps(self.registry.snapshot()), content_type='application/json')
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
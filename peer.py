@@ -1,106 +1,600 @@
 import asyncio
+import logging
+import math
 import struct
-from messages import Message, Bitfield, Interested, Unchoke, Choke, Have, Request, Piece, NotInterested
-from piece_manager import PieceManager
+import time
+from collections import deque
+import hashlib
+import ipaddress
+from messages import Message, Bitfield, Interested, Unchoke, Choke, Have, Request, Piece, NotInterested, Cancel
+from messages import Suggest, HaveAll, HaveNone, RejectRequest, AllowedFast, Extended
+from bencoding import BDecoder, BEncoder
+from pex import UT_PEX_ID, PEX_INTERVAL, PEX_MIN_INTERVAL, MAX_PEX_PEERS, PEX_SEED, encode_pex, decode_pex
+from piece_manager import PieceManager, BLOCK_SIZE
+from protocol import PeerWireProtocol, MAX_MESSAGE_LENGTH
+from metrics import REGISTRY
+from rate_limiter import TokenBucket
+
+# İstek penceresi (aynı anda yolda olan blok isteği sayısı) sınırları
+MIN_QUEUE_DEPTH = 2
+MAX_QUEUE_DEPTH = 250
+INITIAL_QUEUE_DEPTH = 4
+QUEUE_HEADROOM = 2.0 # Bant genişliği x gecikme çarpımının kaç katı kadar istek yolda tutulacak
+REQUEST_TIMEOUT_SHARE = 0.5 # Ölçülen hızla yoldaki tüm istekler REQUEST_TIMEOUT'un bu kadarında gelebilmeli
+RATE_INTERVAL = 1.0 # İndirme hızının kaç saniyede bir örnekleneceği
+CONNECT_TIMEOUT = 10
+HANDSHAKE_TIMEOUT = 10
+MESSAGE_TIMEOUT = 125 # Bu kadar saniye hiç mesaj gelmezse bağlantı kapatılır
+REQUEST_TIMEOUT = 30 # Bu kadar saniyede cevaplanmayan blok istekleri geri alınıp başka peer'lere verilir
+MAX_UPLOAD_REQUESTS = 500 # Bir peer'den sırada tutulan en fazla blok isteği; fazlası yok sayılır
+MAX_REQUEST_LENGTH = 2**17 # Kabul edilen en büyük blok isteği (byte)
+ALLOWED_FAST_COUNT = 10 # Bu sayıdan az parçası olan peer'e, choke altında da isteyebileceği bu kadar parça önerilir
+MAX_ALLOWED_FAST = 64 # Peer'den kabul edilen en fazla Allowed Fast / Suggest parçası
+
+_HANDSHAKE = struct.Struct('>B19s8s20s20s')
+_RESERVED = bytes(5) + b'\x10\x00\x04' # Desteklenen eklentiler: Extension Protocol (BEP 10), Fast Extension (BEP 6)
+_EXTENSION_PROTOCOL_BIT = 0x10 # reserved[5]
+_FAST_EXTENSION_BIT = 0x04 # reserved[7]
+_CLIENT_VERSION = b'PyTorrent 0.1'
+_UINT32 = struct.Struct('>I')
+
+logger = logging.getLogger(__name__)
+PEX_PEERS = REGISTRY.counter('torrent_pex_peers_total', "ut_pex mesajlarıyla öğrenilen peer adresleri")
+REQUEST_RTT_SECONDS = REGISTRY.histogram('torrent_peer_request_rtt_seconds', "Blok isteğinin gönderilmesinden bloğun gelmesine kadar geçen süre")
+DOWNLOADED_BYTES = REGISTRY.counter('torrent_downloaded_bytes_total', "Peer'lerden alınan blok verisi")
+UPLOADED_BYTES = REGISTRY.counter('torrent_uploaded_bytes_total', "Peer'lere gönderilen blok verisi")
+
+def allowed_fast_set(ip: str, info_hash: bytes, num_pieces: int, count: int) -> list:
+    """BEP 6'daki kanonik Allowed Fast kümesi; aynı /24 ağındaki peer'lere aynı parçalar düşer."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return []
+    if address.version == 6:
+        address = address.ipv4_mapped
+        if address is None:
+            # Algoritma yalnızca IPv4 için tanımlı
+            return []
+    count = min(count, num_pieces)
+    allowed = []
+    x = (int(address) & 0xFFFFFF00).to_bytes(4, 'big') + info_hash
+    while len(allowed) < count:
+        x = hashlib.sha1(x).digest()
+        for i in range(0, 20, 4):
+            index = _UINT32.unpack_from(x, i)[0] % num_pieces
+            if index not in allowed:
+                allowed.append(index)
+                if len(allowed) == count:
+                    break
+    return allowed
 
 class PeerConnection:
-    def __init__(self, ip: str, port: int, info_hash: bytes, peer_id: bytes, piece_manager: PieceManager):
+    def __init__(self, ip: str, port: int, info_hash: bytes, peer_id: bytes, piece_manager: PieceManager,
+                 upload_limiter: TokenBucket = None, download_limiter: TokenBucket = None, listen_port: int = None):
         self.ip = ip
         self.port = port
         self.info_hash = info_hash
         self.peer_id = peer_id
         self.piece_manager = piece_manager
-        self.reader = None
-        self.writer = None
+        self.protocol = None
         self.peer_is_choking = True
         self.peer_is_interested = False
         self.am_choking = True
         self.am_interested = False
+        # Pipelining durumu: (piece, offset) -> istek gönderilme zamanı
+        self.outstanding_requests = {}
+        self.max_outstanding = INITIAL_QUEUE_DEPTH
+        self.srtt = None # Yumuşatılmış istek gecikmesi (saniye)
+        # En küçük istek gecikmesi: pencerenin kendi oluşturduğu kuyruk beklemesini içermeyen taban gecikme
+        self.min_rtt = None
+        self.download_rate = 0.0 # Yumuşatılmış indirme hızı (byte/s)
+        self._rate_bytes = 0
+        self._rate_start = time.monotonic()
+        self.last_activity = time.monotonic()
+        # Bağlantı yöneticisinin peer'leri puanlaması için istatistikler
+        self.established = False
+        self.downloaded = 0 # Bu peer'den alınan toplam blok verisi (byte)
+        self.uploaded = 0 # Bu peer'e gönderilen toplam blok verisi (byte)
+        self.last_block_time = None
+        self.error = None # Bağlantıyı sonlandıran hata (varsa)
+        self._handshake_done = None
+        self._closed = None
+        # Peer'in bizden istediği, sırayla diskten okunup gönderilecek bloklar: (piece, offset, length)
+        self._upload_queue = deque()
+        self._upload_task = None
+        # Hız sınırları: indirme istekleri seyreltilerek, gönderim ise bloklar arasında beklenerek uygulanır
+        self.upload_limiter = upload_limiter or TokenBucket()
+        self.download_limiter = download_limiter or TokenBucket()
+        self._pace_handle = None # Jeton birikince istek göndermeyi sürdürecek zamanlayıcı
+        # Fast Extension (BEP 6): iki taraf da destekliyorsa reddedilen istekler bildirilir ve choke altında
+        # da Allowed Fast parçaları istenebilir
+        self.fast_extension = False
+        self.allowed_fast = set() # Peer bizi choke ederken de isteyebileceğimiz parçalar
+        self.suggested = set() # Peer'in önce istememizi önerdiği parçalar
+        self._allowed_fast_out = set() # Biz choke ederken peer'in isteyebileceği parçalar
+        # Extension Protocol (BEP 10) ve Peer Exchange (BEP 11)
+        self.extension_protocol = False
+        self.peer_extensions = {} # Peer'in extension handshake'inde bildirdiği eklenti adı -> mesaj numarası
+        self.listen_port = listen_port # Extension handshake'inde peer'e bildirilen, gelen bağlantıları kabul ettiğimiz port
+        self.peer_listen_port = None # Peer'in bildirdiği dinleme portu
+        self.inbound = False
+        self.remote_peer_id = None # Handshake'te peer'in bildirdiği kimlik
+        self.on_peers = None # on_peers([(ip, port), ...]): ut_pex ile yeni peer adresleri öğrenildiğinde
+        self._pex_sent = set() # Bu peer'e duyurduğumuz ve hâlâ bağlı olduğumuz peer'ler
+        self._pex_received_at = None
+        self._pex_sent_at = None
+
+    @property
+    def address(self):
+        return (self.ip, self.port)
 
     async def connect(self):
+        if await self.open():
+            await self.run()
+
+    async def open(self) -> bool:
+        """TCP bağlantısını kurar ve handshake yapar; başarılıysa True döndürür."""
+        loop = asyncio.get_running_loop()
+        self._handshake_done = loop.create_future()
+        self._closed = loop.create_future()
         try:
-            self.reader, self.writer = await asyncio.wait_for(
-                asyncio.open_connection(self.ip, self.port),
-                timeout=10
+            _, self.protocol = await asyncio.wait_for(
+                loop.create_connection(lambda: PeerWireProtocol(self, self._max_message_length()), self.ip, self.port),
+                timeout=CONNECT_TIMEOUT
             )
-            print(f"Peer {self.ip}:{self.port} ile bağlantı kuruldu.")
+            logger.debug("Peer %s:%d ile bağlantı kuruldu.", self.ip, self.port)
             handshake_success = await self._perform_handshake()
-            if not handshake_success:
-                self.disconnect()
-                return
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.debug("Peer %s:%d ile bağlantı kurulamadı: %r", self.ip, self.port, e)
+            self.error = e
+            handshake_success = False
+        if not handshake_success:
+            self.disconnect()
+            return False
+        self._on_established()
+        return True
+
+    def accept(self, protocol: PeerWireProtocol, reserved: bytes = bytes(8), peer_id: bytes = None):
+        """Dinleyen sokete gelen ve handshake'i zaten alınmış bağlantıyı devralır, cevap handshake'ini gönderir."""
+        loop = asyncio.get_running_loop()
+        self._handshake_done = loop.create_future()
+        self._handshake_done.set_result(self.info_hash)
+        self._closed = loop.create_future()
+        self.protocol = protocol
+        protocol.handler = self
+        protocol.max_message_length = self._max_message_length()
+        self.inbound = True
+        self.remote_peer_id = peer_id
+        self._negotiate(reserved)
+        protocol.send(_HANDSHAKE.pack(19, b'BitTorrent protocol', _RESERVED, self.info_hash, self.peer_id))
+        logger.debug("Peer %s:%d bize bağlandı.", self.ip, self.port)
+        self._on_established()
+
+    def _max_message_length(self) -> int:
+        # Blok mesajı ya da (çok parçalı torrent'lerde daha uzun olabilen) bitfield
+        return max(MAX_MESSAGE_LENGTH, 1 + (self.piece_manager.num_pieces + 7) // 8)
+
+    def _negotiate(self, reserved: bytes):
+        self.fast_extension = bool(reserved[7] & _FAST_EXTENSION_BIT)
+        self.extension_protocol = bool(reserved[5] & _EXTENSION_PROTOCOL_BIT)
+
+    @property
+    def listen_address(self):
+        """Peer'e yeniden bağlanılabilecek adres; gelen bağlantıda peer portunu bildirmediyse None."""
+        if not self.inbound:
+            return self.address
+        if self.peer_listen_port:
+            return (self.ip, self.peer_listen_port)
+        return None
+
+    def _on_established(self):
+        self.established = True
+        self.last_block_time = time.monotonic()
+        self.piece_manager.set_cancel_handler(self.address, self._cancel_request)
+        # Bitfield (ya da Have All / Have None), handshake'ten sonraki ilk mesaj olmalı
+        if self.fast_extension and self.piece_manager.has_all():
+            self._send_message(HaveAll())
+        else:
+            bitfield = self.piece_manager.bitfield()
+            if bitfield is not None:
+                self._send_message(Bitfield(bitfield))
+            elif self.fast_extension:
+                self._send_message(HaveNone())
+        if self.extension_protocol:
+            handshake = {b'm': {b'ut_pex': UT_PEX_ID}, b'v': _CLIENT_VERSION, b'reqq': MAX_UPLOAD_REQUESTS}
+            if self.listen_port:
+                handshake[b'p'] = self.listen_port
+            self._send_message(Extended(0, BEncoder(handshake).encode()))
+
+    async def run(self):
+        """Bağlantı kapanana ya da uzun süre sessiz kalana kadar çalışır."""
+        try:
             await self._message_loop()
-        except Exception as e:
-            # print(f"Peer {self.ip}:{self.port} ile bağlantı kurulamadı: {e}")
+        finally:
+            if self._upload_task is not None:
+                self._upload_task.cancel()
             self.disconnect()
 
     async def _perform_handshake(self) -> bool:
-        handshake_msg = struct.pack('>B19s8x20s20s', 19, b'BitTorrent protocol', self.info_hash, self.peer_id)
-        self.writer.write(handshake_msg)
-        await self.writer.drain()
+        self.protocol.send(_HANDSHAKE.pack(19, b'BitTorrent protocol', _RESERVED, self.info_hash, self.peer_id))
         try:
-            response = await asyncio.wait_for(self.reader.readexactly(68), timeout=10)
-            response_hash = struct.unpack('>B19s8x20s20s', response)[3]
+            response_hash = await asyncio.wait_for(asyncio.shield(self._handshake_done), timeout=HANDSHAKE_TIMEOUT)
             if self.info_hash == response_hash:
-                print("Handshake başarılı!")
+                logger.debug("Peer %s:%d ile handshake başarılı.", self.ip, self.port)
                 return True
             else:
-                # print("Handshake başarısız. Info hash eşleşmedi.")
+                logger.debug("Peer %s:%d ile handshake başarısız: info hash eşleşmedi.", self.ip, self.port)
+                self.error = ConnectionError("Info hash eşleşmedi")
                 return False
-        except Exception:
-            # print(f"Handshake sırasında hata.")
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.debug("Peer %s:%d ile handshake sırasında hata: %r", self.ip, self.port, e)
+            self.error = e
             return False
 
     async def _message_loop(self):
-        await self._send_message(Interested())
-        self.am_interested = True
-        while True:
+        # Mesajlar PeerWireProtocol tarafından doğrudan _handle_message'a iletilir; burada sadece
+        # bağlantının kapanmasını ya da uzun süre sessiz kalmasını bekliyoruz
+        if not self.piece_manager.is_complete():
+            self._send_message(Interested())
+            self.am_interested = True
+        while not self._closed.done():
             try:
-                length_prefix = await asyncio.wait_for(self.reader.readexactly(4), timeout=125)
-                msg_length = struct.unpack('>I', length_prefix)[0]
-                if msg_length == 0:
-                    continue
-                msg_body = await asyncio.wait_for(self.reader.readexactly(msg_length), timeout=125)
-                message_id = msg_body[0]
-                payload = msg_body[1:]
-                await self._handle_message(message_id, payload)
-            except Exception:
-                self.disconnect()
-                break
+                await asyncio.wait_for(asyncio.shield(self._closed), timeout=REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                if time.monotonic() - self.last_activity > MESSAGE_TIMEOUT:
+                    break
+                self._expire_requests()
+
+    def _expire_requests(self):
+        """Zaman aşımına uğrayan istekleri geri alır; bloklar başka peer'lerden istenebilir hale gelir."""
+        deadline = time.monotonic() - REQUEST_TIMEOUT
+        expired = [key for key, sent_at in self.outstanding_requests.items() if sent_at < deadline]
+        if not expired:
+            return
+        self._release_requests(expired)
+        self.max_outstanding = MIN_QUEUE_DEPTH
+        self._request_pieces()
+
+    def _release_requests(self, keys):
+        for piece_index, block_offset in keys:
+            del self.outstanding_requests[(piece_index, block_offset)]
+            # Geç gelen veri artık parça tamponuna yazılmamalı; tampon başka parçaya verilmiş olabilir
+            self.protocol.abandon_block(piece_index, block_offset)
+            self.piece_manager.release_request(self.address, piece_index, block_offset)
+
+    # --- PeerWireProtocol geri çağrıları ---
+
+    def handshake_received(self, reserved: bytes, info_hash: bytes, peer_id: bytes):
+        self.last_activity = time.monotonic()
+        self.remote_peer_id = peer_id
+        self._negotiate(reserved)
+        if not self._handshake_done.done():
+            self._handshake_done.set_result(info_hash)
+
+    def message_received(self, message_id: int, payload: memoryview):
+        self.last_activity = time.monotonic()
+        self._handle_message(message_id, payload)
+
+    def block_target(self, piece_index: int, block_offset: int, length: int):
+        if (piece_index, block_offset) not in self.outstanding_requests:
+            return None
+        return self.piece_manager.block_target(piece_index, block_offset, length)
+
+    def block_received(self, piece_index: int, block_offset: int, length: int):
+        # Blok verisi block_target'ın döndürdüğü dilime zaten yazıldı
+        self.last_activity = time.monotonic()
+        self._on_block(piece_index, block_offset, length, None)
 
-    async def _handle_message(self, message_id: int, payload: bytes):
-        if message_id == Choke.message_id: self.peer_is_choking = True
+    def connection_lost(self, exc):
+        if self._handshake_done is not None and not self._handshake_done.done():
+            self._handshake_done.set_exception(exc or ConnectionError("Bağlantı kapandı"))
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    # ---
+
+    def _handle_message(self, message_id: int, payload: memoryview):
+        if message_id == Choke.message_id:
+            self.peer_is_choking = True
+            if not self.fast_extension:
+                # Fast Extension yoksa choke yoldaki istekleri sessizce düşürür; bloklar hemen başka peer'lere verilsin.
+                # Varsa peer her isteği ya cevaplar ya da Reject Request ile bildirir
+                self._release_requests(list(self.outstanding_requests))
         elif message_id == Unchoke.message_id:
             self.peer_is_choking = False
-            await self._request_piece()
+            self._request_pieces()
         elif message_id == Have.message_id:
-            pass # TODO
+            self.piece_manager.add_peer_piece(self.address, Have.decode(payload).piece_index)
+            self._request_pieces()
         elif message_id == Bitfield.message_id:
-            pass # TODO
+            bitfield = Bitfield.decode(payload).bitfield
+            self.piece_manager.add_peer_bitfield(self.address, bitfield)
+            if int.from_bytes(bitfield, 'big').bit_count() < ALLOWED_FAST_COUNT:
+                self._send_allowed_fast()
+            self._request_pieces()
+        elif message_id == Interested.message_id: self.peer_is_interested = True
+        elif message_id == NotInterested.message_id: self.peer_is_interested = False
+        elif message_id == Request.message_id:
+            self._on_request(Request.decode(payload))
+        elif message_id == Cancel.message_id:
+            cancel = Cancel.decode(payload)
+            request = (cancel.piece_index, cancel.block_offset, cancel.block_length)
+            try:
+                self._upload_queue.remove(request)
+            except ValueError:
+                pass
+            else:
+                # Fast Extension: iptal edilen istek de cevapsız bırakılmaz
+                self._reject(*request)
         elif message_id == Piece.message_id:
+            # İstenmemiş ya da doğrudan alınamayan bloklar: veri payload'dan kopyalanır
             piece_message = Piece.decode(payload)
-            self.piece_manager.block_received(
-                piece_message.piece_index, 
-                piece_message.block_offset, 
-                piece_message.data
-            )
-            await self._request_piece()
+            self._on_block(piece_message.piece_index, piece_message.block_offset, len(piece_message.data), piece_message.data)
+        elif message_id == Extended.message_id:
+            if self.extension_protocol and len(payload):
+                self._on_extended(Extended.decode(payload))
+        elif self.fast_extension:
+            self._handle_fast_message(message_id, payload)
 
-    async def _request_piece(self):
-        if self.peer_is_choking:
+    def _on_extended(self, message: Extended):
+        try:
+            if message.extended_id == 0:
+                self._on_extension_handshake(BDecoder(message.payload).decode())
+            elif message.extended_id == UT_PEX_ID:
+                self._on_pex(message.payload)
+        except (EOFError, TypeError, IndexError, ValueError) as e:
+            logger.debug("Peer %s:%d geçersiz extension mesajı gönderdi: %r", self.ip, self.port, e)
+
+    def _on_extension_handshake(self, handshake):
+        if not isinstance(handshake, dict):
+            raise TypeError("Extension handshake'i sözlük değil")
+        extensions = handshake.get(b'm', {})
+        if isinstance(extensions, dict):
+            # Sonraki handshake'ler yalnızca değişen eklentileri bildirir; 0 eklentinin kapatıldığı anlamına gelir
+            for name, extended_id in extensions.items():
+                if not isinstance(extended_id, int):
+                    continue
+                if extended_id:
+                    self.peer_extensions[name.decode('utf-8', 'replace')] = extended_id
+                else:
+                    self.peer_extensions.pop(name.decode('utf-8', 'replace'), None)
+        port = handshake.get(b'p')
+        if isinstance(port, int) and 0 < port < 65536:
+            self.peer_listen_port = port
+
+    def _on_pex(self, payload: bytes):
+        now = time.monotonic()
+        if self._pex_received_at is not None and now - self._pex_received_at < PEX_MIN_INTERVAL:
+            return
+        self._pex_received_at = now
+        complete = self.piece_manager.is_complete()
+        # İndirme bittiyse seed'lere bağlanmanın anlamı yok
+        peers = [address for address, flags in decode_pex(payload) if not (complete and flags & PEX_SEED)]
+        if peers and self.on_peers is not None:
+            PEX_PEERS.inc(len(peers))
+            self.on_peers(peers)
+
+    def send_pex(self, connected: set):
+        """Bağlı peer'lerimizden bu peer'e son duyurudan beri eklenen ve çıkanları gönderir (ut_pex)."""
+        extended_id = self.peer_extensions.get('ut_pex')
+        if not extended_id or not self.established:
+            return
+        now = time.monotonic()
+        if self._pex_sent_at is not None and now - self._pex_sent_at < PEX_INTERVAL:
             return
-        block = self.piece_manager.get_next_request()
-        if block:
+        connected = connected - {self.listen_address}
+        added = list(connected - self._pex_sent)[:MAX_PEX_PEERS]
+        dropped = list(self._pex_sent - connected)[:MAX_PEX_PEERS]
+        if not added and not dropped:
+            return
+        self._pex_sent_at = now
+        self._pex_sent.difference_update(dropped)
+        self._pex_sent.update(added)
+        self._send_message(Extended(extended_id, encode_pex(added, dropped)))
+
+    def _handle_fast_message(self, message_id: int, payload: memoryview):
+        if message_id == HaveAll.message_id:
+            self.piece_manager.add_peer_have_all(self.address)
+            self._request_pieces()
+        elif message_id == HaveNone.message_id:
+            self._send_allowed_fast()
+        elif message_id == RejectRequest.message_id:
+            reject = RejectRequest.decode(payload)
+            key = (reject.piece_index, reject.block_offset)
+            if key in self.outstanding_requests:
+                # Blok beklemeden başka peer'lerden istenebilir hale gelir
+                self._release_requests([key])
+                self._request_pieces()
+        elif message_id == AllowedFast.message_id:
+            if len(self.allowed_fast) < MAX_ALLOWED_FAST:
+                self.allowed_fast.add(AllowedFast.decode(payload).piece_index)
+                self._request_pieces()
+        elif message_id == Suggest.message_id:
+            index = Suggest.decode(payload).piece_index
+            if len(self.suggested) < MAX_ALLOWED_FAST and not self.piece_manager.has_piece(index):
+                self.suggested.add(index)
+
+    def _on_block(self, piece_index: int, block_offset: int, length: int, data):
+        sent_at = self.outstanding_requests.pop((piece_index, block_offset), None)
+        if sent_at is not None:
+            self.downloaded += length
+            DOWNLOADED_BYTES.inc(length)
+            self.last_block_time = time.monotonic()
+            rtt = self.last_block_time - sent_at
+            REQUEST_RTT_SECONDS.observe(rtt)
+            self._update_queue_depth(length, rtt)
+        self.piece_manager.block_received(piece_index, block_offset, data, peer=self.address)
+        if self.piece_manager.is_backlogged():
+            # Doğrulama kuyruğu dolu: kuyruk boşalana kadar bu peer'den okumayı durdur
+            self.protocol.pause_reading()
+            self.piece_manager.add_backlog_waiter(self.protocol.resume_reading)
+        self._request_pieces()
+
+    def _update_queue_depth(self, block_length: int, rtt: float):
+        """Ölçülen gecikme ve hıza göre istek penceresini büyütür veya küçültür."""
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        now = time.monotonic()
+        self._rate_bytes += block_length
+        elapsed = now - self._rate_start
+        if elapsed >= RATE_INTERVAL:
+            sample = self._rate_bytes / elapsed
+            self.download_rate = sample if self.download_rate == 0 else 0.7 * self.download_rate + 0.3 * sample
+            self._rate_bytes = 0
+            self._rate_start = now
+
+        if self.download_rate > 0:
+            # Hattı dolu tutmak için gereken blok sayısı: hız x taban gecikme / blok boyutu. srtt kullanılmaz;
+            # pencerenin yarattığı kuyruk beklemesiyle birlikte büyür ve pencereyi sürekli büyütürdü
+            target = math.ceil(self.download_rate * self.min_rtt * QUEUE_HEADROOM / BLOCK_SIZE) + 1
+            # Pencerenin sonundaki istek de zaman aşımından önce cevaplanabilsin
+            target = min(target, int(self.download_rate * REQUEST_TIMEOUT * REQUEST_TIMEOUT_SHARE / BLOCK_SIZE))
+        else:
+            # Henüz hız ölçümü yok: her gelen blokta pencereyi bir artır (slow start)
+            target = self.max_outstanding + 1
+        self.max_outstanding = max(MIN_QUEUE_DEPTH, min(MAX_QUEUE_DEPTH, target))
+
+    def _request_pieces(self):
+        """İstek penceresi dolana kadar yeni blok istekleri gönderir; hepsi tek bir write ile gider."""
+        if self.protocol is None or self.protocol.transport is None:
+            return
+        if self.peer_is_choking and not self.allowed_fast:
+            return
+        if self._pace_handle is not None:
+            return
+        while len(self.outstanding_requests) < self.max_outstanding:
+            delay = self.download_limiter.delay()
+            if delay > 0:
+                # İndirme sınırı: soketi okumayı durdurmak yerine yeni istekleri jeton birikene kadar ertele
+                self._pace_handle = asyncio.get_running_loop().call_later(delay, self._resume_requests)
+                return
+            block = self._next_block()
+            if not block:
+                break
+            self.download_limiter.consume(block.length)
             request_message = Request(
                 piece_index=block.piece,
                 block_offset=block.offset,
                 block_length=block.length
             )
-            await self._send_message(request_message)
+            self.outstanding_requests[(block.piece, block.offset)] = time.monotonic()
+            self._send_message(request_message)
+        if len(self.outstanding_requests) < self.max_outstanding:
+            # İstenecek blok kalmadı ya da tampon havuzu dolu: yeni iş çıkınca pencereyi yeniden doldur
+            self.piece_manager.add_request_waiter(self._request_pieces)
+
+    def _next_block(self):
+        if self.peer_is_choking:
+            # Choke altında yalnızca peer'in izin verdiği parçalar istenebilir
+            return self.piece_manager.get_next_request(peer=self.address, allowed=self.allowed_fast)
+        if self.suggested:
+            block = self.piece_manager.get_next_request(peer=self.address, allowed=self.suggested)
+            if block:
+                return block
+            # Önerilen parçalarda istenecek blok kalmadı; seçim nadir-parça-önce sırasına döner
+            self.suggested.clear()
+        return self.piece_manager.get_next_request(peer=self.address)
+
+    def _resume_requests(self):
+        self._pace_handle = None
+        self._request_pieces()
+
+    def _cancel_request(self, block):
+        """Endgame'de başka bir peer'den alınan bloğun bu peer'e giden kopya isteğini iptal eder."""
+        if self.outstanding_requests.pop((block.piece, block.offset), None) is None:
+            return
+        if self.protocol is None or self.protocol.transport is None:
+            return
+        self._send_message(Cancel(block.piece, block.offset, block.length))
+        self.protocol.abandon_block(block.piece, block.offset)
+        self._request_pieces()
+
+    # --- Seed tarafı ---
+
+    def _on_request(self, request: Request):
+        choked = self.am_choking and request.piece_index not in self._allowed_fast_out
+        if choked or len(self._upload_queue) >= MAX_UPLOAD_REQUESTS or \
+                not 0 < request.block_length <= MAX_REQUEST_LENGTH or not self.piece_manager.has_piece(request.piece_index):
+            self._reject(request.piece_index, request.block_offset, request.block_length)
+            return
+        self._upload_queue.append((request.piece_index, request.block_offset, request.block_length))
+        if self._upload_task is None or self._upload_task.done():
+            self._upload_task = asyncio.create_task(self._serve_uploads())
+
+    async def _serve_uploads(self):
+        """Sıradaki istekleri okuma önbelleğinden gönderir; soket tamponu dolunca bekler."""
+        while self._upload_queue and self.protocol.transport is not None:
+            delay = self.upload_limiter.delay()
+            if delay > 0:
+                # Beklerken istek iptal edilebilir ya da peer choke edilebilir; kuyruk yeniden kontrol edilir
+                await asyncio.sleep(delay)
+                continue
+            request = self._upload_queue[0]
+            data = await self.piece_manager.read_block(*request)
+            # Okuma sürerken istek iptal edilmiş ya da peer choke edilmiş olabilir
+            if not self._upload_queue or self._upload_queue[0] != request:
+                continue
+            self._upload_queue.popleft()
+            if data is None:
+                self._reject(*request)
+                continue
+            piece_message = Piece(request[0], request[1], data)
+            self.protocol.send(piece_message.encode_header())
+            self.protocol.send(data)
+            self.upload_limiter.consume(len(data))
+            self.uploaded += len(data)
+            UPLOADED_BYTES.inc(len(data))
+            await self.protocol.drain()
+
+    def choke(self):
+        if not self.am_choking:
+            self.am_choking = True
+            self._send_message(Choke())
+            # Fast Extension: sıradaki istekler sessizce düşürülmez, Allowed Fast parçaları gönderilmeye devam eder
+            kept = deque()
+            for request in self._upload_queue:
+                if request[0] in self._allowed_fast_out:
+                    kept.append(request)
+                else:
+                    self._reject(*request)
+            self._upload_queue = kept
+
+    def unchoke(self):
+        if self.am_choking:
+            self.am_choking = False
+            self._send_message(Unchoke())
+
+    def _reject(self, piece_index: int, block_offset: int, block_length: int):
+        if self.fast_extension:
+            self._send_message(RejectRequest(piece_index, block_offset, block_length))
+
+    def _send_allowed_fast(self):
+        """Az parçası olan peer'e, choke edilse de isteyebileceği (bizde bulunan) parçaları bildirir."""
+        if not self.fast_extension or self._allowed_fast_out:
+            return
+        for index in allowed_fast_set(self.ip, self.info_hash, self.piece_manager.num_pieces, ALLOWED_FAST_COUNT):
+            if self.piece_manager.has_piece(index):
+                self._allowed_fast_out.add(index)
+                self._send_message(AllowedFast(index))
+
+    def send_have(self, index: int):
+        have = self.piece_manager.peer_bitfields.get(self.address)
+        if have is not None and have[index]:
+            return
+        self._send_message(Have(index))
+
+    def lose_interest(self):
+        if self.am_interested:
+            self.am_interested = False
+            self._send_message(NotInterested())
 
-    async def _send_message(self, message: Message):
-        self.writer.write(message.encode())
-        await self.writer.drain()
+    def _send_message(self, message: Message):
+        self.protocol.send(message.encode())
 
     def disconnect(self):
-        if self.writer and not self.writer.is_closing():
-            self.writer.close()
\ No newline at end of file
+        if self._pace_handle is not None:
+            self._pace_handle.cancel()
+            self._pace_handle = None
+        self.piece_manager.remove_peer(self.address)
+        if self.protocol is not None:
+            self.protocol.close()
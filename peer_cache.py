@@ -0,0 +1,74 @@
+import os
+import time
+from bencoding import BDecoder, BEncoder
+
+PEER_CACHE_SUFFIX = '.peers'
+MAX_CACHED_PEERS = 50 # Önbellekte tutulan en fazla peer; en hızlılar kalır
+PEER_CACHE_TTL = 7 * 24 * 3600 # Bu kadar süredir veri alınmayan peer önbellekten düşer (saniye)
+
+class PeerCache:
+    """Veri aldığımız peer'leri (ölçülen hızlarıyla) ve tracker sağlığını çalışmalar arasında saklayan dosya.
+
+    Yeniden başlatmada en hızlı peer'lere tracker cevabı beklenmeden hemen bağlanılır; önceki
+    çalışmada cevap vermeyen tracker'lar en son denenir.
+    """
+
+    def __init__(self, path: str, info_hash: bytes = b''):
+        self.path = path
+        self.info_hash = info_hash
+        self.peers = {} # (ip, port) -> (hız byte/s, son veri alınma zamanı)
+        self.trackers = {} # url -> {'failures': ardışık hata, 'latency': son duyuru süresi (sn)}
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = BDecoder(f.read()).decode()
+        except (OSError, EOFError, TypeError, IndexError, ValueError):
+            return
+        if data.get(b'info-hash', b'') != self.info_hash:
+            return
+        try:
+            for ip, port, rate, last_seen in data.get(b'peers', []):
+                self.peers[(ip.decode('ascii'), port)] = (rate, last_seen)
+            for url, state in data.get(b'trackers', {}).items():
+                self.trackers[url.decode('utf-8')] = {
+                    'failures': state.get(b'failures', 0),
+                    'latency': state[b'latency-ms'] / 1000 if b'latency-ms' in state else None,
+                }
+        except (AttributeError, TypeError, ValueError, UnicodeDecodeError):
+            # Bozuk kayıt: önbellek olmadan başlanır
+            self.peers.clear()
+            self.trackers.clear()
+
+    def best_peers(self) -> list:
+        """Önbellekteki peer adresleri, en hızlıdan en yavaşa."""
+        return sorted(self.peers, key=lambda address: self.peers[address][0], reverse=True)
+
+    def record_peer(self, address: tuple, rate: float):
+        self.peers[address] = (int(rate), int(time.time()))
+
+    def forget_peer(self, address: tuple):
+        self.peers.pop(address, None)
+
+    def record_tracker(self, url: str, failures: int, latency: float = None):
+        self.trackers[url] = {'failures': failures, 'latency': latency}
+
+    def save(self):
+        cutoff = time.time() - PEER_CACHE_TTL
+        peers = [(address, rate, last_seen) for address, (rate, last_seen) in self.peers.items() if last_seen >= cutoff]
+        peers.sort(key=lambda peer: peer[1], reverse=True)
+        trackers = {}
+        for url, state in self.trackers.items():
+            trackers[url] = {b'failures': state['failures']}
+            if state['latency'] is not None:
+                trackers[url][b'latency-ms'] = int(state['latency'] * 1000)
+        encoded = BEncoder({
+            b'info-hash': self.info_hash,
+            b'peers': [[ip, port, rate, last_seen] for (ip, port), rate, last_seen in peers[:MAX_CACHED_PEERS]],
+            b'trackers': trackers,
+        }).encode()
+        # Yarım yazılmış bir kayıt bırakmamak için önce geçici dosyaya yaz, sonra atomik olarak değiştir
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,396 @@
+import asyncio
+import logging
+import time
+from metrics import REGISTRY
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+MAX_CONCURRENT_DIALS = 8 # Aynı anda yapılan bağlantı (TCP + handshake) denemesi sayısı
+BASE_BACKOFF = 15 # İlk başarısız denemeden sonra bekleme süresi (saniye); her hatada iki katına çıkar
+MAX_BACKOFF = 30 * 60
+MAINTAIN_INTERVAL = 10 # Peer'lerin puanlanıp gerekirse değiştirildiği aralık (saniye)
+STALL_TIMEOUT = 60 # Bu kadar süre hiç blok göndermeyen peer takılmış sayılır
+MIN_PEER_AGE = 30 # Yavaşlık nedeniyle atılmadan önce bir peer'e tanınan süre
+SLOW_PEER_FRACTION = 0.2 # Ortalama hızın bu oranının altındaki peer, yeni aday varsa değiştirilir
+FD_RESERVE = 64 # Peer bağlantılarına verilmeyen tanımlayıcılar (tracker, metrik sunucusu, log dosyaları...)
+DEFAULT_FD_LIMIT = 1024 # İşletim sistemi sınırı okunamazsa varsayılan açık dosya sınırı
+MAX_CANDIDATES = 2000 # Aday havuzunun üst sınırı; PEX ile gelen adresler havuzu sınırsız büyütemesin
+
+logger = logging.getLogger(__name__)
+
+class PeerCandidate:
+    """Bağlanılabilecek bir peer adresi ve geçmiş denemelerinin durumu."""
+    def __init__(self, address: tuple):
+        self.address = address
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.banned = False
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        self.next_attempt = now + min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1))
+
+def _descriptor_limit() -> int:
+    if resource is None:
+        return DEFAULT_FD_LIMIT
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return DEFAULT_FD_LIMIT if soft == resource.RLIM_INFINITY else soft
+
+class ConnectionBudget:
+    """Aynı süreçteki tüm torrent'lerin paylaştığı peer bağlantısı bütçesi.
+
+    Sınır hem istenen en fazla bağlantı sayısı hem de açık dosya sınırından (RLIMIT_NOFILE) torrent
+    dosyalarının ve yedeğin düşülmesiyle kalan tanımlayıcı sayısıdır. Bir bağlantı kapandığında
+    bekleyen yöneticiler yeniden bağlanmayı dener.
+    """
+
+    def __init__(self, max_connections: int, fd_limit: int = None):
+        self.max_connections = max_connections
+        self.fd_limit = fd_limit if fd_limit is not None else _descriptor_limit()
+        self.file_descriptors = 0 # Torrent dosyalarının (ve mmap'lerinin) tuttuğu tanımlayıcılar
+        self.in_use = 0
+        self._listeners = [] # Bütçe boşalınca çağrılacak PeerManager._fill'ler
+        self._wake_scheduled = False
+
+    @property
+    def limit(self) -> int:
+        return max(0, min(self.max_connections, self.fd_limit - FD_RESERVE - self.file_descriptors))
+
+    @property
+    def available(self) -> int:
+        return max(0, self.limit - self.in_use)
+
+    def try_acquire(self) -> bool:
+        if self.in_use >= self.limit:
+            return False
+        self.in_use += 1
+        return True
+
+    def release(self):
+        self.in_use -= 1
+        self._wake_listeners()
+
+    def reserve_files(self, count: int):
+        self.file_descriptors += count
+
+    def release_files(self, count: int):
+        self.file_descriptors -= count
+        self._wake_listeners()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _wake_listeners(self):
+        # Aynı döngü turunda kapanan bağlantılar için yöneticiler bir kez uyandırılır
+        if self._listeners and not self._wake_scheduled:
+            self._wake_scheduled = True
+            asyncio.get_running_loop().call_soon(self._run_listeners)
+
+    def _run_listeners(self):
+        self._wake_scheduled = False
+        for callback in list(self._listeners):
+            if self.available <= 0:
+                break
+            callback()
+
+class PeerManager:
+    """Hedef sayıda aktif peer tutar: sınırlı eşzamanlılıkla bağlanır, başarısızlıkta üstel bekleme uygular,
+    peer'leri teslim ettikleri veri hızına göre puanlar ve yavaş ya da takılmış olanları yenileriyle değiştirir."""
+
+    def __init__(self, connection_factory, target_peers: int, max_dials: int = MAX_CONCURRENT_DIALS, budget: ConnectionBudget = None,
+                 torrent_name: str = ''):
+        self.connection_factory = connection_factory # connection_factory(ip, port) -> PeerConnection
+        self.target_peers = target_peers
+        self.max_dials = max_dials
+        self.budget = budget # Verilirse bağlantılar diğer torrent'lerle paylaşılan bu bütçeden alınır
+        self.candidates = {} # (ip, port) -> PeerCandidate
+        self.connections = {} # (ip, port) -> PeerConnection (bağlanan ya da bağlı)
+        self._tasks = {} # (ip, port) -> görev
+        self._dialing = 0
+        self._rates = {} # (ip, port) -> son ölçülen hız (byte/s)
+        self._last_downloaded = {}
+        self._banned_ips = set() # Gelen bağlantılar başka bir kaynak porttan gelebilir
+        self._connected_at = {} # (ip, port) -> handshake tamamlanma zamanı
+        self._maintain_task = None
+        self._closing = False
+        self._closed_uploaded = 0 # Kapanmış bağlantılardan gönderilen toplam veri
+        self.on_peers = None # Verilirse PEX ile öğrenilen peer'ler aday havuzu yerine buraya iletilir (bkz. workers.py)
+        self._delivered = {} # (ip, port) -> kapanmış bağlantıda ölçülen indirme hızı; yalnızca bizim bağlandığımız peer'ler
+        # Peer başına metrikler yalnızca okunurken bağlı peer'lerden toplanır; aynı oturumdaki iki torrent aynı
+        # peer'e bağlı olabileceğinden etiketlerde torrent adı da bulunur
+        self._torrent_name = torrent_name
+        self._collectors = [
+            ('torrent_peer_download_rate_bytes', "Peer'den indirme hızı (byte/s)", self._collect_download_rate),
+            ('torrent_peer_upload_bytes', "Peer'e gönderilen toplam veri", self._collect_uploaded),
+            ('torrent_peer_srtt_seconds', "Peer'in yumuşatılmış istek gecikmesi", self._collect_srtt),
+            ('torrent_peer_outstanding_requests', "Peer'den yanıt beklenen blok isteği sayısı", self._collect_outstanding),
+            ('torrent_peer_request_window', "Peer için izin verilen en fazla yoldaki istek sayısı", self._collect_window),
+        ]
+        for name, help_text, callback in self._collectors:
+            REGISTRY.add_collector(name, help_text, callback)
+
+    @property
+    def uploaded(self) -> int:
+        return self._closed_uploaded + sum(connection.uploaded for connection in self.connections.values())
+
+    @property
+    def active_count(self) -> int:
+        return sum(1 for connection in self.connections.values() if connection.established)
+
+    def add_candidates(self, peers):
+        for address in peers:
+            if len(self.candidates) >= MAX_CANDIDATES:
+                break
+            if address not in self.candidates and address[0] not in self._banned_ips:
+                self.candidates[address] = PeerCandidate(address)
+        self._fill()
+
+    def _pex_peers(self, peers):
+        if self.on_peers is not None:
+            self.on_peers(peers)
+        else:
+            self.add_candidates(peers)
+
+    def _send_pex(self):
+        # Yeniden bağlanılabilir adresi bilinen bağlı peer'ler ut_pex destekleyen peer'lere duyurulur; gönderim
+        # sıklığını her bağlantı kendisi sınırlar
+        established = [connection for connection in self.connections.values() if connection.established]
+        connected = {connection.listen_address for connection in established} - {None}
+        for connection in established:
+            connection.send_pex(connected)
+
+    def _make_connection(self, ip: str, port: int):
+        connection = self.connection_factory(ip, port)
+        connection.on_peers = self._pex_peers
+        return connection
+
+    def ban(self, address: tuple):
+        """Peer'e bir daha bağlanılmaz; bağlıysa bağlantı kesilir."""
+        candidate = self.candidates.setdefault(address, PeerCandidate(address))
+        candidate.banned = True
+        self._banned_ips.add(address[0])
+        connection = self.connections.get(address)
+        if connection is not None:
+            connection.disconnect()
+
+    def broadcast_have(self, index: int):
+        for connection in self.connections.values():
+            if connection.established:
+                connection.send_have(index)
+
+    def lose_interest(self):
+        # İndirme bitti: bağlı peer'lere artık blok istemeyeceğimizi bildir
+        for connection in self.connections.values():
+            if connection.established:
+                connection.lose_interest()
+
+    def start(self):
+        self._maintain_task = asyncio.create_task(self._maintain_loop())
+        if self.budget is not None:
+            self.budget.add_listener(self._fill)
+        self._fill()
+
+    def add_inbound(self, ip: str, port: int, protocol, reserved: bytes = bytes(8), peer_id: bytes = None) -> bool:
+        """Dinleyen sokete gelen ve handshake'i bu torrent'e ait bağlantıyı devralır; kabul edilmezse False döner."""
+        address = (ip, port)
+        if self._closing or self._maintain_task is None or ip in self._banned_ips:
+            return False
+        other = self._connection_to(ip, peer_id) if peer_id is not None else None
+        if other is not None:
+            # Aynı peer'e zaten bağlıyız (ör. iki taraf birbirini PEX ile öğrenip aynı anda bağlandı). İki taraf
+            # da aynı bağlantıyı tutsun diye peer_id'si küçük olan tarafın açtığı bağlantı kalır
+            if other.inbound or other.peer_id < peer_id:
+                return False
+            other.disconnect()
+        if address in self.connections or len(self.connections) >= self.target_peers:
+            return False
+        if self.budget is not None and not self.budget.try_acquire():
+            return False
+        connection = self._make_connection(ip, port)
+        self.connections[address] = connection
+        connection.accept(protocol, reserved, peer_id)
+        self._connected_at[address] = time.monotonic()
+        self._tasks[address] = asyncio.create_task(self._run_inbound(connection))
+        return True
+
+    def _connection_to(self, ip: str, peer_id: bytes, exclude=None):
+        for connection in self.connections.values():
+            if connection is not exclude and connection.ip == ip and connection.remote_peer_id == peer_id:
+                return connection
+        return None
+
+    def _ready_candidates(self, now: float) -> list:
+        # Gelen bağlantılar kaynak porttan tutulur; peer dinleme portunu bildirdiyse o adres de bağlı sayılır
+        connected = {connection.listen_address for connection in self.connections.values() if connection.inbound}
+        ready = [candidate for address, candidate in self.candidates.items()
+                 if address not in self.connections and address not in connected
+                 and not candidate.banned and candidate.next_attempt <= now]
+        # Daha az başarısız olmuş adaylar önce denenir
+        ready.sort(key=lambda candidate: candidate.failures)
+        return ready
+
+    def _fill(self):
+        if self._closing:
+            return
+        now = time.monotonic()
+        free_slots = self.target_peers - len(self.connections)
+        free_dials = self.max_dials - self._dialing
+        if self.budget is not None:
+            free_dials = min(free_dials, self.budget.available)
+        if free_slots <= 0 or free_dials <= 0:
+            return
+        for candidate in self._ready_candidates(now)[:min(free_slots, free_dials)]:
+            if self.budget is not None and not self.budget.try_acquire():
+                break
+            connection = self._make_connection(*candidate.address)
+            self.connections[candidate.address] = connection
+            self._dialing += 1
+            self._tasks[candidate.address] = asyncio.create_task(self._run_peer(candidate, connection))
+
+    async def _run_peer(self, candidate: PeerCandidate, connection):
+        try:
+            try:
+                opened = await connection.open()
+            finally:
+                self._dialing -= 1
+            if not opened:
+                candidate.record_failure(time.monotonic())
+                return
+            other = self._connection_to(connection.ip, connection.remote_peer_id, exclude=connection)
+            if other is not None:
+                # Peer bize bu arada kendisi de bağlanmış; add_inbound'daki kuralla aynı bağlantı tutulur
+                if not other.inbound or connection.remote_peer_id < connection.peer_id:
+                    candidate.record_failure(time.monotonic())
+                    return
+                other.disconnect()
+            self._connected_at[candidate.address] = time.monotonic()
+            await connection.run()
+            # Veri göndermeden kopan peer bir sonraki denemede biraz beklesin
+            if connection.downloaded == 0:
+                candidate.record_failure(time.monotonic())
+            else:
+                candidate.failures = 0
+        except Exception:
+            logger.exception("Peer %s:%d görevinde beklenmeyen hata", *candidate.address)
+            candidate.record_failure(time.monotonic())
+        finally:
+            self._forget(connection)
+
+    async def _run_inbound(self, connection):
+        try:
+            await connection.run()
+        except Exception:
+            logger.exception("Gelen peer %s:%d görevinde beklenmeyen hata", *connection.address)
+        finally:
+            self._forget(connection)
+
+    def delivering_peers(self) -> dict:
+        """Bu çalışmada veri aldığımız, yeniden bağlanılabilecek peer'ler ve ölçülen indirme hızları (byte/s)."""
+        peers = dict(self._delivered)
+        for address, connection in self.connections.items():
+            if connection.downloaded and address in self.candidates:
+                peers[address] = max(peers.get(address, 0), self._average_rate(connection))
+        return peers
+
+    def _average_rate(self, connection) -> float:
+        # Bağlantı boyunca ortalama hız; kısa süren indirmelerde yumuşatılmış hız henüz ölçülmemiş olabilir
+        elapsed = time.monotonic() - self._connected_at.get(connection.address, time.monotonic())
+        return connection.downloaded / max(elapsed, 1.0)
+
+    def unreachable_peers(self) -> list:
+        """Bu çalışmada bağlanılamayan ya da hiç veri göndermeyen aday peer'ler."""
+        return [address for address, candidate in self.candidates.items()
+                if candidate.failures and address not in self._delivered]
+
+    def _forget(self, connection):
+        connection.disconnect()
+        if connection.downloaded and connection.address in self.candidates:
+            address = connection.address
+            self._delivered[address] = max(self._delivered.get(address, 0), self._average_rate(connection))
+        self._closed_uploaded += connection.uploaded
+        self.connections.pop(connection.address, None)
+        self._tasks.pop(connection.address, None)
+        self._rates.pop(connection.address, None)
+        self._last_downloaded.pop(connection.address, None)
+        self._connected_at.pop(connection.address, None)
+        if self.budget is not None:
+            self.budget.release()
+        self._fill()
+
+    async def _maintain_loop(self):
+        while True:
+            await asyncio.sleep(MAINTAIN_INTERVAL)
+            self._maintain()
+
+    def _maintain(self):
+        now = time.monotonic()
+        established = [connection for connection in self.connections.values() if connection.established]
+        for connection in established:
+            # Son aralıkta teslim edilen veri miktarından hız puanı
+            previous = self._last_downloaded.get(connection.address, 0)
+            self._rates[connection.address] = (connection.downloaded - previous) / MAINTAIN_INTERVAL
+            self._last_downloaded[connection.address] = connection.downloaded
+
+        for connection in established:
+            # Veri istemediğimiz (örneğin seed ettiğimiz) peer'ler takılmış sayılmaz
+            if connection.am_interested and now - connection.last_block_time > STALL_TIMEOUT:
+                logger.info("Peer %s:%d %d sn'dir veri göndermedi, bağlantı kesiliyor.", connection.ip, connection.port, STALL_TIMEOUT)
+                connection.disconnect()
+
+        # Bekleyen aday varsa ve yuvalar doluysa en yavaş peer'i yenisiyle değiştir
+        mature = [connection for connection in established
+                  if connection.am_interested and now - self._connected_at.get(connection.address, now) >= MIN_PEER_AGE]
+        if len(self.connections) >= self.target_peers and mature and self._ready_candidates(now):
+            rates = [self._rates.get(connection.address, 0) for connection in established]
+            average = sum(rates) / len(rates)
+            slowest = min(mature, key=lambda connection: self._rates.get(connection.address, 0))
+            if self._rates.get(slowest.address, 0) < average * SLOW_PEER_FRACTION:
+                logger.info("Yavaş peer %s:%d yeni bir adayla değiştiriliyor.", slowest.ip, slowest.port)
+                slowest.disconnect()
+        self._send_pex()
+        self._fill()
+
+    def _established(self):
+        for connection in self.connections.values():
+            if connection.established:
+                yield {'torrent': self._torrent_name, 'peer': f"{connection.ip}:{connection.port}"}, connection
+
+    def _collect_download_rate(self):
+        # Son bakım aralığında ölçülen hız; durmuş bir peer'in eski EWMA değeri yanıltıcı olur
+        return ((labels, self._rates.get(connection.address, connection.download_rate))
+                for labels, connection in self._established())
+
+    def _collect_uploaded(self):
+        return ((labels, connection.uploaded) for labels, connection in self._established())
+
+    def _collect_srtt(self):
+        return ((labels, connection.srtt or 0) for labels, connection in self._established())
+
+    def _collect_outstanding(self):
+        return ((labels, len(connection.outstanding_requests)) for labels, connection in self._established())
+
+    def _collect_window(self):
+        return ((labels, connection.max_outstanding) for labels, connection in self._established())
+
+    async def close(self):
+        self._closing = True
+        for name, _, callback in self._collectors:
+            REGISTRY.remove_collector(name, callback)
+        if self.budget is not None:
+            self.budget.remove_listener(self._fill)
+        if self._maintain_task is not None:
+            self._maintain_task.cancel()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *(t for t in [self._maintain_task] if t), return_exceptions=True)
+        # Hiç çalışmaya başlamadan iptal edilen görevlerin bağlantıları bütçeye burada iade edilir
+        for connection in list(self.connections.values()):
+            self._forget(connection)
@@ -0,0 +1,61 @@
+import ipaddress
+import struct
+from bencoding import BDecoder, BEncoder
+
+UT_PEX_ID = 1 # Extension handshake'inde ut_pex için bildirdiğimiz mesaj numarası (BEP 10)
+PEX_INTERVAL = 60 # Bağlı peer'lerimizin duyurulma aralığı (saniye); BEP 11 dakikada birden sık gönderilmemesini ister
+PEX_MIN_INTERVAL = 45 # Aynı peer'den bundan sık gelen ut_pex mesajları yok sayılır (saniye)
+MAX_PEX_PEERS = 50 # Bir ut_pex mesajında gönderilen ya da kabul edilen en fazla eklenen/çıkan peer
+
+PEX_SEED = 0x02 # added.f: peer'in tüm parçaları var
+_PORT = struct.Struct('>H')
+
+def encode_peers(addresses) -> tuple:
+    """(ip, port) listesini compact biçime çevirir: (IPv4 baytları, IPv6 baytları)."""
+    ipv4, ipv6 = [], []
+    for ip, port in addresses:
+        try:
+            packed = ipaddress.ip_address(ip).packed
+        except ValueError:
+            continue
+        (ipv4 if len(packed) == 4 else ipv6).append(packed + _PORT.pack(port))
+    return b''.join(ipv4), b''.join(ipv6)
+
+def _iter_compact(data: bytes, address_length: int):
+    # Compact girdileri sırayla (ip, port) olarak verir; port 0 olanlar da dahil, konumları bayraklarla eşleşsin
+    step = address_length + 2
+    for start in range(0, len(data) - step + 1, step):
+        ip = str(ipaddress.ip_address(data[start:start + address_length]))
+        yield ip, _PORT.unpack_from(data, start + address_length)[0]
+
+def decode_peers(data: bytes, address_length: int) -> list:
+    return [(ip, port) for ip, port in _iter_compact(data, address_length) if port]
+
+def encode_pex(added: list, dropped: list) -> bytes:
+    added_ipv4, added_ipv6 = encode_peers(added)
+    dropped_ipv4, dropped_ipv6 = encode_peers(dropped)
+    message = {b'added': added_ipv4, b'added.f': bytes(len(added_ipv4) // 6), b'dropped': dropped_ipv4}
+    if added_ipv6 or dropped_ipv6:
+        message.update({b'added6': added_ipv6, b'added6.f': bytes(len(added_ipv6) // 18), b'dropped6': dropped_ipv6})
+    return BEncoder(message).encode()
+
+def decode_pex(payload: bytes) -> list:
+    """ut_pex mesajındaki eklenen peer'leri [((ip, port), bayraklar)] olarak döndürür; çıkanlar yok sayılır."""
+    message = BDecoder(payload).decode()
+    if not isinstance(message, dict):
+        raise ValueError("ut_pex mesajı sözlük değil")
+    peers = []
+    for key, address_length in ((b'added', 4), (b'added6', 16)):
+        data = message.get(key, b'')
+        flags = message.get(key + b'.f', b'')
+        if not isinstance(data, bytes) or not isinstance(flags, bytes):
+            continue
+        added = []
+        # Bayraklar ham girdi sırasıyla eşleşir; port 0 olan girdi ancak eşleştirmeden sonra atlanır
+        for index, (ip, port) in enumerate(_iter_compact(data, address_length)):
+            if port:
+                added.append(((ip, port), flags[index] if index < len(flags) else 0))
+                if len(added) == MAX_PEX_PEERS:
+                    break
+        peers.extend(added)
+    return peers
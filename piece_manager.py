@@ -1,50 +1,206 @@
+import asyncio
+import bisect
 import hashlib
+import logging
 import math
-from collections import namedtuple
+import os
+import time
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from buffer_pool import BufferPool, SharedBufferPool, DEFAULT_MAX_BUFFER_MEMORY
+from metrics import REGISTRY
+from read_cache import ReadCache
+from resume import FastResume, RESUME_SUFFIX
+from storage import Storage
+from verifier import PieceVerifier, HASH_WORKERS, HASH_QUEUE_DEPTH
+
+BLOCK_SIZE = 2**14 # Standart blok boyutu (16 KiB)
+ENDGAME_MAX_REQUESTERS = 3 # Endgame modunda bir bloğun aynı anda istenebileceği en fazla peer sayısı
+MAX_HASH_FAILURES = 2 # Bozuk blok gönderdiği kesinleşen peer bu kadar hatadan sonra yasaklanır
+STREAM_DEADLINE = 2.0 # Okuyucu bir parçayı bu kadar saniye beklerse parçanın yoldaki blokları başka peer'lerden de istenir
 
 BLOCK_MISSING = 0
 BLOCK_PENDING = 1
 BLOCK_RETRIEVED = 2
 Block = namedtuple('Block', ['piece', 'offset', 'length'])
 
+logger = logging.getLogger(__name__)
+PIECES_VERIFIED = REGISTRY.counter('torrent_pieces_verified_total', "Hash'i doğrulanan parçalar")
+HASH_FAILURES = REGISTRY.counter('torrent_hash_failures_total', "Hash'i tutmayan parçalar")
+
 class Piece:
-    def __init__(self, index, blocks, piece_hash):
+    # Blok tanımları saklanmaz, indeksten hesaplanır; blok durumları blok başına 1 byte'lık bir bytearray'de tutulur
+    __slots__ = ('index', 'length', 'piece_hash', 'num_blocks', '_block_states', '_missing', '_retrieved', 'data', '_buffer')
+
+    def __init__(self, index, length, piece_hash):
         self.index = index
-        self.blocks = blocks
+        self.length = length
         self.piece_hash = piece_hash
-        self._block_states = [BLOCK_MISSING] * len(blocks)
-        self.data = bytearray(sum(b.length for b in blocks))
+        self.num_blocks = math.ceil(length / BLOCK_SIZE)
+        self._block_states = bytearray(self.num_blocks) # Hepsi BLOCK_MISSING (0)
+        self._missing = self.num_blocks
+        self._retrieved = 0
+        # Veri tamponu havuzdan, parçanın ilk bloğu istendiğinde alınır
+        self._buffer = None
+        self.data = None
+
+    def attach_buffer(self, buffer):
+        self._buffer = buffer
+        self.data = memoryview(buffer)[:self.length]
+
+    @property
+    def buffer(self):
+        return self._buffer
+
+    def detach_buffer(self):
+        buffer = self._buffer
+        self._buffer = None
+        self.data = None
+        return buffer
+
+    def block(self, block_index):
+        offset = block_index * BLOCK_SIZE
+        return Block(self.index, offset, min(BLOCK_SIZE, self.length - offset))
 
     def _get_block_index(self, block_offset):
-        for i, block in enumerate(self.blocks):
-            if block.offset == block_offset:
-                return i
-        return -1
+        if block_offset % BLOCK_SIZE or not 0 <= block_offset < self.length:
+            return -1
+        return block_offset // BLOCK_SIZE
 
     def all_blocks_retrieved(self):
-        return all(state == BLOCK_RETRIEVED for state in self._block_states)
+        return self._retrieved == self.num_blocks
+
+    def has_missing_blocks(self):
+        return self._missing > 0
+
+    def is_started(self):
+        return self._missing < self.num_blocks
 
     def get_next_missing_block(self):
-        for i, state in enumerate(self._block_states):
-            if state == BLOCK_MISSING:
-                self._block_states[i] = BLOCK_PENDING
-                return self.blocks[i]
-        return None
+        block_index = self._block_states.find(BLOCK_MISSING)
+        if block_index == -1:
+            return None
+        self._block_states[block_index] = BLOCK_PENDING
+        self._missing -= 1
+        return self.block(block_index)
+
+    def release_block(self, offset):
+        """Yolda olan bloğu yeniden istenebilir hale getirir (isteyen peer koptuysa ya da cevap vermediyse)."""
+        block_index = self._get_block_index(offset)
+        if block_index == -1 or self._block_states[block_index] != BLOCK_PENDING:
+            return False
+        self._block_states[block_index] = BLOCK_MISSING
+        self._missing += 1
+        return True
+
+    def reset(self):
+        """Hash'i tutmayan parçanın tüm bloklarını eksik sayar; daha önce alınmış blok sayısını döndürür."""
+        retrieved = self._retrieved
+        self._block_states[:] = bytes(self.num_blocks)
+        self._missing = self.num_blocks
+        self._retrieved = 0
+        return retrieved
+
+    def mark_all_retrieved(self):
+        """Tüm blokları alınmış sayar; yeni alınmış sayılan blok sayısını döndürür."""
+        newly_retrieved = self.num_blocks - self._retrieved
+        self._block_states[:] = bytes([BLOCK_RETRIEVED]) * self.num_blocks
+        self._missing = 0
+        self._retrieved = self.num_blocks
+        return newly_retrieved
+
+    def block_target(self, offset, length):
+        """Beklenen bir blok için parça tamponunun ilgili dilimini döndürür; veri doğrudan buraya alınabilir."""
+        block_index = self._get_block_index(offset)
+        if block_index == -1 or self.data is None or self._block_states[block_index] != BLOCK_PENDING:
+            return None
+        if length != self.block(block_index).length:
+            return None
+        return self.data[offset:offset + length]
 
     def block_received(self, offset, data):
+        # data None ise blok zaten block_target ile alınan dilime yazılmıştır
         block_index = self._get_block_index(offset)
         if block_index != -1 and self._block_states[block_index] == BLOCK_PENDING:
+            if data is not None:
+                if len(data) != self.block(block_index).length:
+                    return False
+                self.data[offset:offset + len(data)] = data
             self._block_states[block_index] = BLOCK_RETRIEVED
-            self.data[offset:offset + len(data)] = data
+            self._retrieved += 1
+            return True
+        return False
 
     def is_hash_correct(self):
         return hashlib.sha1(self.data).digest() == self.piece_hash
 
 class PieceManager:
-    def __init__(self, torrent_data):
+    def __init__(self, torrent_data, hash_workers=HASH_WORKERS, hash_queue_depth=HASH_QUEUE_DEPTH, info_hash=b'',
+                 max_buffer_memory=DEFAULT_MAX_BUFFER_MEMORY, shared_buffers=False):
         self.torrent_data = torrent_data
         self.pieces = self._initialize_pieces()
-        self.output_file = open(self.torrent_data[b'info'][b'name'].decode('utf-8'), "wb")
+        self.num_pieces = len(self.pieces)
+        # İlerleme ve tamamlanma, her seferinde taramak yerine sayaçlardan hesaplanır
+        self.total_blocks = sum(piece.num_blocks for piece in self.pieces)
+        self.retrieved_blocks = 0
+        # Hash'i doğrulanmış parçalar (1 = doğrulandı)
+        self.verified_pieces = bytearray(len(self.pieces))
+        self.verified_count = 0
+        self.verified_bytes = 0
+        self.verifier = PieceVerifier(self._piece_verified, workers=hash_workers, queue_depth=hash_queue_depth)
+        # Her peer için o an yolda olan (istenmiş ama gelmemiş) bloklar: peer -> {(piece, offset)}
+        self.pending_blocks = defaultdict(set)
+        # Yoldaki her bloğu isteyen peer'ler: (piece, offset) -> {peer}; endgame'de bir blok birden fazla peer'den istenir
+        self._block_requesters = {}
+        self._cancel_handlers = {} # peer -> callback(block); kopya isteği iptal edilecek peer'e haber verir
+        self.endgame = False
+        # False ise endgame'de bloklar ikinci bir peer'den istenmez (bkz. workers.py)
+        self.duplicate_requests = True
+        # Doğrulanmamış parçalarda her bloğu hangi peer'in gönderdiği: parça indeksi -> [peer, ...]
+        self._block_sources = {}
+        # Hash'i tutmayan parçaların blok özetleri: parça indeksi -> [(blok indeksi, peer, sha1)]. Parça
+        # sonradan doğrulandığında özeti farklı çıkan bloğu gönderen peer bozuk veriden sorumlu tutulur
+        self._suspect_blocks = {}
+        self.hash_failures = defaultdict(int) # peer -> bozuk veri gönderdiği kesinleşen parça sayısı
+        self.banned_peers = set()
+        self.on_ban = None # on_ban(peer): bozuk veri gönderen peer yasaklandığında
+        # Nadir-parça-önce seçici: her peer'in bitfield'ı ve her parçanın swarm'daki kopya sayısı
+        self.peer_bitfields = {}
+        self.availability = [0] * len(self.pieces)
+        # Henüz hiç istenmemiş parçalar kopya sayısına göre kovalarda, yarım kalmış parçalar ayrı kümede tutulur.
+        # Boş olmayan kovaların kopya sayıları sıralı listede artımlı olarak tutulur; seçimde sıralama yapılmaz
+        self._availability_buckets = defaultdict(set)
+        self._availability_levels = []
+        if self.pieces:
+            self._availability_buckets[0].update(range(len(self.pieces)))
+            self._availability_levels.append(0)
+        self._partial_pieces = set()
+        # Her peer'in sahip olduğu ve hâlâ istenebilir bloğu olan parçalar; seçim bitfield'ın tamamını taramaz
+        self._peer_wanted = {}
+        # Akış modu: okuma imleçlerinin önündeki parçalar sırayla ve öncelikli istenir (bkz. stream.py)
+        self._stream_windows = {} # okuyucu -> (ilk parça, son parça + 1)
+        self._piece_waiters = defaultdict(list) # parça indeksi -> diske yazılmasını bekleyen future'lar
+        self._urgent_pieces = {} # okuyucunun beklediği parça -> kopya isteklerin başlayacağı zaman
+        # Parça tamponları sınırlı bir havuzdan gelir; havuz dolunca yeni parçalara başlanmaz. Worker
+        # süreçleri blokları doğrudan tampona yazabilsin diye havuz paylaşımlı bellekte de tutulabilir
+        pool_class = SharedBufferPool if shared_buffers else BufferPool
+        self.buffer_pool = pool_class(self.torrent_data[b'info'][b'piece length'], max_buffer_memory)
+        self.buffer_starved = False
+        # Penceresini dolduramayan peer'ler; tampon boşalınca ya da bloklar yeniden istenebilir olunca uyandırılır
+        self._request_waiters = set()
+        self._wake_scheduled = False
+        self.storage = Storage(self.torrent_data[b'info'], on_written=self._pieces_written)
+        # Seed tarafı: peer'lere gönderilen bloklar bu önbellekten okunur
+        self.read_cache = ReadCache(self.storage)
+        self.on_have = None # on_have(parça indeksi): parça diske yazılıp peer'lere sunulabilir hale geldiğinde
+        name = self.torrent_data[b'info'][b'name'].decode('utf-8')
+        self.resume = FastResume(name + RESUME_SUFFIX, info_hash)
+        self._labels = {'torrent': name}
+        # Kuyruk doluluğu metrikleri yalnızca okunurken hesaplanır
+        REGISTRY.add_collector('torrent_hash_queue_depth', "Doğrulama kuyruğundaki parça sayısı", self._collect_hash_queue)
+        REGISTRY.add_collector('torrent_disk_queue_depth', "Diske yazılmayı bekleyen parça sayısı", self._collect_disk_queue)
+        REGISTRY.add_collector('torrent_piece_buffers_in_use', "Kullanımdaki parça tamponları", self._collect_buffers)
+        REGISTRY.add_collector('torrent_progress_ratio', "Doğrulanmış verinin toplam boyuta oranı", self._collect_progress)
 
     def _initialize_pieces(self):
         info = self.torrent_data[b'info']
@@ -58,54 +214,531 @@ class PieceManager:
         elif b'files' in info:
             total_length = sum(file[b'length'] for file in info[b'files'])
         
+        self.total_length = total_length
         num_pieces = math.ceil(total_length / piece_length)
         pieces = []
         for i in range(num_pieces):
-            blocks = []
             current_piece_length = piece_length if i < num_pieces - 1 else total_length % piece_length or piece_length
-            block_size = 2**14
-            num_blocks = math.ceil(current_piece_length / block_size)
-            for j in range(num_blocks):
-                current_block_length = block_size if j < num_blocks - 1 else current_piece_length % block_size or block_size
-                blocks.append(Block(i, j * block_size, current_block_length))
             start = i * 20
-            piece_hash = piece_hashes[start:start + 20]
-            pieces.append(Piece(i, blocks, piece_hash))
+            pieces.append(Piece(i, current_piece_length, piece_hashes[start:start + 20]))
         return pieces
 
-    def get_next_request(self):
-        for piece in self.pieces:
-            if not piece.all_blocks_retrieved():
-                block = piece.get_next_missing_block()
-                if block:
+    def add_peer_bitfield(self, peer, bitfield: bytes):
+        bits = bin(int.from_bytes(bitfield, 'big'))[2:].zfill(len(bitfield) * 8)
+        for index, bit in enumerate(bits[:len(self.pieces)]):
+            if bit == '1':
+                self.add_peer_piece(peer, index)
+
+    def add_peer_have_all(self, peer):
+        for index in range(len(self.pieces)):
+            self.add_peer_piece(peer, index)
+
+    def add_peer_piece(self, peer, index):
+        have = self.peer_bitfields.setdefault(peer, bytearray(len(self.pieces)))
+        wanted = self._peer_wanted.setdefault(peer, set())
+        if 0 <= index < len(self.pieces) and not have[index]:
+            have[index] = 1
+            self._change_availability(index, 1)
+            if self.pieces[index].has_missing_blocks():
+                wanted.add(index)
+
+    def set_cancel_handler(self, peer, callback):
+        self._cancel_handlers[peer] = callback
+
+    def remove_peer(self, peer):
+        self._cancel_handlers.pop(peer, None)
+        # Peer'in yoldaki blokları başka peer'lerden istenebilsin
+        for piece_index, offset in list(self.pending_blocks.pop(peer, ())):
+            self.release_request(peer, piece_index, offset)
+        self._peer_wanted.pop(peer, None)
+        have = self.peer_bitfields.pop(peer, None)
+        if have:
+            for index, bit in enumerate(have):
+                if bit:
+                    self._change_availability(index, -1)
+
+    def release_request(self, peer, piece_index, offset):
+        """Peer'in bloğa ait isteğini geri alır; bloğu bekleyen başka peer kalmadıysa blok yeniden istenebilir olur."""
+        key = (piece_index, offset)
+        # Kopmuş peer için defaultdict'te yeniden boş küme oluşturulmasın (peer değiştikçe sözlük büyürdü)
+        pending = self.pending_blocks.get(peer)
+        if pending is not None:
+            pending.discard(key)
+        requesters = self._block_requesters.get(key)
+        if requesters is None:
+            return
+        requesters.discard(peer)
+        if requesters:
+            return
+        del self._block_requesters[key]
+        piece = self.pieces[piece_index]
+        if piece.release_block(offset):
+            self._reindex_piece(piece_index)
+            self._release_unused_buffer(piece)
+            self._wake_request_waiters()
+
+    def _release_unused_buffer(self, piece):
+        # Hiç alınmış ya da yolda bloğu kalmayan parçanın tamponu havuza döner
+        if piece.is_started() or piece.data is None:
+            return
+        self.buffer_pool.release(piece.detach_buffer())
+        self._wake_request_waiters()
+
+    def _change_availability(self, index, delta):
+        old = self.availability[index]
+        bucket = self._availability_buckets.get(old)
+        in_bucket = bucket is not None and index in bucket
+        if in_bucket:
+            self._bucket_discard(index)
+        self.availability[index] = old + delta
+        if in_bucket:
+            self._bucket_add(index)
+
+    def _bucket_add(self, index):
+        availability = self.availability[index]
+        if availability not in self._availability_buckets:
+            bisect.insort(self._availability_levels, availability)
+        self._availability_buckets[availability].add(index)
+
+    def _bucket_discard(self, index):
+        availability = self.availability[index]
+        bucket = self._availability_buckets.get(availability)
+        if bucket is None:
+            return
+        bucket.discard(index)
+        if not bucket:
+            del self._availability_buckets[availability]
+            del self._availability_levels[bisect.bisect_left(self._availability_levels, availability)]
+
+    def _reindex_piece(self, index):
+        # Parçayı durumuna göre kovaya, yarım parçalar kümesine ya da hiçbirine yerleştir
+        was_wanted = index in self._partial_pieces or index in self._availability_buckets.get(self.availability[index], ())
+        self._bucket_discard(index)
+        self._partial_pieces.discard(index)
+        piece = self.pieces[index]
+        wanted = piece.has_missing_blocks()
+        if wanted:
+            if piece.is_started():
+                self._partial_pieces.add(index)
+            else:
+                self._bucket_add(index)
+        if wanted != was_wanted and self.availability[index]:
+            # İstenebilir olma durumu değişti: parçaya sahip peer'lerin indekslerini güncelle (peer sayısıyla orantılı)
+            for peer, have in self.peer_bitfields.items():
+                if have[index]:
+                    if wanted:
+                        self._peer_wanted[peer].add(index)
+                    else:
+                        self._peer_wanted[peer].discard(index)
+
+    def get_next_request(self, peer, allowed=None):
+        """Peer'den istenecek sıradaki blok; allowed verilirse yalnızca bu parçalardan seçilir (Allowed Fast)."""
+        have = self.peer_bitfields.get(peer)
+        if have is None:
+            return None
+        if allowed is not None:
+            return self._take_allowed(peer, have, allowed)
+        if self._stream_windows:
+            block = self._take_streaming(peer, have)
+            if block is not None:
+                return block
+        # Önce yarım kalmış parçaları bitir, sonra peer'de bulunan en nadir parçayı seç
+        wanted = self._peer_wanted[peer]
+        index = self._first_common(self._partial_pieces, wanted)
+        if index is not None:
+            return self._take_block(index, peer)
+        if self.buffer_pool.can_acquire():
+            index = self._rarest_fresh(wanted)
+            if index is not None:
+                return self._take_block(index, peer)
+        elif not self._in_endgame():
+            # Bellek sınırına ulaşıldı: yeni parçaya başlama; tampon boşalınca bekleyen peer'ler uyandırılır
+            self.buffer_starved = True
+            return None
+        if self.duplicate_requests and self._in_endgame():
+            return self._take_duplicate(peer, have)
+        return None
+
+    @staticmethod
+    def _first_common(pieces, wanted):
+        # İki kümenin küçüğü taranır: seçim maliyeti peer'in istenebilir parça sayısını geçmez
+        if len(pieces) > len(wanted):
+            pieces, wanted = wanted, pieces
+        return next((index for index in pieces if index in wanted), None)
+
+    def _rarest_fresh(self, wanted):
+        # Kovalar artan kopya sayısıyla gezilir; her kovada kova ile peer'in kümesinden küçüğü taranır.
+        # Maliyet: O(kova sayısı x min(kova, peer'in istenebilir parçaları)); kova sayısı peer sayısını geçmez
+        for availability in self._availability_levels:
+            if availability == 0:
+                continue
+            index = self._first_common(self._availability_buckets[availability], wanted)
+            if index is not None:
+                return index
+        return None
+
+    def _in_endgame(self):
+        """İstenebilecek eksik blok kalmadıysa (kalan her blok yolda) True."""
+        if any(availability > 0 for availability in self._availability_buckets) or \
+                any(self.availability[index] for index in self._partial_pieces):
+            self.endgame = False
+            return False
+        if not self.endgame and self._block_requesters:
+            self.endgame = True
+            logger.info("Endgame moduna girildi: kalan %d blok birden fazla peer'den istenecek.", len(self._block_requesters))
+        return self.endgame
+
+    def _take_duplicate(self, peer, have):
+        # Yoldaki bloklar arasından bu peer'in henüz istemediği ve en az peer'den istenmiş olanı seç
+        pending = self.pending_blocks[peer]
+        best_key, best_count = None, ENDGAME_MAX_REQUESTERS
+        for key, requesters in self._block_requesters.items():
+            if len(requesters) < best_count and have[key[0]] and key not in pending:
+                best_key, best_count = key, len(requesters)
+                if best_count <= 1:
+                    break
+        if best_key is None:
+            return None
+        self._block_requesters[best_key].add(peer)
+        pending.add(best_key)
+        piece_index, offset = best_key
+        return self.pieces[piece_index].block(offset // BLOCK_SIZE)
+
+    def get_next_piece(self, peer):
+        """Parçayı bütün halinde indiren kaynaklar (web seed) için: henüz hiç istenmemiş sıradaki parçanın tüm
+        bloklarını peer'e ayırıp döndürür. Yeni parça yoksa yarım parçalardan tek blok verilir; hiçbiri yoksa []."""
+        have = self.peer_bitfields.get(peer)
+        if have is None:
+            return []
+        if self.buffer_pool.can_acquire():
+            fresh = None
+            for first, last in self._stream_windows.values():
+                fresh = next((index for index in range(first, last)
+                              if have[index] and self._is_fresh(index)), None)
+                if fresh is not None:
+                    break
+            if fresh is None:
+                fresh = self._rarest_fresh(self._peer_wanted[peer])
+            if fresh is not None:
+                blocks = []
+                while self.pieces[fresh].has_missing_blocks():
+                    blocks.append(self._take_block(fresh, peer))
+                return blocks
+        block = self.get_next_request(peer)
+        return [block] if block else []
+
+    def _is_fresh(self, index):
+        piece = self.pieces[index]
+        return piece.has_missing_blocks() and not piece.is_started()
+
+    def _take_streaming(self, peer, have):
+        # Okuma imlecinin önündeki pencerede sıradaki eksik parça
+        for first, last in self._stream_windows.values():
+            for index in range(first, last):
+                piece = self.pieces[index]
+                if not have[index] or not piece.has_missing_blocks():
+                    continue
+                if piece.data is None and not self.buffer_pool.can_acquire():
+                    break
+                return self._take_block(index, peer)
+        if not self.duplicate_requests or not self._urgent_pieces:
+            return None
+        # Süresi geçen parçanın yoldaki blokları bir peer daha istesin; hangisi önce gelirse diğeri iptal edilir
+        now = time.monotonic()
+        pending = self.pending_blocks[peer]
+        for index, deadline in self._urgent_pieces.items():
+            if deadline > now or not have[index]:
+                continue
+            piece = self.pieces[index]
+            for block_index in range(piece.num_blocks):
+                block = piece.block(block_index)
+                key = (index, block.offset)
+                requesters = self._block_requesters.get(key)
+                if requesters and len(requesters) < ENDGAME_MAX_REQUESTERS and key not in pending:
+                    requesters.add(peer)
+                    pending.add(key)
                     return block
         return None
 
-    def block_received(self, piece_index, offset, data):
+    def set_stream_window(self, reader, first, count):
+        """reader'ın okuma imlecindeki parçadan başlayarak count parçayı öncelikli indirilecek pencere yapar."""
+        self._stream_windows[reader] = (first, min(first + count, self.num_pieces))
+        self._wake_request_waiters()
+
+    def remove_stream_window(self, reader):
+        self._stream_windows.pop(reader, None)
+
+    async def wait_for_piece(self, index):
+        """Parça doğrulanıp diske yazılana kadar bekler; beklenen parça acil sayılır."""
+        if self.has_piece(index):
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._piece_waiters[index].append(future)
+        self._urgent_pieces.setdefault(index, time.monotonic() + STREAM_DEADLINE)
+        try:
+            await future
+        finally:
+            waiters = self._piece_waiters.get(index)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._piece_waiters[index]
+                    self._urgent_pieces.pop(index, None)
+
+    def _take_allowed(self, peer, have, allowed):
+        # Peer bizi choke ederken yalnızca izin verdiği parçalardan istenebilir; seçim sırası önemsiz
+        for index in allowed:
+            if not 0 <= index < self.num_pieces or not have[index]:
+                continue
+            piece = self.pieces[index]
+            if not piece.has_missing_blocks():
+                continue
+            if piece.data is None and not self.buffer_pool.can_acquire():
+                continue
+            return self._take_block(index, peer)
+        return None
+
+    def add_request_waiter(self, callback):
+        self._request_waiters.add(callback)
+
+    def _take_block(self, index, peer):
+        piece = self.pieces[index]
+        if piece.data is None:
+            piece.attach_buffer(self.buffer_pool.acquire())
+        block = piece.get_next_missing_block()
+        self.pending_blocks[peer].add((block.piece, block.offset))
+        self._block_requesters[(block.piece, block.offset)] = {peer}
+        self._reindex_piece(index)
+        return block
+
+    def block_target(self, piece_index, offset, length):
+        if not 0 <= piece_index < len(self.pieces):
+            return None
+        # Birden fazla peer'den istenen blok doğrudan tampona alınmaz; geç gelen kopya tamponun yeniden
+        # kullanıldığı başka bir parçanın üzerine yazabilir
+        if len(self._block_requesters.get((piece_index, offset), ())) > 1:
+            return None
+        return self.pieces[piece_index].block_target(offset, length)
+
+    def block_received(self, piece_index, offset, data, peer=None):
+        """Gelen bloğu işler; data None ise veri block_target ile önceden parça tamponuna yazılmıştır."""
+        if not 0 <= piece_index < len(self.pieces):
+            return
+        key = (piece_index, offset)
+        pending = self.pending_blocks.get(peer)
+        if pending is not None:
+            pending.discard(key)
         piece = self.pieces[piece_index]
-        piece.block_received(offset, data)
-        print(f"Parça {piece_index}, Blok (offset {offset}) alındı.")
+        if not piece.block_received(offset, data):
+            requesters = self._block_requesters.get(key)
+            if requesters is not None:
+                requesters.discard(peer)
+            return
+        self.retrieved_blocks += 1
+        sources = self._block_sources.get(piece_index)
+        if sources is None:
+            sources = self._block_sources[piece_index] = [None] * piece.num_blocks
+        sources[offset // BLOCK_SIZE] = peer
         if piece.all_blocks_retrieved():
-            print(f"Parça {piece_index} için tüm bloklar tamamlandı. Hash kontrol ediliyor...")
-            if piece.is_hash_correct():
-                print(f"Parça {piece_index} hash DOĞRU. Diske yazılıyor...")
-                self.write_piece_to_disk(piece)
-            else:
-                print(f"Parça {piece_index} hash YANLIŞ! Tekrar denenecek.")
-                # TODO: Parçanın durumunu sıfırla
+            # Hash hesaplaması iş parçacığı havuzunda yapılır; sonuç _piece_verified ile döner
+            self.verifier.submit_nowait(piece_index, piece.data, piece.piece_hash)
+        # Aynı bloğu bekleyen diğer peer'lerden gelecek kopyaları iptal et
+        requesters = self._block_requesters.pop(key, set())
+        requesters.discard(peer)
+        if requesters:
+            block = piece.block(offset // BLOCK_SIZE)
+            for other in requesters:
+                pending = self.pending_blocks.get(other)
+                if pending is not None:
+                    pending.discard(key)
+                handler = self._cancel_handlers.get(other)
+                if handler is not None:
+                    handler(block)
+
+    def is_backlogged(self):
+        """Doğrulama kuyruğu doluysa True; peer'ler bu durumda soket okumayı duraklatır."""
+        return self.verifier.is_full()
+
+    def add_backlog_waiter(self, callback):
+        self.verifier.add_drain_waiter(callback)
+
+    def _piece_verified(self, piece_index, is_correct):
+        piece = self.pieces[piece_index]
+        sources = self._block_sources.pop(piece_index, ())
+        if is_correct:
+            PIECES_VERIFIED.inc()
+            suspects = self._suspect_blocks.pop(piece_index, ())
+            culprits = {peer for block_index, peer, digest in suspects if self._block_digest(piece, block_index) != digest}
+            for peer in culprits:
+                self._record_corruption(peer)
+            self._mark_verified(piece_index)
+            self.write_piece_to_disk(piece)
+            return
+        logger.warning("Parça %d hash YANLIŞ! Tekrar denenecek.", piece_index)
+        HASH_FAILURES.inc()
+        contributors = {peer for peer in sources if peer is not None}
+        if len(contributors) == 1:
+            # Parçanın tamamı tek peer'den geldi: suçlu belli
+            self._record_corruption(contributors.pop())
+        elif contributors:
+            self._suspect_blocks.setdefault(piece_index, []).extend(
+                (block_index, peer, self._block_digest(piece, block_index))
+                for block_index, peer in enumerate(sources) if peer is not None
+            )
+        self.retrieved_blocks -= piece.reset()
+        self._reindex_piece(piece_index)
+        self._release_unused_buffer(piece)
+        self._wake_request_waiters()
+
+    @staticmethod
+    def _block_digest(piece, block_index):
+        block = piece.block(block_index)
+        return hashlib.sha1(piece.data[block.offset:block.offset + block.length]).digest()
+
+    def _record_corruption(self, peer):
+        if peer in self.banned_peers:
+            return
+        self.hash_failures[peer] += 1
+        if self.hash_failures[peer] >= MAX_HASH_FAILURES:
+            logger.warning("Peer %s:%d %d kez bozuk veri gönderdi, yasaklanıyor.", peer[0], peer[1], MAX_HASH_FAILURES)
+            self.banned_peers.add(peer)
+            if self.on_ban is not None:
+                self.on_ban(peer)
+
+    def _mark_verified(self, piece_index):
+        if not self.verified_pieces[piece_index]:
+            self.verified_pieces[piece_index] = 1
+            self.verified_count += 1
+            self.verified_bytes += self.pieces[piece_index].length
+
+    async def open(self):
+        """Torrent dosyalarını açar; diğer disk işlemlerinden önce çağrılmalıdır."""
+        await self.storage.open()
+
+    async def check_existing_data(self):
+        """Fast-resume kaydı geçerliyse onu kullanır, değilse diskteki mevcut veriyi paralel olarak yeniden kontrol eder."""
+        indices = self.resume.load(self.storage.fingerprint(), len(self.pieces))
+        if indices is not None:
+            logger.info("Fast-resume kaydı geçerli: %d parça diskte hazır.", len(indices))
+        elif self.storage.had_existing_data:
+            logger.info("Fast-resume kaydı geçersiz, mevcut veri yeniden kontrol ediliyor...")
+            indices = await self._recheck()
+            logger.info("Yeniden kontrol tamamlandı: %d parça doğru.", len(indices))
+        for index in indices or []:
+            self.retrieved_blocks += self.pieces[index].mark_all_retrieved()
+            self._reindex_piece(index)
+            self._mark_verified(index)
+            self.storage.written_pieces.add(index)
+
+    async def _recheck(self):
+        loop = asyncio.get_running_loop()
+        piece_length = self.torrent_data[b'info'][b'piece length']
+        # Her parça mmap üzerinden, tüm çekirdeklere yayılmış iş parçacıklarında hash'lenir
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='recheck') as pool:
+            digests = await asyncio.gather(*(
+                loop.run_in_executor(pool, self.storage.hash_range, piece.index * piece_length, piece.length)
+                for piece in self.pieces
+            ))
+        return [piece.index for piece, digest in zip(self.pieces, digests) if digest == piece.piece_hash]
+
+    async def save_resume(self):
+        try:
+            await self.storage.flush()
+        except OSError:
+            # Yazılamayan parçalar written_pieces'ta yok; kayıt yalnızca diske inenleri içerir
+            pass
+        self.resume.save(self.storage.fingerprint(), self.storage.written_pieces, len(self.pieces))
+
+    def has_piece(self, index):
+        """Parça doğrulanıp diske yazıldıysa (peer'lere gönderilebilirse) True."""
+        return index in self.storage.written_pieces
+
+    def has_all(self):
+        """Tüm parçalar diske yazıldıysa (Have All gönderilebilirse) True."""
+        return len(self.storage.written_pieces) == len(self.pieces)
+
+    def bitfield(self):
+        """Sunabileceğimiz parçaların bitfield'ı; hiç parça yoksa None."""
+        if not self.storage.written_pieces:
+            return None
+        bitfield = bytearray((len(self.pieces) + 7) // 8)
+        for index in self.storage.written_pieces:
+            bitfield[index >> 3] |= 0x80 >> (index & 7)
+        return bytes(bitfield)
+
+    async def read_block(self, index, offset, length):
+        """Peer'e gönderilecek bloğu döndürür; parça bizde yoksa ya da aralık geçersizse None."""
+        if not self.has_piece(index) or offset < 0 or offset + length > self.pieces[index].length:
+            return None
+        try:
+            return await self.read_cache.read_block(index, offset, length)
+        except OSError as e:
+            logger.error("Parça %d diskten okunamadı: %s", index, e)
+            return None
 
     def write_piece_to_disk(self, piece):
-        offset = piece.index * self.torrent_data[b'info'][b'piece length']
-        self.output_file.seek(offset)
-        self.output_file.write(piece.data)
+        self.storage.write_piece(piece.index, piece.data)
+
+    def _pieces_written(self, indices):
+        # Diske yazılan parçaların tamponlarını havuza geri ver
+        for index in indices:
+            piece = self.pieces[index]
+            if piece.data is not None:
+                self.buffer_pool.release(piece.detach_buffer())
+            if self.on_have is not None:
+                self.on_have(index)
+            self._urgent_pieces.pop(index, None)
+            for future in self._piece_waiters.pop(index, ()):
+                if not future.done():
+                    future.set_result(None)
+        self._wake_request_waiters()
+
+    def _wake_request_waiters(self):
+        # Aynı döngü turundaki tüm uyandırmalar tek seferde yapılır (ör. kopan peer'in yüzlerce bloğu geri alınırken)
+        if self._request_waiters and not self._wake_scheduled:
+            self._wake_scheduled = True
+            asyncio.get_running_loop().call_soon(self._run_request_waiters)
+
+    def _run_request_waiters(self):
+        self._wake_scheduled = False
+        if self.buffer_pool.can_acquire():
+            self.buffer_starved = False
+        waiters, self._request_waiters = self._request_waiters, set()
+        for callback in waiters:
+            callback()
 
     def is_complete(self):
-        return all(p.all_blocks_retrieved() and p.is_hash_correct() for p in self.pieces)
+        return self.verified_count == len(self.pieces)
     
     def get_downloaded_percentage(self):
-        retrieved_blocks = sum(p._block_states.count(BLOCK_RETRIEVED) for p in self.pieces)
-        total_blocks = sum(len(p.blocks) for p in self.pieces)
-        return (retrieved_blocks / total_blocks) * 100 if total_blocks > 0 else 0
+        return (self.retrieved_blocks / self.total_blocks) * 100 if self.total_blocks > 0 else 0
+
+    def _collect_hash_queue(self):
+        yield self._labels, self.verifier.in_flight
 
-    def close(self):
-        self.output_file.close()
\ No newline at end of file
+    def _collect_disk_queue(self):
+        yield self._labels, self.storage.queued_writes
+
+    def _collect_buffers(self):
+        yield self._labels, self.buffer_pool.in_use
+
+    def _collect_progress(self):
+        yield self._labels, self.verified_bytes / self.total_length if self.total_length else 1.0
+
+    async def close(self):
+        REGISTRY.remove_collector('torrent_hash_queue_depth', self._collect_hash_queue)
+        REGISTRY.remove_collector('torrent_disk_queue_depth', self._collect_disk_queue)
+        REGISTRY.remove_collector('torrent_piece_buffers_in_use', self._collect_buffers)
+        REGISTRY.remove_collector('torrent_progress_ratio', self._collect_progress)
+        # Kapanan torrent'i bekleyen okuyucular iptal edilir
+        for waiters in self._piece_waiters.values():
+            for future in waiters:
+                future.cancel()
+        self._piece_waiters.clear()
+        self._urgent_pieces.clear()
+        await self.verifier.close()
+        await self.save_resume()
+        await self.storage.close()
+        for piece in self.pieces:
+            piece.detach_buffer()
+        self.buffer_pool.close()
\ No newline at end of file
@@ -0,0 +1,215 @@
+import asyncio
+import struct
+
+HANDSHAKE_LENGTH = 68
+RECV_BUFFER_SIZE = 256 * 2**10 # Alım tamponunun başlangıç boyutu (byte)
+PIECE_MESSAGE_ID = 7
+# Kabul edilen en uzun mesaj (uzunluk alanı hariç): 128 KiB'lik blok + Piece başlığı. Daha uzununu bildiren
+# peer'in bağlantısı kapatılır; tampon karşı tarafın yazdığı uzunluğa göre büyütülmez. Büyük torrent'lerde
+# bitfield için handler bu sınırı yükseltir
+MAX_MESSAGE_LENGTH = 9 + 2**17
+# Sabit alanlı mesajların en kısa payload'ları; daha kısası gelirse bağlantı kapatılır
+_MIN_PAYLOAD = {
+    4: 4,   # Have
+    6: 12,  # Request
+    7: 8,   # Piece
+    8: 12,  # Cancel
+    9: 2,   # Port
+    13: 4,  # Suggest
+    16: 12, # Reject Request
+    17: 4,  # Allowed Fast
+    20: 1,  # Extended
+}
+
+_LENGTH = struct.Struct('>I')
+_PIECE_HEADER = struct.Struct('>II') # piece index, block offset
+_HANDSHAKE = struct.Struct('>B19s8s20s20s')
+
+class PeerWireProtocol(asyncio.BufferedProtocol):
+    """BitTorrent mesajlarını memoryview üzerinde ayrıştıran, blok verisini doğrudan parça tamponuna alan çerçeveleyici.
+
+    handler nesnesinin şu metodları olmalıdır:
+      handshake_received(reserved, info_hash, peer_id)
+      message_received(message_id, payload)   # payload sadece çağrı süresince geçerli bir memoryview
+      block_target(piece_index, block_offset, length) -> memoryview veya None
+      block_received(piece_index, block_offset, length)  # veri block_target'a yazıldıktan sonra
+      connection_lost(exc)
+    """
+
+    def __init__(self, handler, max_message_length: int = MAX_MESSAGE_LENGTH):
+        self.handler = handler
+        self.max_message_length = max_message_length
+        self.transport = None
+        self._loop = asyncio.get_running_loop()
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._start = 0
+        self._end = 0
+        self._handshake_pending = True
+        # Doğrudan parça tamponuna alınan blok: [hedef, dolan, toplam, piece_index, block_offset]
+        self._direct = None
+        self._direct_abandoned = False # True ise gelen blok verisi atılır (blok başka peer'den alındı)
+        self._outgoing = []
+        self._flush_scheduled = False
+        self._write_paused = False
+        self._drain_waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self._outgoing.clear()
+        self._wake_drain_waiter()
+        self.handler.connection_lost(exc)
+
+    # --- Alım tarafı ---
+
+    def get_buffer(self, sizehint):
+        if self._direct is not None:
+            target, filled = self._direct[0], self._direct[1]
+            return target[filled:]
+        if self._end == len(self._buffer):
+            self._make_room(1)
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        if self._direct is not None:
+            self._direct[1] += nbytes
+            _, filled, total, piece_index, block_offset = self._direct
+            if filled == total:
+                self._direct = None
+                if self._direct_abandoned:
+                    self._direct_abandoned = False
+                else:
+                    self.handler.block_received(piece_index, block_offset, total)
+            return
+        self._end += nbytes
+        self._parse()
+
+    def _make_room(self, needed):
+        # Okunmamış veriyi tamponun başına taşı; mesaj tampondan büyükse yeni (daha büyük) tampon ayır
+        pending = self._end - self._start
+        if needed > len(self._buffer) - pending or self._start == 0:
+            size = max(len(self._buffer), pending + needed)
+            new_buffer = bytearray(size)
+            new_buffer[:pending] = self._buffer[self._start:self._end]
+            self._buffer = new_buffer
+        else:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def _parse(self):
+        buffer = self._buffer
+        # Handler bağlantıyı kapattıysa (ör. yasaklama, protokol ihlali) tamponda kalan mesajlar işlenmez;
+        # transport ancak connection_lost'ta temizlenir, o zamana kadar kopmuş peer'in durumu yeniden oluşabilir
+        while self.transport is not None and not self.transport.is_closing():
+            available = self._end - self._start
+            if self._handshake_pending:
+                if available < HANDSHAKE_LENGTH:
+                    break
+                _, _, reserved, info_hash, peer_id = _HANDSHAKE.unpack_from(buffer, self._start)
+                self._start += HANDSHAKE_LENGTH
+                self._handshake_pending = False
+                self.handler.handshake_received(reserved, info_hash, peer_id)
+                continue
+            if available < 4:
+                break
+            length = _LENGTH.unpack_from(buffer, self._start)[0]
+            if length == 0: # keep-alive
+                self._start += 4
+                continue
+            if length > self.max_message_length:
+                self.close()
+                break
+            if available >= 13 and buffer[self._start + 4] == PIECE_MESSAGE_ID and length > 9:
+                piece_index, block_offset = _PIECE_HEADER.unpack_from(buffer, self._start + 5)
+                block_length = length - 9
+                target = self.handler.block_target(piece_index, block_offset, block_length)
+                if target is not None:
+                    # Tamponda olan kısmı kopyala, kalanını soket doğrudan hedefe yazsın
+                    data_start = self._start + 13
+                    have = min(available - 13, block_length)
+                    with memoryview(buffer) as view:
+                        target[:have] = view[data_start:data_start + have]
+                    self._start = data_start + have
+                    if have == block_length:
+                        self.handler.block_received(piece_index, block_offset, block_length)
+                        continue
+                    self._direct = [target, have, block_length, piece_index, block_offset]
+                    break
+            if available < 4 + length:
+                if 4 + length > len(self._buffer) - self._start:
+                    self._make_room(4 + length - available)
+                    buffer = self._buffer
+                break
+            message_start = self._start
+            self._start += 4 + length
+            if length - 1 < _MIN_PAYLOAD.get(buffer[message_start + 4], 0):
+                self.close()
+                break
+            with memoryview(buffer) as view:
+                payload = view[message_start + 5:message_start + 4 + length]
+                try:
+                    self.handler.message_received(buffer[message_start + 4], payload)
+                finally:
+                    payload.release()
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def abandon_block(self, piece_index: int, block_offset: int):
+        """Doğrudan alınmakta olan blok artık istenmiyorsa kalan veriyi parça tamponu yerine geçici bir tampona yönlendirir."""
+        if self._direct is not None and self._direct[3] == piece_index and self._direct[4] == block_offset:
+            self._direct[0] = memoryview(bytearray(self._direct[2]))
+            self._direct_abandoned = True
+
+    def pause_reading(self):
+        if self.transport is not None:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self.transport is not None:
+            self.transport.resume_reading()
+
+    # --- Gönderim tarafı ---
+
+    def send(self, data: bytes):
+        """Mesajı kuyruğa ekler; aynı döngü turunda biriken mesajlar tek bir write ile gönderilir."""
+        if self.transport is None:
+            return
+        self._outgoing.append(data)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self.transport is None or self.transport.is_closing():
+            self._outgoing.clear()
+            return
+        outgoing, self._outgoing = self._outgoing, []
+        self.transport.writelines(outgoing)
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._wake_drain_waiter()
+
+    def _wake_drain_waiter(self):
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+        self._drain_waiter = None
+
+    async def drain(self):
+        """Soketin gönderim tamponu dolmuşsa boşalana (ya da bağlantı kapanana) kadar bekler."""
+        if self._write_paused and self.transport is not None:
+            if self._drain_waiter is None:
+                self._drain_waiter = self._loop.create_future()
+            await asyncio.shield(self._drain_waiter)
+
+    def close(self):
+        if self.transport is not None and not self.transport.is_closing():
+            self._flush()
+            self.transport.close()
@@ -0,0 +1,58 @@
+import time
+
+BURST_SECONDS = 0.5 # Boşta kalan bir kovada biriktirilebilecek en fazla jeton: bu kadar saniyelik hız
+MIN_BURST = 2**14 # Çok düşük sınırlarda bile en az bir blokluk jeton birikebilsin
+
+class TokenBucket:
+    """Hiyerarşik jeton kovası hız sınırlayıcısı (byte/s).
+
+    Kovalar zincir halindedir (peer -> torrent -> genel); harcanan her byte zincirdeki tüm sınırlı
+    kovalardan düşülür. Kova eksiye düşebilir (borç): bir blok jeton varken gönderilir, sonraki blok
+    borç ödenene kadar bekler. rate 0 ise kova sınırsızdır; set_rate ile çalışırken değiştirilebilir.
+    """
+
+    def __init__(self, rate: float = 0, parent: 'TokenBucket' = None):
+        self.parent = parent
+        self.rate = 0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def capacity(self) -> float:
+        return max(MIN_BURST, self.rate * BURST_SECONDS)
+
+    def set_rate(self, rate: float):
+        self._refill()
+        if rate and not self.rate:
+            # Sınırsızdan sınırlıya geçiş: dolu bir kovayla başla
+            self._tokens = max(MIN_BURST, rate * BURST_SECONDS)
+        self.rate = rate
+        if rate:
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount: int):
+        bucket = self
+        while bucket is not None:
+            if bucket.rate:
+                bucket._refill()
+                bucket._tokens -= amount
+            bucket = bucket.parent
+
+    def delay(self) -> float:
+        """Zincirdeki tüm kovalarda harcanabilir jeton oluşana kadar beklenmesi gereken süre; 0 ise hemen harcanabilir."""
+        wait = 0.0
+        bucket = self
+        while bucket is not None:
+            if bucket.rate:
+                bucket._refill()
+                if bucket._tokens < 1:
+                    wait = max(wait, (1 - bucket._tokens) / bucket.rate)
+            bucket = bucket.parent
+        return wait
@@ -0,0 +1,45 @@
+import asyncio
+from collections import OrderedDict
+
+READ_CACHE_MEMORY = 32 * 2**20 # Seed edilen parçalar için ayrılan okuma önbelleği (byte)
+
+class ReadCache:
+    """Peer'lere gönderilen parçaları diskten bütün olarak okuyup en son kullanılma sırasına göre bellekte tutar.
+
+    Bloklar önbellekteki parçanın kopyasız dilimleri olarak verilir; aynı parça için eşzamanlı
+    istekler tek bir disk okumasını bekler.
+    """
+
+    def __init__(self, storage, max_memory: int = READ_CACHE_MEMORY):
+        self.storage = storage
+        self.max_pieces = max(1, max_memory // storage.piece_length)
+        self._pieces = OrderedDict() # parça indeksi -> bytes
+        self._loading = {} # parça indeksi -> okuma görevi
+        self.hits = 0
+        self.misses = 0
+
+    async def read_block(self, index: int, offset: int, length: int) -> memoryview:
+        data = self._pieces.get(index)
+        if data is not None:
+            self._pieces.move_to_end(index)
+            self.hits += 1
+        else:
+            self.misses += 1
+            task = self._loading.get(index)
+            if task is None:
+                task = self._loading[index] = asyncio.ensure_future(self.storage.read_piece(index))
+                task.add_done_callback(lambda _: self._loading.pop(index, None))
+            # Bekleyenlerden biri iptal edilse bile okuma diğerleri için sürsün
+            data = await asyncio.shield(task)
+            self._store(index, data)
+        return memoryview(data)[offset:offset + length]
+
+    def _store(self, index: int, data: bytes):
+        if index in self._pieces:
+            return
+        self._pieces[index] = data
+        while len(self._pieces) > self.max_pieces:
+            self._pieces.popitem(last=False)
+
+    def clear(self):
+        self._pieces.clear()
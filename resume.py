@@ -0,0 +1,38 @@
+import os
+from bencoding import BDecoder, BEncoder
+
+RESUME_SUFFIX = '.fastresume'
+
+class FastResume:
+    """Doğrulanmış parça bitfield'ını ve dosya parmak izini (boyut, mtime) saklayan fast-resume dosyası."""
+
+    def __init__(self, path: str, info_hash: bytes = b''):
+        self.path = path
+        self.info_hash = info_hash
+
+    def load(self, fingerprint: list, num_pieces: int):
+        """Kayıt geçerliyse doğrulanmış parça indekslerini, değilse None döndürür."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = BDecoder(f.read()).decode()
+        except (OSError, EOFError, TypeError, IndexError, ValueError):
+            return None
+        if data.get(b'info-hash', b'') != self.info_hash:
+            return None
+        if data.get(b'files') != fingerprint:
+            return None
+        bitfield = data.get(b'pieces', b'')
+        if len(bitfield) != (num_pieces + 7) // 8:
+            return None
+        return [index for index in range(num_pieces) if bitfield[index >> 3] & (0x80 >> (index & 7))]
+
+    def save(self, fingerprint: list, piece_indices, num_pieces: int):
+        bitfield = bytearray((num_pieces + 7) // 8)
+        for index in piece_indices:
+            bitfield[index >> 3] |= 0x80 >> (index & 7)
+        encoded = BEncoder({b'info-hash': self.info_hash, b'files': fingerprint, b'pieces': bytes(bitfield)}).encode()
+        # Yarım yazılmış bir kayıt bırakmamak için önce geçici dosyaya yaz, sonra atomik olarak değiştir
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_path, self.path)
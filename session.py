@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import aiohttp
+from client import TorrentClient
+from peer_manager import ConnectionBudget
+from protocol import PeerWireProtocol
+from tracker import LISTEN_PORT, REQUEST_TIMEOUT as TRACKER_TIMEOUT
+from metrics import MetricsServer
+from rate_limiter import TokenBucket
+
+MAX_CONNECTIONS = 500 # Tüm torrent'lerde aynı anda açık tutulabilecek en fazla peer bağlantısı
+MAX_PENDING_HANDSHAKES = 64 # Handshake'i henüz gelmemiş gelen bağlantı sayısı sınırı
+INBOUND_HANDSHAKE_TIMEOUT = 10 # Gelen bağlantı bu sürede handshake göndermezse kapatılır (saniye)
+TRACKER_HTTP_CONNECTIONS = 32 # Tüm torrent'lerin paylaştığı tracker HTTP havuzunun boyutu
+
+logger = logging.getLogger(__name__)
+
+class _InboundHandshake:
+    """Gelen bağlantının handshake'ini bekleyen geçici handler; info_hash gelince bağlantıyı ilgili torrent'e devreder."""
+
+    def __init__(self, session):
+        self.session = session
+        self.protocol = None
+        self._timeout = None
+
+    def start(self, protocol: PeerWireProtocol):
+        self.protocol = protocol
+        self._timeout = asyncio.get_running_loop().call_later(INBOUND_HANDSHAKE_TIMEOUT, protocol.close)
+
+    def handshake_received(self, reserved: bytes, info_hash: bytes, peer_id: bytes):
+        self._finish()
+        self.session._route(self.protocol, reserved, info_hash, peer_id)
+
+    def message_received(self, message_id: int, payload: memoryview):
+        pass
+
+    def block_target(self, piece_index: int, block_offset: int, length: int):
+        return None
+
+    def block_received(self, piece_index: int, block_offset: int, length: int):
+        pass
+
+    def connection_lost(self, exc):
+        self._finish()
+
+    def _finish(self):
+        if self._timeout is not None:
+            self._timeout.cancel()
+            self._timeout = None
+            self.session._pending_handshakes.discard(self)
+
+class Session:
+    """Birçok torrent'i tek bir olay döngüsünde çalıştırır.
+
+    Tüm torrent'ler tek bir dinleyen soketi (gelen handshake'ler info_hash'e göre yönlendirilir),
+    ortak bir bağlantı/dosya tanımlayıcısı bütçesini, tracker HTTP havuzunu ve metrik sunucusunu paylaşır.
+    """
+
+    def __init__(self, listen_port: int = LISTEN_PORT, max_connections: int = MAX_CONNECTIONS, metrics_port=None,
+                 listen_host: str = None, upload_rate: float = 0, download_rate: float = 0):
+        self.listen_port = listen_port
+        self.listen_host = listen_host # None: tüm arayüzler
+        self.budget = ConnectionBudget(max_connections)
+        # Tüm torrent'lerin toplam hız sınırları (byte/s, 0 = sınırsız); set_rate ile çalışırken değiştirilebilir
+        self.upload_limiter = TokenBucket(upload_rate)
+        self.download_limiter = TokenBucket(download_rate)
+        self.torrents = {} # info_hash -> TorrentClient
+        self._tasks = {} # info_hash -> client.start() görevi
+        self._pending_handshakes = set()
+        self._server = None
+        self._http_session = None
+        # Verilirse tüm torrent'lerin metrikleri bu yerel portta sunulur
+        self.metrics_server = MetricsServer(metrics_port) if metrics_port is not None else None
+
+    async def start(self):
+        self._http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=TRACKER_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=TRACKER_HTTP_CONNECTIONS)
+        )
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        loop = asyncio.get_running_loop()
+        try:
+            self._server = await loop.create_server(self._make_protocol, self.listen_host, self.listen_port)
+            if self.listen_port == 0:
+                self.listen_port = self._server.sockets[0].getsockname()[1]
+            logger.info("Gelen peer bağlantıları %d portunda kabul ediliyor.", self.listen_port)
+        except OSError as e:
+            # Port kullanımdaysa yalnızca giden bağlantılarla devam edilir
+            logger.warning("%d portu dinlenemedi, gelen bağlantılar kabul edilmeyecek: %r", self.listen_port, e)
+
+    def add_torrent(self, torrent_data, info_hash=None, seed=False, workers=0) -> TorrentClient:
+        """Torrent'i oturuma ekler ve arka planda çalıştırmaya başlar.
+
+        workers > 0 ise torrent'in peer bağlantıları o kadar worker sürecinde çalışır (bkz. workers.py);
+        bu bağlantılar oturumun bütçesinden ve genel hız sınırlarından bağımsızdır.
+        """
+        client = TorrentClient(torrent_data, info_hash=info_hash, seed=seed, http_session=self._http_session,
+                               budget=self.budget, listen_port=self.listen_port,
+                               upload_limiter=self.upload_limiter, download_limiter=self.download_limiter,
+                               workers=workers)
+        info_hash = client.tracker.info_hash
+        if info_hash in self.torrents:
+            raise ValueError("Bu torrent oturuma zaten eklenmiş")
+        # Her dosya bir tanımlayıcı, doğrulama için açılan mmap'i de bir tane daha tutar
+        file_descriptors = 2 * len(client.piece_manager.storage.files)
+        self.budget.reserve_files(file_descriptors)
+        self.torrents[info_hash] = client
+        task = self._tasks[info_hash] = asyncio.create_task(client.start())
+        task.add_done_callback(lambda _: self._torrent_finished(info_hash, file_descriptors))
+        return client
+
+    def set_rate_limits(self, upload_rate=None, download_rate=None):
+        """Genel hız sınırlarını (byte/s, 0 = sınırsız) çalışırken değiştirir."""
+        if upload_rate is not None:
+            self.upload_limiter.set_rate(upload_rate)
+        if download_rate is not None:
+            self.download_limiter.set_rate(download_rate)
+
+    def _torrent_finished(self, info_hash: bytes, file_descriptors: int):
+        self.torrents.pop(info_hash, None)
+        task = self._tasks.pop(info_hash, None)
+        self.budget.release_files(file_descriptors)
+        if task is not None and not task.cancelled() and task.exception() is not None:
+            logger.error("Torrent %s hatayla sonlandı: %r", info_hash.hex(), task.exception())
+
+    async def run(self):
+        """Tüm torrent'ler bitene (seed edilenler için: iptal edilene) kadar bekler."""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks.values()))
+
+    def _make_protocol(self) -> PeerWireProtocol:
+        handshake = _InboundHandshake(self)
+        protocol = PeerWireProtocol(handshake)
+        if len(self._pending_handshakes) >= MAX_PENDING_HANDSHAKES or self.budget.available <= 0:
+            # Soket connection_made'den sonra kapatılabilir
+            asyncio.get_running_loop().call_soon(protocol.close)
+            return protocol
+        handshake.start(protocol)
+        self._pending_handshakes.add(handshake)
+        return protocol
+
+    def _route(self, protocol: PeerWireProtocol, reserved: bytes, info_hash: bytes, peer_id: bytes):
+        client = self.torrents.get(info_hash)
+        if client is None or protocol.transport is None or peer_id == client.tracker.peer_id:
+            protocol.close()
+            return
+        ip, port = protocol.transport.get_extra_info('peername')[:2]
+        if not client.peer_manager.add_inbound(ip, port, protocol, reserved, peer_id):
+            protocol.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        for handshake in list(self._pending_handshakes):
+            handshake.protocol.close()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
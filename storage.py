@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import REGISTRY
+
+DISK_THREADS = 1 # Disk yazmaları için ayrılan iş parçacığı sayısı
+MAX_COALESCED_WRITE = 16 * 2**20 # Tek bir birleşik yazmanın en fazla boyutu (byte)
+WRITE_RETRY_DELAY = 5 # Başarısız disk yazması (ör. disk dolu) bu kadar saniye sonra yeniden denenir
+
+DISK_QUEUE_SECONDS = REGISTRY.histogram('torrent_disk_queue_seconds', "Doğrulanan parçanın yazma kuyruğuna girmesinden diske yazılmasına kadar geçen süre")
+DISK_WRITE_SECONDS = REGISTRY.histogram('torrent_disk_write_seconds', "Tek bir birleşik disk yazmasının süresi")
+DISK_READ_SECONDS = REGISTRY.histogram('torrent_disk_read_seconds', "Peer'lere gönderilecek parçanın diskten okunma süresi")
+DISK_BYTES_WRITTEN = REGISTRY.counter('torrent_disk_written_bytes_total', "Diske yazılan toplam veri")
+DISK_WRITE_ERRORS = REGISTRY.counter('torrent_disk_write_errors_total', "Başarısız disk yazmaları")
+
+logger = logging.getLogger(__name__)
+
+class Storage:
+    """Torrent'in dosya listesini tek bir sürekli bayt alanı gibi yöneten disk katmanı."""
+
+    def __init__(self, info: dict, base_dir: str = '.', on_written=None):
+        self.files = self._build_file_list(info, base_dir)
+        self.total_length = sum(length for _, length in self.files)
+        self.piece_length = info[b'piece length']
+        # Her dosyanın torrent içindeki başlangıç offset'i (bisect ile aralık eşlemesi için)
+        self._file_offsets = []
+        offset = 0
+        for _, length in self.files:
+            self._file_offsets.append(offset)
+            offset += length
+        # Önceki bir çalışmadan kalan veri var mı? (varsa yeniden kontrol edilmeye değer); open() ile belirlenir
+        self.had_existing_data = False
+        self._fds = []
+        self._executor = ThreadPoolExecutor(max_workers=DISK_THREADS, thread_name_prefix='disk')
+        self._pending_writes = {} # piece index -> veri
+        self._enqueued_at = {} # piece index -> yazma kuyruğuna girme zamanı
+        self._flush_task = None
+        self._retry_handle = None
+        self.write_error = None # Son yazma denemesi başarısızsa hata; yazılamayan parçalar kuyrukta kalır
+        self._mmaps = {} # dosya indeksi -> salt okunur mmap (yeniden kontrol için)
+        self._mmap_lock = threading.Lock()
+        self.written_pieces = set() # Diske yazılması tamamlanmış parçalar
+        self.on_written = on_written # on_written(parça indeksleri) yazma bitince olay döngüsünde çağrılır
+
+    @staticmethod
+    def _build_file_list(info: dict, base_dir: str) -> list:
+        name = info[b'name'].decode('utf-8')
+        # Ad, indirme dizini ve fast-resume/peer önbelleği dosya adlarının önekidir; dizin dışına çıkamamalı
+        if not Storage._is_safe_part(name):
+            raise ValueError(f"Geçersiz torrent adı: {name!r}")
+        if b'files' not in info:
+            return [(os.path.join(base_dir, name), info[b'length'])]
+        files = []
+        for file in info[b'files']:
+            parts = [part.decode('utf-8') for part in file[b'path']]
+            if not all(Storage._is_safe_part(part) for part in parts):
+                raise ValueError(f"Geçersiz dosya yolu: {parts}")
+            files.append((os.path.join(base_dir, name, *parts), file[b'length']))
+        return files
+
+    @staticmethod
+    def _is_safe_part(part: str) -> bool:
+        return part not in ('', '.', '..') and os.sep not in part and not (os.altsep and os.altsep in part)
+
+    async def open(self):
+        """Dosyaları disk iş parçacığında açar ve önceden ayırır.
+
+        Ayırma, dosya sistemi fallocate desteklemiyorsa sıfır yazılarak yapılır ve büyük torrent'lerde
+        dakikalar sürebilir; bu sırada olay döngüsü (ve aynı oturumdaki diğer torrent'ler) beklemez.
+        """
+        if not self._fds:
+            self._fds = await asyncio.get_running_loop().run_in_executor(self._executor, self._open_files)
+
+    def _open_files(self) -> list:
+        self.had_existing_data = any(os.path.exists(path) and os.path.getsize(path) > 0 for path, _ in self.files)
+        return [self._open_and_preallocate(path, length) for path, length in self.files]
+
+    @staticmethod
+    def _open_and_preallocate(path: str, length: int) -> int:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        size = os.fstat(fd).st_size
+        if size > length:
+            os.ftruncate(fd, length)
+        elif size < length:
+            # Mümkünse blokları gerçekten ayır (fallocate), değilse seyrek (sparse) dosya oluştur
+            try:
+                os.posix_fallocate(fd, size, length - size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, length)
+        return fd
+
+    def map_range(self, offset: int, length: int):
+        """Torrent içindeki [offset, offset+length) aralığını (dosya indeksi, dosya offset'i, uzunluk) parçalarına böler."""
+        index = bisect.bisect_right(self._file_offsets, offset) - 1
+        while length > 0 and index < len(self.files):
+            file_start = self._file_offsets[index]
+            file_length = self.files[index][1]
+            position = offset - file_start
+            chunk = min(length, file_length - position)
+            if chunk > 0:
+                yield index, position, chunk
+                offset += chunk
+                length -= chunk
+            index += 1
+
+    def _write_at(self, offset: int, buffers: list):
+        # Ardışık tamponları dosya sınırlarına göre bölüp tek pwritev çağrısı ile yaz
+        views = [memoryview(buffer) for buffer in buffers]
+        total = sum(len(view) for view in views)
+        for file_index, position, chunk in self.map_range(offset, total):
+            segment = []
+            remaining = chunk
+            while remaining:
+                view = views[0]
+                if len(view) <= remaining:
+                    segment.append(view)
+                    views.pop(0)
+                    remaining -= len(view)
+                else:
+                    segment.append(view[:remaining])
+                    views[0] = view[remaining:]
+                    remaining = 0
+            self._pwritev(self._fds[file_index], segment, position)
+
+    @staticmethod
+    def _pwritev(fd: int, buffers: list, position: int):
+        if hasattr(os, 'pwritev'):
+            while buffers:
+                written = os.pwritev(fd, buffers, position)
+                position += written
+                # Kısmi yazma durumunda kalan tamponlarla devam et
+                while buffers and written >= len(buffers[0]):
+                    written -= len(buffers[0])
+                    buffers.pop(0)
+                if buffers and written:
+                    buffers[0] = buffers[0][written:]
+        else:
+            os.lseek(fd, position, os.SEEK_SET)
+            for buffer in buffers:
+                os.write(fd, buffer)
+
+    @property
+    def queued_writes(self) -> int:
+        """Yazma kuyruğunda bekleyen ya da yazılmakta olan parça sayısı."""
+        return len(self._enqueued_at)
+
+    def fingerprint(self) -> list:
+        """Her dosya için [boyut, mtime_ns]; fast-resume verisinin geçerliliğini kontrol etmek için."""
+        fingerprint = []
+        for fd in self._fds:
+            stat = os.fstat(fd)
+            fingerprint.append([stat.st_size, stat.st_mtime_ns])
+        return fingerprint
+
+    def hash_range(self, offset: int, length: int) -> bytes:
+        """Diskteki aralığın SHA-1 özetini kopyalamadan, mmap üzerinden hesaplar (iş parçacığı içinde çağrılır)."""
+        sha1 = hashlib.sha1()
+        for file_index, position, chunk in self.map_range(offset, length):
+            with self._mmap_lock:
+                mapped = self._mmaps.get(file_index)
+                if mapped is None:
+                    mapped = self._mmaps[file_index] = mmap.mmap(self._fds[file_index], 0, access=mmap.ACCESS_READ)
+            with memoryview(mapped) as view:
+                sha1.update(view[position:position + chunk])
+        return sha1.digest()
+
+    def read(self, offset: int, length: int) -> bytes:
+        chunks = []
+        for file_index, position, chunk in self.map_range(offset, length):
+            fd = self._fds[file_index]
+            if hasattr(os, 'pread'):
+                chunks.append(os.pread(fd, chunk, position))
+            else:
+                os.lseek(fd, position, os.SEEK_SET)
+                chunks.append(os.read(fd, chunk))
+        return b''.join(chunks)
+
+    async def read_piece(self, index: int) -> bytes:
+        """Parçayı olay döngüsü dışında okur; yazmalarla aynı iş parçacığında sıralandığı için yazılmış veriyi görür."""
+        offset = index * self.piece_length
+        length = min(self.piece_length, self.total_length - offset)
+        started = time.monotonic()
+        data = await asyncio.get_running_loop().run_in_executor(self._executor, self.read, offset, length)
+        DISK_READ_SECONDS.observe(time.monotonic() - started)
+        return data
+
+    def write_piece(self, index: int, data):
+        """Doğrulanmış parçayı yazma kuyruğuna ekler; yazma olay döngüsü dışında yapılır."""
+        self._pending_writes[index] = data
+        self._enqueued_at[index] = time.monotonic()
+        self._start_flush()
+
+    def _start_flush(self):
+        self._retry_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    def _coalesce(self, pending: dict) -> list:
+        # Ardışık parça indekslerini tek bir (offset, [tamponlar]) yazmasında birleştir
+        runs = []
+        last_index = None
+        for index in sorted(pending):
+            data = pending[index]
+            if runs and index == last_index + 1 and runs[-1][2] + len(data) <= MAX_COALESCED_WRITE:
+                runs[-1][1].append(data)
+                runs[-1][2] += len(data)
+            else:
+                runs.append([index * self.piece_length, [data], len(data)])
+            last_index = index
+        return [(offset, buffers) for offset, buffers, _ in runs]
+
+    def _write_runs(self, runs: list):
+        for offset, buffers in runs:
+            started = time.monotonic()
+            self._write_at(offset, buffers)
+            DISK_WRITE_SECONDS.observe(time.monotonic() - started)
+            DISK_BYTES_WRITTEN.inc(sum(len(buffer) for buffer in buffers))
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        # Bir yazma sürerken gelen parçalar bir sonraki turda birlikte yazılır
+        while self._pending_writes:
+            pending, self._pending_writes = self._pending_writes, {}
+            try:
+                await loop.run_in_executor(self._executor, self._write_runs, self._coalesce(pending))
+            except OSError as e:
+                # Parçalar kaybolmasın: kuyruğa geri konur, tamponları yazılana kadar tutulur ve yazma ertelenir
+                DISK_WRITE_ERRORS.inc()
+                logger.error("%d parça diske yazılamadı, %d sn sonra yeniden denenecek: %s", len(pending), WRITE_RETRY_DELAY, e)
+                self.write_error = e
+                self._pending_writes = {**pending, **self._pending_writes}
+                if self._retry_handle is None:
+                    self._retry_handle = loop.call_later(WRITE_RETRY_DELAY, self._start_flush)
+                return
+            self.write_error = None
+            self.written_pieces.update(pending)
+            now = time.monotonic()
+            for index in pending:
+                DISK_QUEUE_SECONDS.observe(now - self._enqueued_at.pop(index, now))
+            if self.on_written:
+                self.on_written(pending.keys())
+
+    async def flush(self):
+        """Kuyruktaki tüm parçaları yazar; yazılamayanlar varsa son hatayı (OSError) yükseltir."""
+        while self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._pending_writes:
+            await self._flush()
+        if self._pending_writes and self.write_error is not None:
+            raise self.write_error
+
+    async def close(self):
+        try:
+            await self.flush()
+        except OSError as e:
+            logger.error("Kapatılırken %d parça diske yazılamadı: %s", len(self._pending_writes), e)
+            self._pending_writes.clear()
+            self._enqueued_at.clear()
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+        self._executor.shutdown(wait=True)
+        for mapped in self._mmaps.values():
+            mapped.close()
+        self._mmaps = {}
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
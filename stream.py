@@ -0,0 +1,95 @@
+import os
+
+STREAM_WINDOW = 16 # Okuma imlecinin önünde öncelikli (sırayla) indirilecek parça sayısı
+
+class TorrentStream:
+    """Torrent verisini (ya da tek bir dosyasını) indirme bitmeden sırayla okur.
+
+    Okunacak parça henüz diske yazılmadıysa yazılana kadar beklenir. İmlecin bulunduğu parçadan başlayan
+    pencere nadir-parça-önce seçiminden önce istenir; seek ile pencere yeni konuma taşınır.
+    `async for chunk in stream` imleçten sona kadar en fazla parça boyutunda dilimler döndürür.
+    """
+
+    def __init__(self, piece_manager, offset: int = 0, length: int = None, window: int = STREAM_WINDOW, on_close=None):
+        self.piece_manager = piece_manager
+        self.piece_length = piece_manager.storage.piece_length
+        self.start = offset
+        self.length = piece_manager.total_length - offset if length is None else length
+        self.window = window
+        self.position = 0 # Akışın başına göre okuma imleci
+        self.closed = False
+        self._on_close = on_close
+        self._update_window()
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        if offset < 0:
+            raise ValueError("Negatif konuma seek yapılamaz")
+        self.position = offset
+        self._update_window()
+        return self.position
+
+    async def read(self, size: int = -1) -> bytes:
+        """İmleçten size byte okur (size < 0 ise sona kadar); akışın sonunda b'' döner."""
+        if self.closed:
+            raise ValueError("Kapalı akıştan okunamaz")
+        remaining = self.length - self.position
+        if size < 0 or size > remaining:
+            size = max(0, remaining)
+        chunks = []
+        while size > 0:
+            chunk = await self._read_piece(size)
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    async def _read_piece(self, size: int):
+        # İmlecin bulunduğu parçadan en fazla parçanın sonuna kadar okur
+        absolute = self.start + self.position
+        index, offset = divmod(absolute, self.piece_length)
+        length = min(size, self.piece_manager.pieces[index].length - offset)
+        await self.piece_manager.wait_for_piece(index)
+        data = await self.piece_manager.read_block(index, offset, length)
+        if data is None:
+            raise OSError(f"Parça {index} okunamadı")
+        self.position += length
+        if (self.start + self.position) // self.piece_length != index:
+            self._update_window()
+        return bytes(data)
+
+    def _update_window(self):
+        if self.closed or self.position >= self.length:
+            self.piece_manager.remove_stream_window(self)
+            return
+        first = (self.start + self.position) // self.piece_length
+        last = (self.start + self.length - 1) // self.piece_length
+        self.piece_manager.set_stream_window(self, first, min(self.window, last - first + 1))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        chunk = await self.read(self.piece_length - (self.start + self.position) % self.piece_length)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.piece_manager.remove_stream_window(self)
+        if self._on_close is not None:
+            self._on_close(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
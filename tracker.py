@@ -1,34 +1,91 @@
 import asyncio
 import hashlib
+import logging
 import random
 import secrets
+import time
 from urllib.parse import urlencode, urlparse
 import socket
 import struct
 
 import aiohttp
 from bencoding import BDecoder, BEncoder
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+ANNOUNCE_SECONDS = REGISTRY.histogram('torrent_tracker_announce_seconds', "Başarılı tracker duyurularının süresi")
+ANNOUNCE_FAILURES = REGISTRY.counter('torrent_tracker_announce_failures_total', "Başarısız tracker duyuruları")
+
+ANNOUNCE_DEADLINE = 10 # Tüm tracker'lara yapılan ilk duyurunun ortak zaman sınırı (saniye)
+REQUEST_TIMEOUT = 10 # Tek bir tracker isteği için zaman aşımı (saniye)
+DEFAULT_INTERVAL = 1800 # Tracker interval bildirmezse yeniden duyuru aralığı
+MIN_INTERVAL = 60 # Tracker ne derse desin bundan sık duyuru yapılmaz
+RETRY_INTERVAL = 60 # Başarısız duyurudan sonra ilk yeniden deneme süresi (her hatada iki katına çıkar)
+UDP_CONNECTION_ID_TTL = 60 # BEP 15: connection_id bir dakika geçerlidir
+DEAD_TRACKER_DELAY = 5 # Önceki çalışmada cevap vermeyen tracker'lara ilk duyuru bu kadar saniye sonra yapılır
+LISTEN_PORT = 6881
 
 class UDPTrackerProtocol(asyncio.DatagramProtocol):
-    def __init__(self, future: asyncio.Future):
-        self.future = future
+    """Tek bir UDP soketi üzerinden transaction_id ile eşleşen istek/cevap alışverişi yapar."""
+    def __init__(self):
         self.transport = None
+        self._waiters = {} # transaction_id -> future
     def connection_made(self, transport): self.transport = transport
     def datagram_received(self, data, addr):
-        if not self.future.done(): self.future.set_result(data)
-        self.transport.close()
-    def error_received(self, exc):
-        if not self.future.done(): self.future.set_exception(exc)
-        self.transport.close()
-    def connection_lost(self, exc):
-        if not self.future.done(): self.future.set_exception(exc or ConnectionError("UDP Bağlantısı koptu"))
+        if len(data) < 8: return
+        transaction_id = struct.unpack_from('>I', data, 4)[0]
+        future = self._waiters.pop(transaction_id, None)
+        if future is not None and not future.done(): future.set_result(data)
+    def error_received(self, exc): self._fail_all(exc)
+    def connection_lost(self, exc): self._fail_all(exc or ConnectionError("UDP Bağlantısı koptu"))
+    def _fail_all(self, exc):
+        for future in self._waiters.values():
+            if not future.done(): future.set_exception(exc)
+        self._waiters.clear()
+    async def request(self, packet: bytes, transaction_id: int, timeout: float) -> bytes:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[transaction_id] = future
+        try:
+            self.transport.sendto(packet)
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._waiters.pop(transaction_id, None)
+
+class TrackerState:
+    """Tek bir tracker'ın duyuru durumu."""
+    def __init__(self, url: str, tier: int):
+        self.url = url
+        self.tier = tier
+        self.interval = DEFAULT_INTERVAL
+        self.failures = 0
+        self.latency = None # Son başarılı duyurunun süresi (saniye)
+        self.last_announce = None
+        self.started_sent = False
+        self.initial_task = None
 
 class Tracker:
-    def __init__(self, torrent_data: dict):
+    def __init__(self, torrent_data: dict, info_hash: bytes = None, http_session: aiohttp.ClientSession = None,
+                 port: int = LISTEN_PORT):
         self.torrent_data = torrent_data
         self.peer_id = self._generate_peer_id()
-        self.info_hash = self._generate_info_hash()
+        # info_hash, .torrent dosyasındaki ham 'info' baytlarından hesaplanmış olarak verilebilir
+        self.info_hash = info_hash or self._generate_info_hash()
         self.total_length = self._calculate_total_length()
+        # Duyurularda bildirilen istatistikler; istemci tarafından güncellenir
+        self.uploaded = 0
+        self.downloaded = 0
+        self.left = self.total_length
+        self.trackers = [TrackerState(url, tier) for tier, url in self._tracker_urls()]
+        # Tüm tracker'lardan gelen peer'lerin tekilleştirilmiş canlı havuzu: (ip, port) -> ilk görülme zamanı
+        self.peer_pool = {}
+        self.on_peers = None # on_peers([(ip, port), ...]) yeni peer'ler geldiğinde çağrılır
+        self.port = port # Duyurularda bildirilen, gelen bağlantıların kabul edildiği port
+        # Session tarafından verilen HTTP havuzu başka torrent'lerle paylaşılır; kapatmak ona düşer
+        self._session = http_session
+        self._owns_session = http_session is None
+        self._udp_connections = {} # (host, port) -> (connection_id, son geçerlilik zamanı)
+        self._announce_tasks = []
+        self._closing = False
 
     def _generate_peer_id(self) -> bytes:
         return b'-PC0001-' + bytes(''.join(str(random.randint(0, 9)) for _ in range(12)), 'utf-8')
@@ -43,84 +100,202 @@ class Tracker:
         elif b'files' in info: return sum(file[b'length'] for file in info[b'files'])
         raise ValueError("Torrent 'info' sözlüğünde 'length' veya 'files' anahtarı bulunamadı.")
 
-    async def get_peers(self) -> list:
-        tracker_urls = []
-        if b'announce' in self.torrent_data: tracker_urls.append(self.torrent_data[b'announce'].decode('utf-8'))
+    def _tracker_urls(self) -> list:
+        urls = []
+        seen = set()
+        tiers = []
         if b'announce-list' in self.torrent_data:
-            for tier in self.torrent_data[b'announce-list']:
-                for url_bytes in tier:
-                    url = url_bytes.decode('utf-8')
-                    if url not in tracker_urls: tracker_urls.append(url)
-        for announce_url in tracker_urls:
-            try:
-                print(f"Tracker'a bağlanılıyor: {announce_url}")
-                if announce_url.startswith('http'): peers = await self._request_peers_from_http_tracker(announce_url)
-                elif announce_url.startswith('udp'): peers = await self._request_peers_from_udp_tracker(announce_url)
-                else:
-                    print(f"Desteklenmeyen tracker protokolü: {announce_url}"); continue
-                if peers:
-                    print(f"Başarılı! {announce_url} adresinden {len(peers)} peer alındı."); return peers
-            except Exception as e: print(f"Tracker {announce_url} ile bağlantı kurulamadı: {e}")
-        return []
-
-    async def _request_peers_from_http_tracker(self, announce_url: str) -> list:
-        params = {'info_hash': self.info_hash, 'peer_id': self.peer_id, 'port': 6881, 'uploaded': 0, 'downloaded': 0, 'left': self.total_length, 'compact': 1}
-        url = announce_url + '?' + urlencode(params)
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status != 200: raise ConnectionError(f"Tracker'dan hata kodu alındı: {response.status}")
-                tracker_response_bytes = await response.read()
-                tracker_data = BDecoder(tracker_response_bytes).decode()
-                peers_raw = tracker_data.get(b'peers', b''); peers = []
-                if isinstance(peers_raw, bytes): peers = [(peers_raw[i:i+4], peers_raw[i+4:i+6]) for i in range(0, len(peers_raw), 6)]
-                elif isinstance(peers_raw, list):
-                    for p in peers_raw:
-                        if p.get(b'ip') and p.get(b'port'): peers.append((socket.inet_aton(p[b'ip'].decode('utf-8')), struct.pack('>H', p[b'port'])))
-                return peers
-    
-    async def _request_peers_from_udp_tracker(self, announce_url: str) -> list:
-        parsed_url = urlparse(announce_url)
-        hostname = parsed_url.hostname
-        port = parsed_url.port or 6969
+            tiers = [[url.decode('utf-8') for url in tier] for tier in self.torrent_data[b'announce-list']]
+        if b'announce' in self.torrent_data:
+            tiers.insert(0, [self.torrent_data[b'announce'].decode('utf-8')])
+        for tier_index, tier in enumerate(tiers):
+            for url in tier:
+                if url not in seen:
+                    seen.add(url)
+                    urls.append((tier_index, url))
+        return urls
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Tüm HTTP duyuruları tek bir bağlantı havuzunu (keep-alive) paylaşır
+        if self._owns_session and (self._session is None or self._session.closed):
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self._session
+
+    def _merge_peers(self, peers: list) -> list:
+        new_peers = []
+        now = time.monotonic()
+        for peer in peers:
+            if peer[1] == 0 or peer in self.peer_pool:
+                continue
+            self.peer_pool[peer] = now
+            new_peers.append(peer)
+        if new_peers and self.on_peers:
+            self.on_peers(new_peers)
+        return new_peers
+
+    async def _announce(self, tracker: TrackerState) -> list:
+        event = '' if tracker.started_sent else 'started'
+        started = time.monotonic()
+        try:
+            logger.debug("Tracker'a bağlanılıyor: %s", tracker.url)
+            if tracker.url.startswith('http'): peers, interval = await self._request_peers_from_http_tracker(tracker.url, event)
+            elif tracker.url.startswith('udp'): peers, interval = await self._request_peers_from_udp_tracker(tracker.url, event)
+            else:
+                logger.warning("Desteklenmeyen tracker protokolü: %s", tracker.url)
+                tracker.failures += 1
+                return []
+        except Exception as e:
+            logger.warning("Tracker %s ile bağlantı kurulamadı: %s", tracker.url, e)
+            ANNOUNCE_FAILURES.inc()
+            tracker.failures += 1
+            return []
+        tracker.latency = time.monotonic() - started
+        ANNOUNCE_SECONDS.observe(tracker.latency)
+        tracker.started_sent = True
+        tracker.failures = 0
+        tracker.last_announce = time.monotonic()
+        tracker.interval = max(MIN_INTERVAL, interval or DEFAULT_INTERVAL)
+        logger.info("%s adresinden %d peer alındı.", tracker.url, len(peers))
+        self._merge_peers(peers)
+        return peers
+
+    def load_health(self, trackers: dict):
+        """Önceki çalışmadan kalan tracker sağlığını (bkz. peer_cache.py) yükler."""
+        for tracker in self.trackers:
+            state = trackers.get(tracker.url)
+            if state is not None:
+                tracker.failures = state['failures']
+                tracker.latency = state['latency']
+
+    def health(self) -> dict:
+        """Önbelleğe yazılacak tracker sağlığı: url -> {'failures', 'latency'}."""
+        health = {}
+        for tracker in self.trackers:
+            failures = tracker.failures
+            if tracker.initial_task is not None and tracker.last_announce is None and not failures:
+                # Bu çalışma boyunca hiç cevap vermedi (duyuru kapanışta iptal edildi)
+                failures = 1
+            health[tracker.url] = {'failures': failures, 'latency': tracker.latency}
+        return health
+
+    async def get_peers(self, deadline: float = ANNOUNCE_DEADLINE) -> list:
+        """Tüm tracker'lara aynı anda duyuru yapar; ilk peer'ler gelince ya da süre dolunca havuzu döndürür.
+
+        Yetişemeyen duyurular arka planda sürer, getirdikleri peer'ler on_peers ile bildirilir.
+        Son duyurusu başarısız olan tracker'lar, sağlıklı bir tracker varsa biraz geciktirilerek denenir.
+        """
+        tasks = []
+        any_healthy = any(not tracker.failures for tracker in self.trackers)
+        # Sağlıklı tracker'lar en hızlıdan başlayarak duyurulur
+        for tracker in sorted(self.trackers, key=lambda tracker: (tracker.failures, tracker.latency or 0)):
+            delay = DEAD_TRACKER_DELAY if any_healthy and tracker.failures else 0
+            tracker.initial_task = asyncio.create_task(self._initial_announce(tracker, delay))
+            tasks.append(tracker.initial_task)
+        self._announce_tasks.extend(tasks)
+        pending = set(tasks)
         loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        while pending and not self.peer_pool:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            _, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        return list(self.peer_pool)
 
+    async def _initial_announce(self, tracker: TrackerState, delay: float) -> list:
+        if delay:
+            await asyncio.sleep(delay)
+        return await self._announce(tracker)
+
+    def start_reannouncing(self):
+        """Her tracker'a kendi 'interval' değerine uyarak düzenli yeniden duyuru yapan görevleri başlatır."""
+        for tracker in self.trackers:
+            if tracker.url.startswith(('http', 'udp')):
+                self._announce_tasks.append(asyncio.create_task(self._reannounce_loop(tracker)))
+
+    async def _reannounce_loop(self, tracker: TrackerState):
+        if tracker.initial_task is not None:
+            # get_peers ile başlatılan ilk duyurunun bitmesini bekle, aynı tracker'a iki kez gitme
+            await asyncio.wait([tracker.initial_task])
+        # İptal, bir duyurunun hatasıyla aynı anda gelirse wait_for onu yutabilir; döngü bayrakla da sonlanır
+        while not self._closing:
+            if tracker.failures:
+                delay = min(DEFAULT_INTERVAL, RETRY_INTERVAL * 2 ** (tracker.failures - 1))
+            elif tracker.last_announce is None:
+                delay = 0
+            else:
+                delay = max(0, tracker.last_announce + tracker.interval - time.monotonic())
+            await asyncio.sleep(delay)
+            await self._announce(tracker)
+
+    async def close(self):
+        self._closing = True
+        for task in self._announce_tasks:
+            task.cancel()
+        await asyncio.gather(*self._announce_tasks, return_exceptions=True)
+        self._announce_tasks = []
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def _parse_compact_peers(peers_raw: bytes) -> list:
+        return [(socket.inet_ntoa(peers_raw[i:i+4]), struct.unpack('>H', peers_raw[i+4:i+6])[0]) for i in range(0, len(peers_raw) - 5, 6)]
+
+    async def _request_peers_from_http_tracker(self, announce_url: str, event: str = ''):
+        params = {'info_hash': self.info_hash, 'peer_id': self.peer_id, 'port': self.port, 'uploaded': self.uploaded, 'downloaded': self.downloaded, 'left': self.left, 'compact': 1}
+        if event: params['event'] = event
+        url = announce_url + ('&' if '?' in announce_url else '?') + urlencode(params)
+        async with self._get_session().get(url) as response:
+            if response.status != 200: raise ConnectionError(f"Tracker'dan hata kodu alındı: {response.status}")
+            tracker_response_bytes = await response.read()
+        tracker_data = BDecoder(tracker_response_bytes).decode()
+        if b'failure reason' in tracker_data: raise ConnectionError(tracker_data[b'failure reason'].decode('utf-8', 'replace'))
+        peers_raw = tracker_data.get(b'peers', b''); peers = []
+        if isinstance(peers_raw, bytes): peers = self._parse_compact_peers(peers_raw)
+        elif isinstance(peers_raw, list):
+            for p in peers_raw:
+                if p.get(b'ip') and p.get(b'port'): peers.append((p[b'ip'].decode('utf-8'), p[b'port']))
+        return peers, tracker_data.get(b'interval')
+
+    async def _udp_connection_id(self, protocol: UDPTrackerProtocol, key: tuple) -> int:
+        # connection_id 60 saniye boyunca yeniden kullanılır, her duyuruda connect adımı tekrarlanmaz
+        cached = self._udp_connections.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
         protocol_id = 0x41727101980; action = 0; transaction_id = secrets.randbits(32)
         connect_req_packet = struct.pack('>QII', protocol_id, action, transaction_id)
-        future = loop.create_future()
-        transport, _ = await loop.create_datagram_endpoint(lambda: UDPTrackerProtocol(future), remote_addr=(hostname, port))
-        
-        connection_id = 0
-        try:
-            transport.sendto(connect_req_packet)
-            response_data = await asyncio.wait_for(future, timeout=10)
-            resp_action, resp_tx_id, received_conn_id = struct.unpack('>IIQ', response_data)
-            if resp_action != 0 or resp_tx_id != transaction_id: raise ConnectionError("UDP Tracker'dan geçersiz cevap alındı.")
-            connection_id = received_conn_id
-        finally:
-            transport.close()
-        
-        action = 1; transaction_id = secrets.randbits(32)
-        
-        announce_req_packet = struct.pack('>QII20s20sQQQIIiH',
-            connection_id, action, transaction_id,
-            self.info_hash, self.peer_id,
-            0, self.total_length, 0,
-            0, 0, secrets.randbits(32), -1, 6881
-        )
-
-        future = loop.create_future()
-        transport, _ = await loop.create_datagram_endpoint(lambda: UDPTrackerProtocol(future), remote_addr=(hostname, port))
-        
+        response_data = await protocol.request(connect_req_packet, transaction_id, REQUEST_TIMEOUT)
+        resp_action, resp_tx_id, connection_id = struct.unpack('>IIQ', response_data[:16])
+        if resp_action != 0 or resp_tx_id != transaction_id: raise ConnectionError("UDP Tracker'dan geçersiz cevap alındı.")
+        self._udp_connections[key] = (connection_id, time.monotonic() + UDP_CONNECTION_ID_TTL)
+        return connection_id
+
+    async def _request_peers_from_udp_tracker(self, announce_url: str, event: str = ''):
+        parsed_url = urlparse(announce_url)
+        hostname = parsed_url.hostname
+        port = parsed_url.port or 6969
+        loop = asyncio.get_running_loop()
+        # connect ve announce aynı soket üzerinden yapılır
+        transport, protocol = await loop.create_datagram_endpoint(UDPTrackerProtocol, remote_addr=(hostname, port))
         try:
-            transport.sendto(announce_req_packet)
-            response_data = await asyncio.wait_for(future, timeout=10)
-            resp_action, resp_tx_id, _, _, _ = struct.unpack('>IIIII', response_data[:20])
+            connection_id = await self._udp_connection_id(protocol, (hostname, port))
+            action = 1; transaction_id = secrets.randbits(32)
+            event_id = {'': 0, 'completed': 1, 'started': 2, 'stopped': 3}[event]
+            announce_req_packet = struct.pack('>QII20s20sQQQIIIiH',
+                connection_id, action, transaction_id,
+                self.info_hash, self.peer_id,
+                self.downloaded, self.left, self.uploaded,
+                event_id, 0, secrets.randbits(32), -1, self.port
+            )
+            response_data = await protocol.request(announce_req_packet, transaction_id, REQUEST_TIMEOUT)
+            resp_action, resp_tx_id = struct.unpack('>II', response_data[:8])
+            if resp_action == 3:
+                self._udp_connections.pop((hostname, port), None)
+                raise ConnectionError(response_data[8:].decode('utf-8', 'replace'))
             if resp_action != 1 or resp_tx_id != transaction_id:
                 raise ConnectionError("UDP Tracker'dan geçersiz announce cevabı alındı.")
-            
-            peers_raw = response_data[20:]
-            peers = [(peers_raw[i:i+4], peers_raw[i+4:i+6]) for i in range(0, len(peers_raw), 6)]
-            return peers
+            interval = struct.unpack('>I', response_data[8:12])[0]
+            return self._parse_compact_peers(response_data[20:]), interval
         finally:
-            transport.close()
\ No newline at end of file
+            transport.close()
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import REGISTRY
+
+HASH_WORKERS = min(4, os.cpu_count() or 1) # Paralel SHA-1 hesaplayacak iş parçacığı sayısı
+HASH_QUEUE_DEPTH = 16 # Doğrulama bekleyen en fazla parça sayısı
+
+logger = logging.getLogger(__name__)
+HASH_QUEUE_SECONDS = REGISTRY.histogram('torrent_hash_queue_seconds', "Tamamlanan parçanın hash kuyruğunda bekleme süresi")
+HASH_SECONDS = REGISTRY.histogram('torrent_hash_seconds', "Bir parçanın SHA-1 hesaplama süresi")
+
+def _sha1(data) -> bytes:
+    # hashlib büyük tamponlarda GIL'i bırakır, bu yüzden iş parçacıkları gerçekten paralel çalışır
+    return hashlib.sha1(data).digest()
+
+class PieceVerifier:
+    """Tamamlanan parçaların SHA-1 doğrulamasını olay döngüsü dışında, sınırlı bir kuyrukla yapar.
+
+    Kuyruk derinliği aşıldığında submit bekler; senkron submit_nowait ise parçayı yine kabul eder,
+    çağıran taraf is_full() ile soket okumayı durdurup add_drain_waiter ile yeniden başlatır.
+    """
+
+    def __init__(self, on_result, workers: int = HASH_WORKERS, queue_depth: int = HASH_QUEUE_DEPTH):
+        self.on_result = on_result # on_result(piece_index, hash_dogru_mu) olay döngüsünde çağrılır
+        self.workers = max(1, workers)
+        self.queue_depth = max(1, queue_depth)
+        self._queue = None
+        self._executor = None
+        self._tasks = []
+        self._in_flight = 0 # Kuyrukta veya hesaplanmakta olan parça sayısı
+        self._drain_waiters = set()
+
+    def _start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sha1')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, piece_index: int, data, expected_hash: bytes):
+        """Parçayı doğrulama kuyruğuna ekler; kuyruk doluysa yer açılana kadar bekler (backpressure)."""
+        while self.is_full():
+            drained = asyncio.get_running_loop().create_future()
+            self.add_drain_waiter(lambda: drained.done() or drained.set_result(None))
+            await drained
+        self.submit_nowait(piece_index, data, expected_hash)
+
+    def submit_nowait(self, piece_index: int, data, expected_hash: bytes):
+        if self._queue is None:
+            self._start()
+        self._in_flight += 1
+        self._queue.put_nowait((piece_index, data, expected_hash, time.monotonic()))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def is_full(self) -> bool:
+        return self._in_flight >= self.queue_depth
+
+    def add_drain_waiter(self, callback):
+        self._drain_waiters.add(callback)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            piece_index, data, expected_hash, submitted = await self._queue.get()
+            try:
+                started = time.monotonic()
+                HASH_QUEUE_SECONDS.observe(started - submitted)
+                digest = await loop.run_in_executor(self._executor, _sha1, data)
+                HASH_SECONDS.observe(time.monotonic() - started)
+                self.on_result(piece_index, digest == expected_hash)
+            except Exception:
+                logger.exception("Parça %d doğrulanırken hata", piece_index)
+            finally:
+                # Görev kuyrukta beklerken parça tamponuna referans tutmasın (paylaşımlı bellek kapatılabilsin)
+                data = None
+                self._in_flight -= 1
+                self._queue.task_done()
+                if self._drain_waiters and not self.is_full():
+                    waiters, self._drain_waiters = self._drain_waiters, set()
+                    for callback in waiters:
+                        callback()
+
+    async def close(self):
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        self._queue = None
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from urllib.parse import quote
+import aiohttp
+from metrics import REGISTRY
+
+WEB_SEED_CONNECTIONS = 4 # Her web seed'den aynı anda indirilen parça sayısı (paralel Range isteği)
+WEB_SEED_TIMEOUT = 60 # Tek bir parçanın indirilmesi için tanınan süre (saniye)
+WEB_SEED_IDLE = 5 # İstenecek parça yokken yeniden bakılma aralığı (saniye)
+BASE_RETRY_DELAY = 5 # Başarısız istekten sonra bekleme süresi (saniye); her ardışık hatada iki katına çıkar
+MAX_RETRY_DELAY = 10 * 60
+READ_CHUNK = 2**16
+
+WEB_SEED_BYTES = REGISTRY.counter('torrent_web_seed_bytes_total', "Web seed'lerden (HTTP) alınan parça verisi")
+WEB_SEED_ERRORS = REGISTRY.counter('torrent_web_seed_errors_total', "Başarısız web seed istekleri")
+
+logger = logging.getLogger(__name__)
+
+class WebSeedError(Exception):
+    def __init__(self, message: str, retry_after: int = None):
+        super().__init__(message)
+        self.retry_after = retry_after # Sunucunun istediği bekleme süresi (503 Retry-After)
+
+def parse_url_list(torrent_data: dict) -> list:
+    """Torrent'in url-list alanındaki HTTP(S) adresleri (BEP 19); alan tek bir dize ya da liste olabilir."""
+    value = torrent_data.get(b'url-list', [])
+    if isinstance(value, bytes):
+        value = [value]
+    urls = []
+    for url in value if isinstance(value, list) else []:
+        if isinstance(url, bytes) and url.startswith((b'http://', b'https://')):
+            urls.append(url.decode('utf-8', 'replace'))
+    return urls
+
+class WebSeed:
+    """Tek bir HTTP aynası; parçalar dosya sınırlarına göre Range isteklerine bölünerek bütün halinde indirilir.
+
+    Parça seçicinin gözünde her parçası olan bir peer'dir ((url, 0) anahtarıyla). Gelen veri peer'lerden
+    gelen bloklarla aynı yoldan (block_received, hash doğrulaması, bozuk veride yasaklama) geçer.
+    """
+
+    def __init__(self, url: str, piece_manager, session: aiohttp.ClientSession, download_limiter=None,
+                 connections: int = WEB_SEED_CONNECTIONS):
+        self.url = url
+        self.key = (url, 0)
+        self.piece_manager = piece_manager
+        self.session = session
+        self.download_limiter = download_limiter
+        self.connections = connections
+        self.downloaded = 0
+        self.failures = 0 # Ardışık başarısız istek sayısı
+        self._retry_at = 0.0
+        self._file_urls = self._build_file_urls(url, piece_manager.torrent_data[b'info'])
+        self._tasks = []
+
+    @staticmethod
+    def _build_file_urls(url: str, info: dict) -> list:
+        # BEP 19: '/' ile biten adrese torrent adı eklenir; çok dosyalı torrent'lerde dosya yolu onun altındadır
+        name = quote(info[b'name'])
+        if b'files' not in info:
+            return [url + name if url.endswith('/') else url]
+        base = url if url.endswith('/') else url + '/'
+        return [base + name + '/' + '/'.join(quote(part) for part in file[b'path']) for file in info[b'files']]
+
+    def start(self):
+        self.piece_manager.add_peer_have_all(self.key)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.connections)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.piece_manager.remove_peer(self.key)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        piece_manager = self.piece_manager
+        while not piece_manager.is_complete() and self.key not in piece_manager.banned_peers:
+            if loop.time() < self._retry_at:
+                await asyncio.sleep(self._retry_at - loop.time())
+                continue
+            if piece_manager.is_backlogged():
+                await self._wait(piece_manager.add_backlog_waiter)
+                continue
+            blocks = piece_manager.get_next_piece(self.key)
+            if not blocks:
+                await self._wait(piece_manager.add_request_waiter)
+                continue
+            try:
+                await asyncio.wait_for(self._fetch(blocks), WEB_SEED_TIMEOUT)
+                self.failures = 0
+            except (aiohttp.ClientError, asyncio.TimeoutError, WebSeedError) as e:
+                for block in blocks:
+                    piece_manager.release_request(self.key, block.piece, block.offset)
+                self._failed(e)
+        if self.key in piece_manager.banned_peers and self.key in piece_manager.peer_bitfields:
+            logger.warning("Web seed %s bozuk veri gönderdi, kullanılmayacak.", self.url)
+            piece_manager.remove_peer(self.key)
+
+    async def _wait(self, register):
+        # Bekleme kaydı tetiklenene ya da WEB_SEED_IDLE dolana kadar bekle
+        woken = asyncio.Event()
+        register(woken.set)
+        try:
+            await asyncio.wait_for(woken.wait(), WEB_SEED_IDLE)
+        except asyncio.TimeoutError:
+            pass
+
+    def _failed(self, error):
+        WEB_SEED_ERRORS.inc()
+        if asyncio.get_running_loop().time() < self._retry_at:
+            # Aynı anda yoldaki diğer isteklerin hatası: bekleme süresi bir kez uzatılır
+            return
+        delay = min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** self.failures)
+        if getattr(error, 'retry_after', None):
+            delay = max(delay, error.retry_after)
+        self.failures += 1
+        # Diğer yuvalar da aynı aynaya bu süre boyunca istek göndermez
+        self._retry_at = max(self._retry_at, asyncio.get_running_loop().time() + delay)
+        logger.warning("Web seed %s isteği başarısız (%s), %d sn sonra yeniden denenecek.", self.url, str(error) or type(error).__name__, delay)
+
+    async def _fetch(self, blocks):
+        # Bloklar aynı parçanın ardışık bloklarıdır; tek bir torrent aralığı olarak indirilir
+        piece_manager = self.piece_manager
+        index = blocks[0].piece
+        start = blocks[0].offset
+        length = blocks[-1].offset + blocks[-1].length - start
+        data = bytearray(length)
+        view = memoryview(data)
+        position = 0
+        offset = index * piece_manager.storage.piece_length + start
+        for file_index, file_offset, chunk in piece_manager.storage.map_range(offset, length):
+            await self._fetch_range(self._file_urls[file_index], file_offset, view[position:position + chunk],
+                                    piece_manager.storage.files[file_index][1])
+            position += chunk
+        self.downloaded += length
+        WEB_SEED_BYTES.inc(length)
+        if self.key in piece_manager.banned_peers:
+            return
+        for block in blocks:
+            relative = block.offset - start
+            piece_manager.block_received(index, block.offset, view[relative:relative + block.length], peer=self.key)
+
+    async def _fetch_range(self, url: str, offset: int, target: memoryview, file_length: int):
+        length = len(target)
+        headers = {'Range': f'bytes={offset}-{offset + length - 1}', 'Accept-Encoding': 'identity'}
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 503:
+                retry_after = response.headers.get('Retry-After', '')
+                raise WebSeedError("HTTP 503", int(retry_after) if retry_after.isdigit() else None)
+            # Range'i yok sayan sunucu yalnızca dosyanın tamamı istendiyse kabul edilir
+            if response.status != 206 and not (response.status == 200 and offset == 0 and length == file_length):
+                raise WebSeedError(f"HTTP {response.status}")
+            received = 0
+            async for chunk in response.content.iter_chunked(READ_CHUNK):
+                if received + len(chunk) > length:
+                    raise WebSeedError("Beklenenden uzun cevap")
+                target[received:received + len(chunk)] = chunk
+                received += len(chunk)
+                if self.download_limiter is not None:
+                    self.download_limiter.consume(len(chunk))
+                    delay = self.download_limiter.delay()
+                    if delay:
+                        await asyncio.sleep(delay)
+            if received != length:
+                raise WebSeedError("Eksik cevap")
+
+class WebSeeds:
+    """Torrent'in tüm web seed'leri; hepsi keep-alive bağlantılı tek bir aiohttp havuzunu paylaşır."""
+
+    def __init__(self, urls: list, piece_manager, download_limiter=None, connections: int = WEB_SEED_CONNECTIONS):
+        self.urls = urls
+        self.piece_manager = piece_manager
+        self.download_limiter = download_limiter
+        self.connections = connections
+        self.seeds = []
+        self._session = None
+
+    def __contains__(self, key) -> bool:
+        return any(seed.key == key for seed in self.seeds)
+
+    @property
+    def downloaded(self) -> int:
+        return sum(seed.downloaded for seed in self.seeds)
+
+    def start(self):
+        if self._session is not None:
+            return
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=WEB_SEED_TIMEOUT, sock_read=WEB_SEED_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=self.connections * len(self.urls), limit_per_host=self.connections),
+            auto_decompress=False
+        )
+        self.seeds = [WebSeed(url, self.piece_manager, self._session, self.download_limiter, self.connections)
+                      for url in self.urls]
+        for seed in self.seeds:
+            seed.start()
+        logger.info("%d web seed'den indiriliyor.", len(self.seeds))
+
+    async def close(self):
+        for seed in self.seeds:
+            await seed.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
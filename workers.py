@@ -0,0 +1,537 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import pickle
+import socket
+import struct
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from choker import Choker
+from peer import PeerConnection
+from peer_manager import PeerManager
+from rate_limiter import TokenBucket
+from read_cache import ReadCache
+from storage import Storage
+
+WANT_BATCH = 32 # Worker'ın bir peer için koordinatörden tek seferde istediği blok sayısı
+STALE_ASSIGNMENT = 5 # Bu kadar saniye kullanılmayan blok atamaları (ör. choke edilen peer) koordinatöre geri verilir
+STATS_INTERVAL = 2 # Worker'ların gönderim istatistiklerini bildirme aralığı (saniye)
+WORKER_JOIN_TIMEOUT = 5 # Kapanışta worker süreçlerinin kendiliğinden çıkması için beklenen süre
+
+_LENGTH = struct.Struct('>I')
+
+logger = logging.getLogger(__name__)
+
+class _Channel:
+    """İki süreç arasında uzunluk önekli pickle çerçeveleri; aynı döngü turunda gönderilen mesajlar tek çerçevede gider."""
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self._outgoing = []
+        self._flush_scheduled = False
+
+    def attach(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        if self._outgoing:
+            self._flush()
+
+    def send(self, *message):
+        self._outgoing.append(message)
+        if self.writer is not None and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self.writer.is_closing():
+            self._outgoing.clear()
+            return
+        data = pickle.dumps(self._outgoing, pickle.HIGHEST_PROTOCOL)
+        self._outgoing = []
+        self.writer.write(_LENGTH.pack(len(data)) + data)
+
+    async def receive(self) -> list:
+        """Sıradaki mesaj grubunu döndürür; karşı taraf kapandıysa None."""
+        try:
+            length = _LENGTH.unpack(await self.reader.readexactly(_LENGTH.size))[0]
+            return pickle.loads(await self.reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class _Worker:
+    def __init__(self, index: int, process, channel: _Channel):
+        self.index = index
+        self.process = process
+        self.channel = channel
+        self.uploaded = 0
+        self.active = 0
+
+class WorkerPool:
+    """Peer bağlantılarını, her biri kendi olay döngüsünde çalışan worker süreçlerine dağıtır.
+
+    Parça seçici (PieceManager), doğrulama ve disk yazımı bu süreçte kalır; worker'lar her peer için
+    blok atamalarını mesajla ister. Blok verisi paylaşımlı bellekteki parça tamponuna doğrudan yazılır,
+    koordinatöre yalnızca bloğun geldiği bildirilir. PeerManager'ın istemci tarafından kullanılan
+    arayüzünü sunar.
+    """
+
+    def __init__(self, piece_manager, workers: int, torrent_data, info_hash: bytes, peer_id: bytes, target_peers: int):
+        self.piece_manager = piece_manager
+        self.num_workers = workers
+        self.torrent_data = torrent_data
+        self.info_hash = info_hash
+        self.peer_id = peer_id
+        self.target_peers = target_peers
+        self.connections = {} # Bağlantılar worker'larda; bu süreçte hiç PeerConnection yok
+        self.budget = None
+        self._workers = []
+        self._owners = {} # (ip, port) -> peer'i yöneten worker
+        self._wants = {} # (ip, port) -> (worker, istenen blok sayısı); henüz karşılanmamış blok istekleri
+        self._want_callbacks = {}
+        self._backlogged = False
+        self._tasks = []
+        # Koordinatör bir bloğun kopyasını ikinci bir worker'a verirse, ilk worker iptali almadan önce
+        # veriyi yeniden kullanılan bir tampona yazabilir; bu yüzden endgame kopya istekleri kapalıdır
+        self.piece_manager.duplicate_requests = False
+
+    @property
+    def uploaded(self) -> int:
+        return sum(worker.uploaded for worker in self._workers)
+
+    @property
+    def active_count(self) -> int:
+        return sum(worker.active for worker in self._workers)
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        pool = self.piece_manager.buffer_pool
+        written = sorted(self.piece_manager.storage.written_pieces)
+        target_peers = max(1, self.target_peers // self.num_workers)
+        for index in range(self.num_workers):
+            parent_socket, child_socket = socket.socketpair()
+            process = context.Process(
+                target=_worker_main, name=f'torrent-worker-{index}', daemon=True,
+                args=(child_socket, self.torrent_data, self.info_hash, self.peer_id, pool.name, pool.buffer_size,
+                      target_peers, written, self.piece_manager.is_complete(), logging.getLogger().level),
+            )
+            process.start()
+            child_socket.close()
+            worker = _Worker(index, process, _Channel())
+            self._workers.append(worker)
+            self._tasks.append(asyncio.create_task(self._serve_worker(worker, parent_socket)))
+        logger.info("%d worker süreci başlatıldı.", self.num_workers)
+
+    async def _serve_worker(self, worker: _Worker, sock):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        worker.channel.attach(reader, writer)
+        while True:
+            messages = await worker.channel.receive()
+            if messages is None:
+                break
+            for message in messages:
+                self._handle(worker, message)
+            if not self._backlogged and self.piece_manager.is_backlogged():
+                # Doğrulama kuyruğu doldu: tüm worker'lar soket okumayı duraklatsın
+                self._backlogged = True
+                self._broadcast('backlog', True)
+                self.piece_manager.add_backlog_waiter(self._backlog_drained)
+        if worker.process.is_alive():
+            logger.warning("Worker %d ile bağlantı koptu.", worker.index)
+
+    def _handle(self, worker: _Worker, message: tuple):
+        kind = message[0]
+        pm = self.piece_manager
+        if kind == 'got':
+            _, peer, piece_index, offset, data = message
+            pm.block_received(piece_index, offset, data, peer=peer)
+        elif kind == 'want':
+            _, peer, count = message
+            self._wants[peer] = (worker, count)
+            self._serve_want(peer)
+        elif kind == 'release':
+            _, peer, piece_index, offset = message
+            pm.release_request(peer, piece_index, offset)
+        elif kind == 'bitfield':
+            pm.add_peer_bitfield(message[1], message[2])
+            self._serve_want(message[1])
+        elif kind == 'have':
+            pm.add_peer_piece(message[1], message[2])
+            self._serve_want(message[1])
+        elif kind == 'gone':
+            peer = message[1]
+            pm.remove_peer(peer)
+            self._wants.pop(peer, None)
+            self._want_callbacks.pop(peer, None)
+        elif kind == 'stats':
+            _, worker.uploaded, worker.active = message
+        elif kind == 'peers':
+            self.add_candidates(message[1])
+
+    def _serve_want(self, peer):
+        want = self._wants.get(peer)
+        if want is None:
+            return
+        worker, count = want
+        if peer not in self.piece_manager.peer_bitfields:
+            # Peer kopmuş; 'gone' mesajı yoldadır
+            del self._wants[peer]
+            return
+        blocks = []
+        while len(blocks) < count:
+            block = self.piece_manager.get_next_request(peer=peer)
+            if block is None:
+                break
+            piece = self.piece_manager.pieces[block.piece]
+            blocks.append((block, self.piece_manager.buffer_pool.slot_of(piece.buffer)))
+        if blocks:
+            del self._wants[peer]
+            worker.channel.send('blocks', peer, blocks)
+        else:
+            # Şu an verilecek blok yok: blok ya da tampon boşalınca yeniden denenir
+            callback = self._want_callbacks.get(peer)
+            if callback is None:
+                callback = self._want_callbacks[peer] = functools.partial(self._serve_want, peer)
+            self.piece_manager.add_request_waiter(callback)
+
+    def _backlog_drained(self):
+        self._backlogged = False
+        self._broadcast('backlog', False)
+
+    def _broadcast(self, *message):
+        for worker in self._workers:
+            worker.channel.send(*message)
+
+    def add_candidates(self, peers):
+        assigned = {}
+        for address in peers:
+            if address not in self._owners:
+                # Adaylar worker'lara sırayla dağıtılır
+                worker = self._owners[address] = self._workers[len(self._owners) % len(self._workers)]
+                assigned.setdefault(worker, []).append(address)
+        for worker, addresses in assigned.items():
+            worker.channel.send('peers', addresses)
+
+    def delivering_peers(self) -> dict:
+        # Peer istatistikleri worker'larda kalır; önbelleğe yalnızca tracker sağlığı yazılır
+        return {}
+
+    def unreachable_peers(self) -> list:
+        return []
+
+    def add_inbound(self, ip: str, port: int, protocol, reserved: bytes = bytes(8), peer_id: bytes = None) -> bool:
+        # Gelen bağlantılar worker süreçlerine aktarılamaz
+        return False
+
+    def ban(self, address: tuple):
+        worker = self._owners.get(address)
+        if worker is not None:
+            worker.channel.send('ban', address)
+
+    def broadcast_have(self, index: int):
+        self._broadcast('have', index)
+
+    def lose_interest(self):
+        self._broadcast('complete')
+
+    def set_rate_limits(self, upload_rate, download_rate, peer_upload_rate, peer_download_rate):
+        # Torrent sınırı worker'lar arasında eşit bölünür
+        share = lambda rate: rate / self.num_workers if rate else rate
+        self._broadcast('limits', share(upload_rate), share(download_rate), peer_upload_rate, peer_download_rate)
+
+    async def close(self):
+        for worker in self._workers:
+            worker.channel.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.process.join, WORKER_JOIN_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+class RemotePieceManager:
+    """Worker sürecinde PeerConnection'lara PieceManager arayüzünü sunar.
+
+    Blok seçimi koordinatördedir: her peer için birkaç blokluk atama önceden istenir ve yerel bir
+    kuyrukta tutulur. Atanan blok paylaşımlı bellekteki parça tamponunun ilgili dilimine doğrudan alınır.
+    Seed edilen bloklar worker'ın kendi disk okuma önbelleğinden gönderilir.
+    """
+
+    def __init__(self, channel: _Channel, torrent_data, buffers: memoryview, buffer_size: int, written, complete: bool):
+        info = torrent_data[b'info']
+        self.channel = channel
+        self.num_pieces = len(info[b'pieces']) // 20
+        self.piece_length = info[b'piece length']
+        self._buffers = buffers
+        self._buffer_size = buffer_size
+        self.written = bytearray(self.num_pieces)
+        for index in written:
+            self.written[index] = 1
+        self.written_count = len(written)
+        self.complete = complete
+        self.peer_bitfields = {}
+        self._assigned = {} # peer -> deque[(Block, tampon dilimi)]; henüz istenmemiş atamalar
+        self._taken_at = {} # peer -> atama kuyruğundan son blok alınma zamanı
+        self._wanting = set() # Koordinatörden blok beklenen peer'ler
+        self._slots = {} # (piece, offset) -> (tampon dilimi, istenen uzunluk); istenmiş ve gelmesi beklenen bloklar
+        self._pending = {} # peer -> {(piece, offset)}
+        self._request_waiters = set()
+        self._backlog_waiters = []
+        self.backlogged = False
+        self.storage = Storage(info)
+        self.read_cache = ReadCache(self.storage)
+
+    # --- Koordinatörden gelen mesajlar ---
+
+    def assign(self, peer, blocks: list):
+        self._wanting.discard(peer)
+        if peer not in self.peer_bitfields:
+            # Peer bu arada koptu; koordinatör blokları 'gone' ile zaten geri aldı
+            return
+        self._assigned.setdefault(peer, deque()).extend(blocks)
+        self._taken_at.setdefault(peer, time.monotonic())
+        waiters, self._request_waiters = self._request_waiters, set()
+        for callback in waiters:
+            callback()
+
+    def mark_written(self, index: int):
+        if not self.written[index]:
+            self.written[index] = 1
+            self.written_count += 1
+
+    def set_backlogged(self, backlogged: bool):
+        self.backlogged = backlogged
+        if not backlogged:
+            waiters, self._backlog_waiters = self._backlog_waiters, []
+            for callback in waiters:
+                callback()
+
+    def release_stale_assignments(self):
+        now = time.monotonic()
+        for peer, queue in self._assigned.items():
+            if queue and now - self._taken_at.get(peer, now) > STALE_ASSIGNMENT:
+                for block, _ in queue:
+                    self.channel.send('release', peer, block.piece, block.offset)
+                queue.clear()
+
+    # --- PeerConnection'ın kullandığı PieceManager arayüzü ---
+
+    def add_peer_bitfield(self, peer, bitfield: bytes):
+        have = self.peer_bitfields.setdefault(peer, bytearray(self.num_pieces))
+        for index in range(self.num_pieces):
+            if bitfield[index >> 3] & (0x80 >> (index & 7)):
+                have[index] = 1
+        self.channel.send('bitfield', peer, bytes(bitfield))
+
+    def add_peer_have_all(self, peer):
+        self.add_peer_bitfield(peer, b'\xff' * ((self.num_pieces + 7) // 8))
+
+    def add_peer_piece(self, peer, index):
+        have = self.peer_bitfields.setdefault(peer, bytearray(self.num_pieces))
+        if 0 <= index < self.num_pieces:
+            have[index] = 1
+        self.channel.send('have', peer, index)
+
+    def set_cancel_handler(self, peer, callback):
+        # Koordinatör kopya istek vermediği için iptal edilecek istek de olmaz
+        pass
+
+    def remove_peer(self, peer):
+        if peer not in self.peer_bitfields and peer not in self._pending:
+            return
+        self.peer_bitfields.pop(peer, None)
+        self._assigned.pop(peer, None)
+        self._taken_at.pop(peer, None)
+        self._wanting.discard(peer)
+        for key in self._pending.pop(peer, ()):
+            self._slots.pop(key, None)
+        self.channel.send('gone', peer)
+
+    def get_next_request(self, peer, allowed=None):
+        if allowed is not None:
+            # Atamalar koordinatörde parça kısıtı olmadan yapılır; choke altında Allowed Fast isteği gönderilmez
+            return None
+        queue = self._assigned.get(peer)
+        if queue:
+            block, slot = queue.popleft()
+            key = (block.piece, block.offset)
+            self._slots[key] = (slot, block.length)
+            self._pending.setdefault(peer, set()).add(key)
+            self._taken_at[peer] = time.monotonic()
+            if len(queue) < WANT_BATCH // 2:
+                self._want(peer)
+            return block
+        self._want(peer)
+        return None
+
+    def _want(self, peer):
+        if peer not in self._wanting and peer in self.peer_bitfields:
+            self._wanting.add(peer)
+            self.channel.send('want', peer, WANT_BATCH)
+
+    def add_request_waiter(self, callback):
+        self._request_waiters.add(callback)
+
+    def release_request(self, peer, piece_index, offset):
+        key = (piece_index, offset)
+        self._slots.pop(key, None)
+        self._pending.get(peer, set()).discard(key)
+        self.channel.send('release', peer, piece_index, offset)
+
+    def block_target(self, piece_index, offset, length):
+        entry = self._slots.get((piece_index, offset))
+        # İstenenden farklı boyutta gelen blok tampona alınmaz; komşu blokların ve sonraki dilimin üzerine yazabilir
+        if entry is None or entry[1] != length or offset + length > self._buffer_size:
+            return None
+        start = entry[0] * self._buffer_size + offset
+        return self._buffers[start:start + length]
+
+    def block_received(self, piece_index, offset, data, peer=None):
+        key = (piece_index, offset)
+        self._slots.pop(key, None)
+        self._pending.get(peer, set()).discard(key)
+        # Veri tampona doğrudan yazılamadıysa (ör. beklenmeyen boyut) koordinatöre kopyası gider
+        self.channel.send('got', peer, piece_index, offset, None if data is None else bytes(data))
+
+    def is_backlogged(self):
+        return self.backlogged
+
+    def add_backlog_waiter(self, callback):
+        self._backlog_waiters.append(callback)
+
+    def is_complete(self):
+        return self.complete
+
+    def has_piece(self, index):
+        return 0 <= index < self.num_pieces and bool(self.written[index])
+
+    def has_all(self):
+        return self.written_count == self.num_pieces
+
+    def bitfield(self):
+        if not self.written_count:
+            return None
+        bitfield = bytearray((self.num_pieces + 7) // 8)
+        for index in range(self.num_pieces):
+            if self.written[index]:
+                bitfield[index >> 3] |= 0x80 >> (index & 7)
+        return bytes(bitfield)
+
+    async def read_block(self, index, offset, length):
+        piece_size = min(self.piece_length, self.storage.total_length - index * self.piece_length)
+        if not self.has_piece(index) or offset < 0 or offset + length > piece_size:
+            return None
+        try:
+            return await self.read_cache.read_block(index, offset, length)
+        except OSError as e:
+            logger.error("Parça %d diskten okunamadı: %s", index, e)
+            return None
+
+class _WorkerEngine:
+    """Worker sürecinde kendi PeerManager ve Choker'ı ile peer bağlantılarını çalıştırır."""
+
+    def __init__(self, sock, torrent_data, info_hash, peer_id, shm_name, buffer_size, target_peers, written, complete):
+        self.sock = sock
+        self.torrent_data = torrent_data
+        self.info_hash = info_hash
+        self.peer_id = peer_id
+        self.shm_name = shm_name
+        self.buffer_size = buffer_size
+        self.target_peers = target_peers
+        self.written = written
+        self.complete = complete
+        self.upload_limiter = TokenBucket()
+        self.download_limiter = TokenBucket()
+        self.peer_upload_rate = 0
+        self.peer_download_rate = 0
+
+    async def run(self):
+        memory = shared_memory.SharedMemory(name=self.shm_name)
+        channel = _Channel()
+        reader, writer = await asyncio.open_connection(sock=self.sock)
+        channel.attach(reader, writer)
+        self.pieces = RemotePieceManager(channel, self.torrent_data, memory.buf, self.buffer_size, self.written, self.complete)
+        await self.pieces.storage.open()
+        self.peer_manager = PeerManager(self._make_connection, target_peers=self.target_peers,
+                                        torrent_name=self.torrent_data[b'info'][b'name'].decode('utf-8'))
+        # PEX ile öğrenilen peer'ler, worker'lar arasında tekilleştirilip dağıtılsın diye koordinatöre gider
+        self.peer_manager.on_peers = lambda peers: channel.send('peers', peers)
+        self.choker = Choker(self.peer_manager, self.pieces)
+        self.peer_manager.start()
+        self.choker.start()
+        stats_task = asyncio.create_task(self._stats_loop(channel))
+        try:
+            while True:
+                messages = await channel.receive()
+                if messages is None:
+                    break
+                for message in messages:
+                    self._handle(message)
+        finally:
+            stats_task.cancel()
+            await self.choker.close()
+            await self.peer_manager.close()
+            await self.pieces.storage.close()
+            channel.close()
+            self.pieces = None
+            try:
+                memory.close()
+            except BufferError:
+                pass # Bölgeye ait bir dilim hâlâ tutuluyor; süreç çıkarken zaten serbest kalır
+
+    def _handle(self, message: tuple):
+        kind = message[0]
+        if kind == 'blocks':
+            self.pieces.assign(message[1], message[2])
+        elif kind == 'peers':
+            self.peer_manager.add_candidates(message[1])
+        elif kind == 'have':
+            self.pieces.mark_written(message[1])
+            self.peer_manager.broadcast_have(message[1])
+        elif kind == 'backlog':
+            self.pieces.set_backlogged(message[1])
+        elif kind == 'ban':
+            self.peer_manager.ban(message[1])
+        elif kind == 'complete':
+            self.pieces.complete = True
+            self.peer_manager.lose_interest()
+        elif kind == 'limits':
+            _, upload_rate, download_rate, self.peer_upload_rate, self.peer_download_rate = message
+            self.upload_limiter.set_rate(upload_rate)
+            self.download_limiter.set_rate(download_rate)
+            for connection in self.peer_manager.connections.values():
+                connection.upload_limiter.set_rate(self.peer_upload_rate)
+                connection.download_limiter.set_rate(self.peer_download_rate)
+
+    async def _stats_loop(self, channel: _Channel):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self.pieces.release_stale_assignments()
+            channel.send('stats', self.peer_manager.uploaded, self.peer_manager.active_count)
+
+    def _make_connection(self, peer_ip: str, peer_port: int) -> PeerConnection:
+        return PeerConnection(
+            ip=peer_ip, port=peer_port,
+            info_hash=self.info_hash,
+            peer_id=self.peer_id,
+            piece_manager=self.pieces,
+            upload_limiter=TokenBucket(self.peer_upload_rate, parent=self.upload_limiter),
+            download_limiter=TokenBucket(self.peer_download_rate, parent=self.download_limiter)
+        )
+
+def _worker_main(sock, torrent_data, info_hash, peer_id, shm_name, buffer_size, target_peers, written, complete, log_level):
+    logging.basicConfig(level=log_level, format='%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s')
+    engine = _WorkerEngine(sock, torrent_data, info_hash, peer_id, shm_name, buffer_size, target_peers, written, complete)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        pass